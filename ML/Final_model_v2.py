@@ -88,6 +88,7 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 
 # Import core pipeline logic from our module
+from pipeline_common import feature_group_index
 from training_logic_v2 import (
     PipelineConfig,
     CFG,
@@ -97,7 +98,6 @@ from training_logic_v2 import (
     get_location_details,
     safe_filename,
     compute_lag_features_from_history,
-    _load_hybrid_models,
     _prophet_predict,
     _silence_logs,
     WEATHER_COLS,
@@ -114,6 +114,7 @@ logger.info("Libraries loaded successfully.")
 _model_cache = {}
 _geocode_cache = {}
 _forecast_cache = {}
+_explainer_cache = {}
 
 
 def _load_cached(filepath):
@@ -128,6 +129,51 @@ def clear_model_cache():
     _model_cache.clear()
     _geocode_cache.clear()
     _forecast_cache.clear()
+    _explainer_cache.clear()
+
+
+def _get_explainer_cached(tree_path):
+    """One SHAP TreeExplainer per cached tree model file (None if SHAP is unavailable)."""
+    if tree_path not in _explainer_cache:
+        try:
+            _explainer_cache[tree_path] = shap.TreeExplainer(_load_cached(tree_path))
+        except Exception:
+            _explainer_cache[tree_path] = None
+    return _explainer_cache[tree_path]
+
+
+def _explain_horizon(shap_explainer, X_all: pd.DataFrame, prophet_yhats: list, config: PipelineConfig) -> list:
+    """
+    Grouped SHAP explanations for every forecast day from ONE batched
+    shap_values call over the whole horizon matrix.
+    """
+    default = [
+        {"ProphetTrend": round(p, 2), "Seasonality": 0.0, "Holiday": 0.0,
+         "Weather": 0.0, "Lags/Trend": 0.0, "ResidualBase": 0.0}
+        for p in prophet_yhats
+    ]
+    if shap_explainer is None:
+        return default
+    try:
+        sv = np.asarray(shap_explainer.shap_values(X_all), dtype=float)
+        base_val = float(np.ravel(shap_explainer.expected_value)[0])
+    except Exception:
+        return default
+
+    groups = feature_group_index(list(X_all.columns), config.feature_groups)
+    sums = {g: sv[:, idx].sum(axis=1) for g, idx in groups.items()}
+    zeros = np.zeros(len(X_all))
+    return [
+        {
+            "ProphetTrend": round(prophet_yhats[i], 2),
+            "Seasonality": round(float(sums.get("Seasonality", zeros)[i]), 2),
+            "Holiday": round(float(sums.get("Holiday", zeros)[i]), 2),
+            "Weather": round(float(sums.get("Weather", zeros)[i]), 2),
+            "Lags/Trend": round(float(sums.get("Lags/Trend", zeros)[i]), 2),
+            "ResidualBase": round(base_val, 2),
+        }
+        for i in range(len(X_all))
+    ]
 
 
 def _get_location_cached(address):
@@ -194,6 +240,25 @@ def _get_forecast_cached(lat, lon):
     return _forecast_cache[key]
 
 
+def _forecast_entry(dt: pd.Timestamp, yhat: float, dish_mae: float) -> dict:
+    """One forecast day as {date, qty, lower, upper}, with +/- MAE bounds."""
+    qty = int(round(yhat))
+
+    if dish_mae > 0:
+        pred_lower = int(max(0, yhat - dish_mae))
+        pred_upper = int(yhat + dish_mae)
+    else:
+        pred_lower = qty
+        pred_upper = qty
+
+    return {
+        "date": dt.strftime('%Y-%m-%d'),
+        "qty": qty,
+        "lower": pred_lower,
+        "upper": pred_upper,
+    }
+
+
 def _predict_hybrid_multiday(
     prophet_model,
     tree_model,
@@ -202,7 +267,9 @@ def _predict_hybrid_multiday(
     recent_sales_df: pd.DataFrame,
     config: PipelineConfig,
     country_code: str,
-    dish_mae: float
+    dish_mae: float,
+    shap_explainer=None,
+    direct_horizon=None,
 ) -> list:
     """
     Recursive multi-day forecast using Prophet + Tree hybrid model.
@@ -212,27 +279,22 @@ def _predict_hybrid_multiday(
     2. Predict residual using tree model
     3. Combine: final_pred = prophet_yhat + tree_resid
 
-    Returns list of {date, qty, lower, upper, explanation} dicts.
+    Dishes trained in direct mode (direct_horizon set) keep the lags of the
+    forecast origin, add the horizon step as a feature and predict every
+    residual in one batched call instead of recursing.
+
+    Returns list of {date, qty, lower, upper} dicts. When a SHAP explainer
+    is passed, each dict also gets a grouped "explanation", computed for the
+    whole horizon in one batched call after the recursion.
     """
     results = []
     sales_history = recent_sales_df['sales'].values.tolist()
-
-    # Build feature name -> group mapping from config
-    feat_to_group = {}
-    for group_name, feat_list in config.feature_groups.items():
-        for feat in feat_list:
-            feat_to_group[feat] = group_name
+    feature_rows = []
+    prophet_yhats = []
+    feature_cols = config.hybrid_tree_features + (["horizon"] if direct_horizon else [])
 
     local_hols = holidays.country_holidays(country_code, years=config.holiday_years)
 
-    # Instantiate SHAP explainer ONCE before the loop for efficiency
-    shap_explainer = None
-    if shap is not None:
-        try:
-            shap_explainer = shap.TreeExplainer(tree_model)
-        except Exception:
-            shap_explainer = None
-
     for day_offset in range(config.forecast_horizon):
         dt = start_date + pd.Timedelta(days=day_offset)
         is_hol = 1 if dt in local_hols else 0
@@ -269,77 +331,50 @@ def _predict_hybrid_multiday(
         }
         row.update(weather_vals)
         row.update(lag_feats)
+        if direct_horizon:
+            row["horizon"] = min(day_offset + 1, direct_horizon)
 
         # Create feature DataFrame with correct column order
-        X_one = pd.DataFrame([{k: row.get(k, 0.0) for k in config.hybrid_tree_features}])
+        feature_row = {k: row.get(k, 0.0) for k in feature_cols}
+        X_one = pd.DataFrame([feature_row])
+        feature_rows.append(feature_row)
+        prophet_yhats.append(prophet_yhat)
+
+        if direct_horizon:
+            continue  # residuals for the whole horizon are predicted in one call below
 
         # Predict residual with tree model
         resid_hat = float(tree_model.predict(X_one)[0])
 
         # Final prediction = Prophet trend + Tree residual
         yhat = max(0.0, prophet_yhat + resid_hat)
-        qty = int(round(yhat))
-
-        if dish_mae > 0:
-            pred_lower = int(max(0, yhat - dish_mae))
-            pred_upper = int(yhat + dish_mae)
-        else:
-            pred_lower = qty
-            pred_upper = qty
-
-        # SHAP explanation with grouped features (using pre-instantiated explainer)
-        expl = None
-        if shap_explainer is not None:
-            try:
-                sv = shap_explainer.shap_values(X_one)[0]
-                base_val = float(shap_explainer.expected_value)
-
-                group_shap = {}
-                for i, feat_name in enumerate(config.hybrid_tree_features):
-                    group = feat_to_group.get(feat_name, "Other")
-                    group_shap[group] = group_shap.get(group, 0.0) + float(sv[i])
-
-                expl = {
-                    "ProphetTrend": round(prophet_yhat, 2),
-                    "Seasonality": round(group_shap.get("Seasonality", 0.0), 2),
-                    "Holiday": round(group_shap.get("Holiday", 0.0), 2),
-                    "Weather": round(group_shap.get("Weather", 0.0), 2),
-                    "Lags/Trend": round(group_shap.get("Lags/Trend", 0.0), 2),
-                    "ResidualBase": round(base_val, 2),
-                }
-            except Exception:
-                pass  # expl remains None, will be set to default below
-
-        if expl is None:
-            expl = {
-                "ProphetTrend": round(prophet_yhat, 2),
-                "Seasonality": 0.0,
-                "Holiday": 0.0,
-                "Weather": 0.0,
-                "Lags/Trend": 0.0,
-                "ResidualBase": 0.0,
-            }
-
-        results.append({
-            "date": dt.strftime('%Y-%m-%d'),
-            "qty": qty,
-            "lower": pred_lower,
-            "upper": pred_upper,
-            "explanation": expl
-        })
+        results.append(_forecast_entry(dt, yhat, dish_mae))
 
         # Append prediction to history for next iteration
         sales_history.append(yhat)
 
+    if direct_horizon:
+        resid_hats = tree_model.predict(pd.DataFrame(feature_rows, columns=feature_cols))
+        for day_offset, (prophet_yhat, resid_hat) in enumerate(zip(prophet_yhats, resid_hats)):
+            dt = start_date + pd.Timedelta(days=day_offset)
+            results.append(_forecast_entry(dt, max(0.0, prophet_yhat + float(resid_hat)), dish_mae))
+
+    if shap_explainer is not None:
+        X_all = pd.DataFrame(feature_rows, columns=feature_cols)
+        for entry, expl in zip(results, _explain_horizon(shap_explainer, X_all, prophet_yhats, config)):
+            entry["explanation"] = expl
+
     return results
 
 
-def get_prediction(dish: str, date_str: str, address: str, model: str = 'auto', config: PipelineConfig = CFG):
+def get_prediction(dish: str, date_str: str, address: str, model: str = 'auto', config: PipelineConfig = CFG,
+                   explain: bool = False):
     """
     Multi-day prediction API using hybrid Prophet + Tree model.
 
     Returns a list of dicts (one per forecast day, up to config.forecast_horizon days).
-    Each dict contains: Dish, Date, Model Used, Prediction, Prediction_Lower, Prediction_Upper, Explanation
+    Each dict contains: Dish, Date, Model Used, Prediction, Prediction_Lower, Prediction_Upper,
+    plus a grouped SHAP Explanation when explain=True (skipped otherwise).
     """
     dt = pd.to_datetime(date_str)
 
@@ -352,6 +387,7 @@ def get_prediction(dish: str, date_str: str, address: str, model: str = 'auto',
 
     safe_name = safe_filename(dish)
     dish_mae = 0.0
+    direct_horizon = None
 
     # Registry lookup
     try:
@@ -360,6 +396,8 @@ def get_prediction(dish: str, date_str: str, address: str, model: str = 'auto',
         if model == 'auto':
             model = dish_info['model']
         dish_mae = dish_info.get('all_mae', {}).get(model, 0.0) if dish_info.get('all_mae') else 0.0
+        if dish_info.get('forecast_mode') == 'direct':
+            direct_horizon = dish_info.get('direct_horizon')
     except Exception:
         if model == 'auto':
             model = 'lightgbm'
@@ -373,15 +411,17 @@ def get_prediction(dish: str, date_str: str, address: str, model: str = 'auto',
         results = []
         for day_offset in range(config.forecast_horizon):
             d = dt + pd.Timedelta(days=day_offset)
-            results.append({
+            entry = {
                 "Dish": dish, "Date": d.strftime('%Y-%m-%d'),
                 "Model Used": "AVERAGE",
                 "Prediction": avg_sales,
                 "Prediction_Lower": avg_sales,
                 "Prediction_Upper": avg_sales,
-                "Explanation": {"ProphetTrend": float(avg_sales), "Seasonality": 0.0,
-                                "Holiday": 0.0, "Weather": 0.0, "Lags/Trend": 0.0, "ResidualBase": 0.0}
-            })
+            }
+            if explain:
+                entry["Explanation"] = {"ProphetTrend": float(avg_sales), "Seasonality": 0.0,
+                                        "Holiday": 0.0, "Weather": 0.0, "Lags/Trend": 0.0, "ResidualBase": 0.0}
+            results.append(entry)
         return results
 
     # Get real weather forecast (cached)
@@ -391,9 +431,12 @@ def get_prediction(dish: str, date_str: str, address: str, model: str = 'auto',
 
     try:
         if model in ('catboost', 'xgboost', 'lightgbm'):
-            # Load both Prophet and tree models
-            prophet_model, tree_model = _load_hybrid_models(dish, model, config)
+            # Load both Prophet and tree models (cached across calls, like the explainer)
+            tree_path = f'{config.model_dir}/{model}_{safe_name}.pkl'
+            prophet_model = _load_cached(f'{config.model_dir}/prophet_{safe_name}.pkl')
+            tree_model = _load_cached(tree_path)
             recent = _load_cached(f'{config.model_dir}/recent_sales_{safe_name}.pkl')
+            shap_explainer = _get_explainer_cached(tree_path) if explain and shap is not None else None
 
             multiday = _predict_hybrid_multiday(
                 prophet_model=prophet_model,
@@ -403,21 +446,25 @@ def get_prediction(dish: str, date_str: str, address: str, model: str = 'auto',
                 recent_sales_df=recent,
                 config=config,
                 country_code=country,
-                dish_mae=dish_mae
+                dish_mae=dish_mae,
+                shap_explainer=shap_explainer,
+                direct_horizon=direct_horizon,
             )
 
             results = []
             model_label = f"Prophet+{model.upper()}"
             for entry in multiday:
-                results.append({
+                out = {
                     "Dish": dish,
                     "Date": entry['date'],
                     "Model Used": model_label,
                     "Prediction": entry['qty'],
                     "Prediction_Lower": entry['lower'],
                     "Prediction_Upper": entry['upper'],
-                    "Explanation": entry['explanation']
-                })
+                }
+                if 'explanation' in entry:
+                    out["Explanation"] = entry['explanation']
+                results.append(out)
             return results
 
     except FileNotFoundError as e:
@@ -542,6 +589,18 @@ if __name__ == "__main__":
         "--debug", action="store_true",
         help="Run in sequential debug mode (no parallel processing)."
     )
+    parser.add_argument(
+        "--explain", action="store_true",
+        help="Add grouped SHAP explanations to the forecasts (batched per dish)."
+    )
+    parser.add_argument(
+        "--forecast-mode", choices=["recursive", "direct"], default="recursive",
+        help="Train recursive one-step residual models or direct multi-horizon ones."
+    )
+    parser.add_argument(
+        "--distill", action="store_true",
+        help="Distill a compact linear + Fourier student per dish (kept within the MAE tolerance)."
+    )
     args = parser.parse_args()
 
     # Phase 1 Fix: Ensure model directory exists before any processing
@@ -553,6 +612,8 @@ if __name__ == "__main__":
     # 2. Define global context for this run
     address_input = args.address
     config = PipelineConfig()
+    config.forecast_mode = args.forecast_mode
+    config.distill_student = args.distill
 
     # Ensure model directory exists (redundant but explicit)
     os.makedirs(config.model_dir, exist_ok=True)
@@ -636,6 +697,13 @@ if __name__ == "__main__":
             'all_mae': r['mae'],
             'best_params': r['best_params'],
             'model_type': r.get('model_type', 'hybrid'),
+            'cv_residuals': r.get('cv_residuals', []),
+            'cv_residuals_1step': r.get('cv_residuals_1step', []),
+            'error_quantiles': r.get('error_quantiles'),
+            'forecast_mode': r.get('forecast_mode', 'recursive'),
+            'direct_horizon': r.get('direct_horizon'),
+            'student': r.get('student'),
+            'train_end': r.get('train_end'),
         }
 
         results_rows.append({
@@ -678,7 +746,8 @@ if __name__ == "__main__":
         for dish_name in enriched_df['dish'].unique():
             preds = get_prediction(
                 dish=dish_name, date_str=forecast_date,
-                address=address_input, config=config
+                address=address_input, config=config,
+                explain=args.explain
             )
             if preds and 'Error' not in preds[0]:
                 all_forecasts[dish_name] = preds
@@ -0,0 +1,186 @@
+"""
+Admission control and backpressure.
+
+- Lane: an async concurrency limit with a bounded wait queue. Requests beyond
+  ``max_concurrent + max_queue`` are rejected immediately with 429; requests
+  that wait longer than ``queue_timeout`` get 503. Both carry Retry-After.
+- AdmissionMiddleware: pure ASGI middleware mapping request paths to lanes.
+  The slot is held until the response body is fully sent, so streaming
+  endpoints count for their whole duration. Paths without a lane (/health,
+  /metrics) are never queued, which keeps them responsive under load.
+- TrainingQueue: a bounded worker pool replacing ad-hoc training threads.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Pattern, Set, Tuple
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, lane: str, status_code: int, retry_after: int, message: str) -> None:
+        super().__init__(message)
+        self.lane = lane
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.message = message
+
+    def to_response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=self.status_code,
+            content={"status": "overloaded", "lane": self.lane, "message": self.message},
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class Lane:
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+        retry_after: int,
+    ) -> None:
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._sem: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the server's event loop
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrent)
+        return self._sem
+
+    @asynccontextmanager
+    async def slot(self):
+        sem = self._semaphore()
+        if sem.locked() and self.waiting >= self.max_queue:
+            raise AdmissionRejected(self.name, 429, self.retry_after, f"{self.name} queue is full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected(
+                self.name, 503, self.retry_after, f"Timed out waiting for a {self.name} slot"
+            ) from None
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            sem.release()
+
+
+class AdmissionMiddleware:
+    """Route each HTTP request to its lane; unmatched paths bypass admission."""
+
+    def __init__(self, app: Any, routes: List[Tuple[Pattern[str], Lane]]) -> None:
+        self.app = app
+        self.routes = routes
+
+    def _lane_for(self, path: str) -> Optional[Lane]:
+        for pattern, lane in self.routes:
+            if pattern.match(path):
+                return lane
+        return None
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        lane = self._lane_for(scope.get("path", "")) if scope["type"] == "http" else None
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            async with lane.slot():
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            await e.to_response()(scope, receive, send)
+
+
+PREDICT_LANE = Lane(
+    "predict",
+    max_concurrent=_env_int("PREDICT_MAX_CONCURRENCY", 8),
+    max_queue=_env_int("PREDICT_MAX_QUEUE", 32),
+    queue_timeout=_env_float("PREDICT_QUEUE_TIMEOUT_SECONDS", 30.0),
+    retry_after=_env_int("PREDICT_RETRY_AFTER_SECONDS", 5),
+)
+
+PREDICT_PATHS: Pattern[str] = re.compile(
+    r"^/(predict|store/\d+/(predict(/stream|/quantiles|/write)?|explain|scenarios|backfill)|stores/predict(/stream)?)/?$"
+)
+
+
+class TrainingQueue:
+    """
+    Bounded background training: at most ``max_concurrent`` stores train at
+    once and at most ``max_queue`` wait. A store is queued at most once.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, retry_after: int) -> None:
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="train")
+        self._lock = threading.Lock()
+        self._queued: Set[int] = set()
+        self._running: Set[int] = set()
+
+    def is_pending(self, store_id: int) -> bool:
+        with self._lock:
+            return store_id in self._queued or store_id in self._running
+
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._queued)
+
+    def submit(self, store_id: int, fn: Callable[[int], Any]) -> str:
+        """Queue fn(store_id); returns 'queued' or 'already_queued', raises when full."""
+        with self._lock:
+            if store_id in self._queued or store_id in self._running:
+                return "already_queued"
+            if len(self._queued) >= self.max_queue:
+                raise AdmissionRejected(
+                    "training", 503, self.retry_after, "Training queue is full. Please retry later."
+                )
+            self._queued.add(store_id)
+
+        def run() -> None:
+            with self._lock:
+                self._queued.discard(store_id)
+                self._running.add(store_id)
+            try:
+                fn(store_id)
+            except Exception as e:
+                logger.error("Background training for store %d crashed: %s", store_id, e)
+            finally:
+                with self._lock:
+                    self._running.discard(store_id)
+
+        self._pool.submit(run)
+        return "queued"
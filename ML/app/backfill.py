@@ -0,0 +1,372 @@
+"""
+Multi-origin backfill forecasts for accuracy audits.
+
+Answers "what would the model have forecast as of each past day?": for every
+forecast origin in a date range, each dish's lag state is rebuilt from the
+actual sales before that origin (not the frozen recent_sales pickle), and the
+horizon is forecast recursively from there.
+
+All origins of a dish run as one batched job:
+
+- Prophet predicts once over the whole span (first origin .. last origin +
+  horizon); a day's Prophet value does not depend on the origin.
+- The recursive tree-residual loop runs with the origins as the batch
+  dimension: one (origins x TREE_FEATURES) tree_model.predict per horizon
+  step, each origin keeping its own lag state.
+
+Dishes served by a distilled student (app.inference.serves_student) are
+backfilled with the student, the model /predict actually serves, batched
+the same way; their records carry "distilled": true.
+
+Weather is the observed weather from the Open-Meteo archive (or rows passed
+by the caller), so the errors measure the model, not the weather forecast.
+Results stream as NDJSON records: one per (dish, origin), then a summary with
+MAE per dish and per horizon step.
+
+Limitation: every origin is forecast with the *current* champion, which was
+fitted on sales up to its training cut-off (registry "train_end"; for older
+registries the last recent_sales day, else the registry's write date). A
+forecast from an origin on or before that day is in-sample and looks better
+than a real forecast would have. Such origins are skipped by default; with
+include_in_sample they are emitted flagged "in_sample": true and their
+errors are reported separately (in_sample_mae_by_dish), never mixed into
+mae_by_dish / mae_by_step.
+
+    cd ML
+    python -m app.backfill --store-id 1 --origin-start 2025-01-01 --origin-end 2025-03-31 \\
+        --horizon-days 7 --out backfill_store1.ndjson
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from app.inference import (
+    HISTORY_DAYS,
+    TREE_FEATURES,
+    ModelStore,
+    build_forecast_inputs,
+    direct_horizon,
+    exogenous_features,
+    fetch_weather_archive,
+    holiday_flags,
+    interval_offsets,
+    lag_feature_matrix,
+    serves_student,
+    student_step,
+)
+from app.metrics import stage_timer
+from pipeline_common import WEATHER_COLS, safe_filename
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKFILL_ORIGINS = int(os.getenv("MAX_BACKFILL_ORIGINS", "366"))
+
+
+def backfill_origins(origin_start: str, origin_end: str) -> pd.DatetimeIndex:
+    """Daily forecast origins between two dates (inclusive), validated."""
+    origins = pd.date_range(
+        pd.to_datetime(origin_start).normalize(), pd.to_datetime(origin_end).normalize(), freq="D"
+    )
+    if origins.empty:
+        raise ValueError("origin_end must not be before origin_start")
+    if len(origins) > MAX_BACKFILL_ORIGINS:
+        raise ValueError(f"At most {MAX_BACKFILL_ORIGINS} origins per backfill")
+    if origins[-1] > pd.Timestamp.now().normalize():
+        raise ValueError("Backfill origins must not be in the future")
+    return origins
+
+
+def _daily_history(dish_sales: pd.DataFrame) -> pd.Series:
+    """Daily sales with gaps interpolated, as sanitize_sparse_data does for training."""
+    s = dish_sales.set_index("date")["sales"].astype(float).sort_index()
+    full = pd.date_range(s.index.min(), s.index.max(), freq="D")
+    return s.reindex(full).interpolate(method="time").fillna(0.0)
+
+
+def _span_weather(
+    span: pd.DatetimeIndex,
+    latitude: float,
+    longitude: float,
+    weather_rows: Optional[List[Dict[str, Any]]] = None,
+) -> pd.DataFrame:
+    """Observed weather for every day of span; missing days get the column mean."""
+    if weather_rows:
+        weather = pd.DataFrame(weather_rows)
+    else:
+        try:
+            # The archive ends before today; later days fall back to the mean
+            end = min(span[-1], pd.Timestamp.now().normalize() - pd.Timedelta(days=1))
+            weather = fetch_weather_archive(latitude, longitude, span[0], max(end, span[0]))
+        except Exception as e:
+            logger.warning("Backfill weather archive unavailable, using defaults: %s", e)
+            weather = pd.DataFrame({"date": span})
+    weather["date"] = pd.to_datetime(weather["date"]).dt.normalize()
+    weather = weather.drop_duplicates("date", keep="last").set_index("date").reindex(span)
+    for col in WEATHER_COLS:
+        if col not in weather.columns:
+            weather[col] = np.nan
+        mean = weather[col].mean()
+        weather[col] = weather[col].astype(float).fillna(0.0 if pd.isna(mean) else float(mean))
+    return weather.rename_axis("date").reset_index()[["date"] + WEATHER_COLS]
+
+
+def training_cutoff(store: ModelStore, dish: str) -> Optional[pd.Timestamp]:
+    """
+    Last sales day the dish's current models were fitted on: the registry's
+    train_end, else the last day of its recent_sales pickle, else the day
+    the registry was written (an upper bound). None if none is available.
+    """
+    train_end = store.registry.get(dish, {}).get("train_end")
+    if train_end:
+        return pd.Timestamp(train_end).normalize()
+    recent_path = store.model_dir / f"recent_sales_{safe_filename(dish)}.pkl"
+    if recent_path.exists():
+        try:
+            return pd.to_datetime(joblib.load(str(recent_path))["date"]).max().normalize()
+        except Exception as e:
+            logger.warning("Unreadable %s: %s", recent_path.name, e)
+    registry_path = store.model_dir / "champion_registry.pkl"
+    if registry_path.exists():
+        return pd.Timestamp(registry_path.stat().st_mtime, unit="s").normalize()
+    return None
+
+
+def backfill_dish(
+    store: ModelStore,
+    dish: str,
+    dish_sales: pd.DataFrame,
+    origins: pd.DatetimeIndex,
+    horizon_days: int,
+    weather: pd.DataFrame,
+    country_code: Optional[str] = None,
+    cutoff: Optional[pd.Timestamp] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one record per origin with enough history before it (HISTORY_DAYS
+    days). weather covers origins[0] .. origins[-1] + horizon_days - 1.
+    Records of origins on or before cutoff (the training cut-off) are
+    flagged in_sample.
+    """
+    history = _daily_history(dish_sales)
+    observed = dish_sales.set_index("date")["sales"].astype(float)
+
+    usable = [o for o in origins if (history.index < o).sum() >= HISTORY_DAYS]
+    if not usable:
+        return
+    state = np.stack([history[history.index < o].to_numpy()[-HISTORY_DAYS:] for o in usable])
+    offsets = np.array([(o - origins[0]).days for o in usable])
+
+    meta = store.registry.get(dish, {})
+    direct = direct_horizon(meta)
+    dates = pd.to_datetime(weather["date"])
+
+    # base: Prophet's yhat (or the student's base); resid: the tree residual (or lag part)
+    n = len(usable)
+    yhat = np.empty((n, horizon_days))
+    base = np.empty((n, horizon_days))
+    resid = np.empty((n, horizon_days))
+    if serves_student(meta):
+        student = meta["student"]
+        model = {
+            "model": meta.get("model"),
+            "model_combo": f"Student[{student['kind']}] of Prophet+{meta.get('model')}",
+            "distilled": True,
+        }
+        holidays = holiday_flags(dates, country_code)
+        weather_values = weather[WEATHER_COLS].to_numpy(dtype=float)
+        for h in range(horizon_days):
+            idx = offsets + h
+            base[:, h], resid[:, h] = student_step(
+                student, dates.iloc[idx].to_numpy(), weather_values[idx], holidays[idx],
+                float(min(h + 1, direct or 1)), lag_feature_matrix(state),
+            )
+            yhat[:, h] = np.maximum(base[:, h] + resid[:, h], 0.0)
+            if not direct:
+                state = np.concatenate([state, yhat[:, h:h + 1]], axis=1)[:, -HISTORY_DAYS:]
+    else:
+        inputs = build_forecast_inputs(store.get_dish_model(dish), origins[0], weather, country_code)
+        model = {"model": inputs.loaded.champion, "model_combo": f"Prophet+{inputs.loaded.champion}"}
+        exog = pd.DataFrame([exogenous_features(inputs, i) for i in range(len(weather))])
+        exog_cols = {k: exog[k].to_numpy() for k in exog.columns}
+        for h in range(horizon_days):
+            idx = offsets + h
+            lag_feats = lag_feature_matrix(state)
+            X = pd.DataFrame({
+                k: lag_feats[k] if k in lag_feats else exog_cols[k][idx]
+                for k in TREE_FEATURES
+            })
+            if direct:
+                X["horizon"] = float(min(h + 1, direct))
+            with stage_timer("tree_predict"):
+                resid[:, h] = np.asarray(inputs.loaded.tree_model.predict(X), dtype=float)
+            base[:, h] = inputs.prophet_yhat[idx]
+            yhat[:, h] = np.maximum(base[:, h] + resid[:, h], 0.0)
+            if not direct:
+                state = np.concatenate([state, yhat[:, h:h + 1]], axis=1)[:, -HISTORY_DAYS:]
+
+    for j, origin in enumerate(usable):
+        rows = []
+        for h in range(horizon_days):
+            i = offsets[j] + h
+            dt = dates.iloc[i]
+            lo, hi = interval_offsets(meta, h + 1, int(dt.dayofweek))
+            actual = observed.get(dt)
+            rows.append({
+                "date": dt.strftime("%Y-%m-%d"),
+                "yhat": float(yhat[j, h]),
+                "prophet_yhat": float(base[j, h]),
+                "residual_hat": float(resid[j, h]),
+                "lower": max(0.0, float(yhat[j, h]) + lo),
+                "upper": max(0.0, float(yhat[j, h]) + hi),
+                "actual": None if actual is None else float(actual),
+            })
+        yield {
+            "dish": dish,
+            "origin": origin.strftime("%Y-%m-%d"),
+            **model,
+            "in_sample": cutoff is not None and origin <= cutoff,
+            "training_cutoff": cutoff.strftime("%Y-%m-%d") if cutoff is not None else None,
+            "predictions": rows,
+        }
+
+
+def iter_backfill(
+    store: ModelStore,
+    sales: Optional[pd.DataFrame],
+    origins: pd.DatetimeIndex,
+    horizon_days: int,
+    latitude: float,
+    longitude: float,
+    country_code: Optional[str] = None,
+    dishes: Optional[List[str]] = None,
+    weather_rows: Optional[List[Dict[str, Any]]] = None,
+    include_in_sample: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield a {"type": "forecast", ...} record per dish and origin (or one
+    {"type": "dish_error", ...} for a dish that fails), then a single
+    {"type": "summary", ...} with out-of-sample MAE per dish and horizon
+    step. Origins inside a dish's training window are skipped unless
+    include_in_sample is set (see the module docstring).
+    """
+    if sales is None or sales.empty:
+        raise ValueError("No sales history available for backfill")
+    dishes = dishes or store.list_dishes()
+
+    span = pd.date_range(origins[0], origins[-1] + pd.Timedelta(days=horizon_days - 1), freq="D")
+    weather = _span_weather(span, latitude, longitude, weather_rows)
+    by_dish = {str(d): g[["date", "sales"]] for d, g in sales.groupby("dish")}
+
+    abs_err_by_dish: Dict[str, List[float]] = {}
+    abs_err_by_step: List[List[float]] = [[] for _ in range(horizon_days)]
+    in_sample_err_by_dish: Dict[str, List[float]] = {}
+    skipped: Dict[str, int] = {}
+    in_sample: Dict[str, int] = {}
+    cutoffs: Dict[str, Optional[str]] = {}
+    for dish in dishes:
+        dish_sales = by_dish.get(dish)
+        if dish_sales is None:
+            yield {"type": "dish_error", "dish": dish, "error": "No sales history for dish"}
+            continue
+        cutoff = training_cutoff(store, dish)
+        cutoffs[dish] = cutoff.strftime("%Y-%m-%d") if cutoff is not None else None
+        dish_origins = origins
+        if cutoff is not None:
+            n_in_sample = int((origins <= cutoff).sum())
+            if n_in_sample:
+                in_sample[dish] = n_in_sample
+            if not include_in_sample:
+                dish_origins = origins[origins > cutoff]
+        produced = 0
+        try:
+            if len(dish_origins):
+                for record in backfill_dish(
+                    store, dish, dish_sales, dish_origins, horizon_days, weather, country_code, cutoff
+                ):
+                    produced += 1
+                    for h, row in enumerate(record["predictions"]):
+                        if row["actual"] is None:
+                            continue
+                        err = abs(row["yhat"] - row["actual"])
+                        if record["in_sample"]:
+                            in_sample_err_by_dish.setdefault(dish, []).append(err)
+                        else:
+                            abs_err_by_dish.setdefault(dish, []).append(err)
+                            abs_err_by_step[h].append(err)
+                    yield {"type": "forecast", **record}
+        except Exception as e:
+            yield {"type": "dish_error", "dish": dish, "error": str(e)}
+            continue
+        if produced < len(dish_origins):
+            skipped[dish] = len(dish_origins) - produced
+
+    yield {
+        "type": "summary",
+        "origins": len(origins),
+        "origin_start": origins[0].strftime("%Y-%m-%d"),
+        "origin_end": origins[-1].strftime("%Y-%m-%d"),
+        "horizon_days": horizon_days,
+        "mae_by_dish": {d: float(np.mean(e)) for d, e in sorted(abs_err_by_dish.items())},
+        "mae_by_step": [float(np.mean(e)) if e else None for e in abs_err_by_step],
+        "origins_skipped": skipped,  # dish -> origins without HISTORY_DAYS of history
+        # In-sample origins (on or before the training cut-off): excluded from
+        # mae_by_dish / mae_by_step; emitted only with include_in_sample
+        "training_cutoff_by_dish": cutoffs,
+        "origins_in_sample": in_sample,
+        "include_in_sample": include_in_sample,
+        "in_sample_mae_by_dish": {d: float(np.mean(e)) for d, e in sorted(in_sample_err_by_dish.items())},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Backfill forecasts from many past origins")
+    parser.add_argument("--store-id", type=int, required=True)
+    parser.add_argument("--origin-start", required=True, help="First forecast origin (YYYY-MM-DD)")
+    parser.add_argument("--origin-end", required=True, help="Last forecast origin (YYYY-MM-DD)")
+    parser.add_argument("--horizon-days", type=int, default=7)
+    parser.add_argument("--dishes", nargs="*")
+    parser.add_argument("--model-dir", default=os.getenv("MODEL_DIR", "models"))
+    parser.add_argument("--out", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--include-in-sample", action="store_true",
+                        help="Also forecast origins inside the models' training window (flagged in_sample)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app.inference import resolve_location
+    from app.store_manager import StoreModelManager
+
+    if not 1 <= args.horizon_days <= 30:
+        parser.error("--horizon-days must be in [1, 30]")
+    manager = StoreModelManager(base_model_dir=args.model_dir)
+    ms = manager.get_store(args.store_id)
+    if ms is None:
+        parser.error(f"No models for store {args.store_id}")
+    sales, _ = manager.fetch_store_sales(args.store_id)
+    lat, lon, cc = manager.get_store_metadata(args.store_id).location
+    lat, lon, cc = resolve_location("Shanghai, China", lat, lon, cc)
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        for record in iter_backfill(
+            ms, sales, backfill_origins(args.origin_start, args.origin_end), args.horizon_days,
+            float(lat), float(lon), cc, dishes=args.dishes, include_in_sample=args.include_in_sample,
+        ):
+            out.write(json.dumps(record, default=str) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
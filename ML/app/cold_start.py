@@ -0,0 +1,155 @@
+"""
+Instant cold-start forecaster.
+
+Stores that are still training, or have fewer than MIN_TRAINING_DAYS of
+sales, get a provisional forecast from whatever history exists. It
+generalizes the "average" fallback of Final_model_v2.get_prediction into a
+small ensemble, fitted per dish in milliseconds with numpy only:
+
+- seasonal naive: the last observed value for the same weekday
+- weekday mean:   mean of the last WEEKDAY_MEAN_WEEKS values per weekday
+- exponential smoothing: SES level with weekday factors
+
+Members are weighted by the inverse of their one-step-ahead MAE over the
+history (equal weights when there is too little history to score them).
+Intervals come from quantiles of those one-step errors.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+HISTORY_DAYS = 16 * 7  # only recent weeks matter, and it bounds the fit cost
+WEEKDAY_MEAN_WEEKS = 6
+SES_ALPHA = 0.3
+MIN_SCORED_DAYS = 14  # history needed before members are weighted by accuracy
+INTERVAL_LEVELS = (0.1, 0.9)
+
+
+def _daily_series(dish_sales: pd.DataFrame) -> pd.Series:
+    """Daily sales from the first sale onward; days without sales count as 0."""
+    s = dish_sales.groupby(pd.to_datetime(dish_sales["date"]).dt.normalize())["sales"].sum()
+    full = pd.date_range(s.index.min(), s.index.max(), freq="D")
+    return s.reindex(full, fill_value=0.0).astype(float)
+
+
+def _seasonal_naive(y: np.ndarray, dows: np.ndarray, target_dow: int) -> float:
+    same = y[dows == target_dow]
+    return float(same[-1]) if same.size else float(y[-1])
+
+
+def _weekday_mean(y: np.ndarray, dows: np.ndarray, target_dow: int) -> float:
+    same = y[dows == target_dow][-WEEKDAY_MEAN_WEEKS:]
+    return float(same.mean()) if same.size else float(y[-WEEKDAY_MEAN_WEEKS * 7:].mean())
+
+
+def _ses_state(y: np.ndarray, dows: np.ndarray) -> Dict[str, Any]:
+    level = float(y[0])
+    for v in y[1:]:
+        level = SES_ALPHA * float(v) + (1.0 - SES_ALPHA) * level
+    overall = float(y.mean())
+    factors = np.ones(7)
+    if overall > 0:
+        for d in range(7):
+            same = y[dows == d]
+            if same.size:
+                factors[d] = float(same.mean()) / overall
+    return {"level": level, "factors": factors}
+
+
+def _members(y: np.ndarray, dows: np.ndarray, target_dow: int) -> np.ndarray:
+    ses = _ses_state(y, dows)
+    return np.array([
+        _seasonal_naive(y, dows, target_dow),
+        _weekday_mean(y, dows, target_dow),
+        ses["level"] * ses["factors"][target_dow],
+    ])
+
+
+def _one_step_errors(y: np.ndarray, dows: np.ndarray) -> Optional[np.ndarray]:
+    """(days x members) one-step-ahead errors over the history, or None if too short."""
+    n = len(y)
+    if n < MIN_SCORED_DAYS:
+        return None
+    start = max(7, n - 8 * 7)  # score the last ~8 weeks
+    return np.array([y[t] - _members(y[:t], dows[:t], int(dows[t])) for t in range(start, n)])
+
+
+def forecast_dish(
+    dish: str,
+    dish_sales: pd.DataFrame,
+    horizon_days: int,
+    start_date: pd.Timestamp,
+) -> Dict[str, Any]:
+    """
+    Provisional forecast for one dish from its raw sales rows (date, sales),
+    shaped like predict_dish() output. Exogenous columns (prophet_yhat,
+    residual_hat) are omitted.
+    """
+    if dish_sales.empty:
+        raise ValueError(f"No sales history for dish: {dish}")
+
+    series = _daily_series(dish_sales).iloc[-HISTORY_DAYS:]
+    y = series.to_numpy()
+    dows = series.index.dayofweek.to_numpy()
+
+    errors = _one_step_errors(y, dows)
+    if errors is None:
+        weights = np.full(3, 1.0 / 3.0)
+        ens_errors = None
+    else:
+        mae = np.abs(errors).mean(axis=0)
+        inv = 1.0 / np.maximum(mae, 1e-6)
+        weights = inv / inv.sum()
+        ens_errors = errors @ weights
+    if ens_errors is not None and ens_errors.size:
+        lo, hi = np.quantile(ens_errors, INTERVAL_LEVELS)
+    else:
+        spread = float(np.abs(y - y.mean()).mean())
+        lo, hi = -spread, spread
+
+    # Forecast days beyond the last observation keep the history frozen
+    # (no recursive feedback), so the horizon is cheap and stable.
+    rows: List[Dict[str, Any]] = []
+    for h in range(horizon_days):
+        dt = start_date + pd.Timedelta(days=h)
+        yhat = max(0.0, float(_members(y, dows, dt.dayofweek) @ weights))
+        rows.append({
+            "date": dt.strftime("%Y-%m-%d"),
+            "yhat": yhat,
+            "lower": max(0.0, yhat + float(lo)),
+            "upper": max(0.0, yhat + float(hi)),
+        })
+
+    return {
+        "dish": dish,
+        "model": "cold_start",
+        "model_combo": "SeasonalNaive+WeekdayMean+SES",
+        "horizon_days": horizon_days,
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "history_days": int(len(y)),
+        "weights": {
+            "seasonal_naive": round(float(weights[0]), 3),
+            "weekday_mean": round(float(weights[1]), 3),
+            "ses": round(float(weights[2]), 3),
+        },
+        "predictions": rows,
+    }
+
+
+def forecast_store(
+    sales: pd.DataFrame,
+    horizon_days: int,
+    start_date: pd.Timestamp,
+) -> Dict[str, Dict[str, Any]]:
+    """Provisional forecasts for every dish in a store's (date, dish, sales) frame."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for dish, group in sales.groupby("dish", sort=True):
+        try:
+            out[str(dish)] = forecast_dish(str(dish), group, horizon_days, start_date)
+        except Exception as e:
+            out[str(dish)] = {"error": str(e)}
+    return out
@@ -0,0 +1,98 @@
+"""
+Request deadlines for store-wide predictions.
+
+Callers pass a time budget in milliseconds, either as the X-Request-Timeout-Ms
+header or the ``timeout_ms`` request field (the smaller one wins). The budget
+starts when the request reaches the service, so time spent waiting for an
+admission slot counts against it.
+
+Store predictions check the deadline before each dish and stop scheduling new
+dishes once the remaining budget cannot fit another dish (estimated from the
+dishes already done) plus a safety margin for serialization. They also stop
+when the client has disconnected.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Callable, Optional
+
+from fastapi import Request
+
+TIMEOUT_HEADER = "x-request-timeout-ms"
+SAFETY_MARGIN_SECONDS = float(os.getenv("DEADLINE_SAFETY_MARGIN_MS", "250")) / 1000.0
+
+
+class Deadline:
+    def __init__(
+        self,
+        expires_at: Optional[float],
+        is_disconnected: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        self.expires_at = expires_at  # time.monotonic() value, None = no deadline
+        self._is_disconnected = is_disconnected
+        self._done = 0
+        self._spent = 0.0
+        self.cancelled = False
+
+    @classmethod
+    def from_request(
+        cls,
+        request: Request,
+        timeout_ms: Optional[int] = None,
+        watch_disconnect: bool = True,
+    ) -> "Deadline":
+        """
+        watch_disconnect=False for streaming responses: Starlette already stops
+        a stream on disconnect, and probing receive() there would race with it.
+        """
+        budgets = [timeout_ms] if timeout_ms else []
+        header = request.headers.get(TIMEOUT_HEADER)
+        if header:
+            try:
+                budgets.append(int(header))
+            except ValueError:
+                pass
+        started = getattr(request.state, "received_at", None) or time.monotonic()
+        expires_at = started + min(budgets) / 1000.0 if budgets else None
+        probe = _disconnect_probe(request) if watch_disconnect else None
+        return cls(expires_at, is_disconnected=probe)
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return self.expires_at - time.monotonic()
+
+    def record(self, seconds: float) -> None:
+        """Record how long one unit of work (a dish) took."""
+        self._done += 1
+        self._spent += seconds
+
+    def should_stop(self) -> bool:
+        """True when the next unit of work should not be started."""
+        if self.cancelled:
+            return True
+        if self._is_disconnected is not None and self._is_disconnected():
+            self.cancelled = True
+            return True
+        if self.expires_at is None:
+            return False
+        per_unit = self._spent / self._done if self._done else 0.0
+        return self.remaining() < per_unit + SAFETY_MARGIN_SECONDS
+
+
+def _disconnect_probe(request: Request) -> Callable[[], bool]:
+    """
+    Build a disconnect check usable from the sync endpoint's worker thread.
+    Returns False when the check cannot be performed (e.g. outside anyio).
+    """
+    def probe() -> bool:
+        try:
+            import anyio.from_thread
+
+            return bool(anyio.from_thread.run(request.is_disconnected))
+        except Exception:
+            return False
+
+    return probe
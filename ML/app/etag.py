@@ -0,0 +1,55 @@
+"""
+ETags and conditional GET/POST handling for forecast endpoints.
+
+A forecast is fully determined by its inputs: the model version, the recent
+sales it starts from, the weather forecast and the request parameters (plus
+the current date when the start date defaults to tomorrow). The endpoints
+hash those inputs into an ETag *before* running any model, so a client that
+sends a matching If-None-Match gets a 304 without Prophet or the tree model
+being touched.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag over JSON-serializable parts (order matters)."""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return '"' + hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+
+def matches(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match covers etag (weak comparison, RFC 9110)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def conditional(request: Request, etag: Optional[str]) -> Optional[Response]:
+    """Return a 304 response when the client already holds etag, else None."""
+    if etag is not None and matches(request, etag):
+        return not_modified(etag)
+    return None
+
+
+def attach(result: Any, response: Response, etag: Optional[str]) -> Any:
+    """Set the ETag on a Response result or on the endpoint's response headers."""
+    if etag is not None:
+        target = result if isinstance(result, Response) else response
+        target.headers["ETag"] = etag
+    return result
@@ -0,0 +1,122 @@
+"""
+Push-based training status.
+
+StoreModelManager publishes every training state change (queued, per-dish
+progress, completed / failed) to a TrainingEvents broker instead of callers
+polling /store/{id}/status, whose every poll costs a sales query.
+
+- /store/{id}/events subscribes an asyncio queue per connection and streams
+  the events as server-sent events. Training runs in worker threads, so
+  publish() hands each event to the subscriber's event loop with
+  call_soon_threadsafe. A new subscriber first gets the store's last event,
+  so it never has to poll for the current state.
+- Callers of /store/{id}/train may pass a callback_url; the terminal event is
+  POSTed to it as JSON once training finishes (or fails). Only http(s) URLs
+  to hosts listed in TRAINING_CALLBACK_ALLOWED_HOSTS (comma-separated) are
+  accepted, so the service cannot be made to POST to arbitrary addresses;
+  with the variable unset, callbacks are refused.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = {"completed", "error", "insufficient_data"}
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+CALLBACK_TIMEOUT_SECONDS = float(os.getenv("TRAINING_CALLBACK_TIMEOUT_SECONDS", "10"))
+CALLBACK_ATTEMPTS = int(os.getenv("TRAINING_CALLBACK_ATTEMPTS", "3"))
+CALLBACK_ALLOWED_HOSTS = {
+    h.strip().lower() for h in os.getenv("TRAINING_CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()
+}
+
+Subscriber = Tuple[asyncio.AbstractEventLoop, "asyncio.Queue[Dict[str, Any]]"]
+
+
+def _offer(queue: "asyncio.Queue[Dict[str, Any]]", event: Dict[str, Any]) -> None:
+    """put_nowait that drops the oldest event when a slow subscriber's queue is full."""
+    if queue.full():
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+    queue.put_nowait(event)
+
+
+class TrainingEvents:
+    """Thread-safe fan-out of per-store training events to asyncio subscribers."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        self._last: Dict[int, Dict[str, Any]] = {}
+
+    def subscribe(self, store_id: int) -> Tuple[Subscriber, Optional[Dict[str, Any]]]:
+        """Register a queue on the running loop; returns it and the store's last event."""
+        sub: Subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.setdefault(store_id, set()).add(sub)
+            return sub, self._last.get(store_id)
+
+    def unsubscribe(self, store_id: int, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subscribers.get(store_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[store_id]
+
+    def publish(self, store_id: int, event_type: str, **data: Any) -> Dict[str, Any]:
+        """Record and fan out an event; safe to call from any thread."""
+        event = {"type": event_type, "store_id": store_id, "ts": time.time(), **data}
+        with self._lock:
+            self._last[store_id] = event
+            subs = list(self._subscribers.get(store_id, ()))
+        for loop, queue in subs:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:  # subscriber's loop already closed
+                self.unsubscribe(store_id, (loop, queue))
+        return event
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def check_callback_url(url: str) -> None:
+    """Raise ValueError unless url is http(s) to a host in TRAINING_CALLBACK_ALLOWED_HOSTS."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an absolute http(s) URL")
+    if parts.hostname.lower() not in CALLBACK_ALLOWED_HOSTS:
+        raise ValueError(f"callback_url host '{parts.hostname}' is not in TRAINING_CALLBACK_ALLOWED_HOSTS")
+
+
+def post_callbacks(urls: List[str], event: Dict[str, Any]) -> None:
+    """POST the event to each callback URL, retrying with backoff; failures are only logged."""
+    import requests
+
+    for url in urls:
+        for attempt in range(1, CALLBACK_ATTEMPTS + 1):
+            try:
+                resp = requests.post(url, json=event, timeout=CALLBACK_TIMEOUT_SECONDS)
+                resp.raise_for_status()
+                break
+            except requests.RequestException as e:
+                if attempt == CALLBACK_ATTEMPTS:
+                    logger.warning("Store %s: training callback %s failed: %s", event.get("store_id"), url, e)
+                else:
+                    time.sleep(2 ** (attempt - 1))
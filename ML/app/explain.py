@@ -0,0 +1,124 @@
+"""
+SHAP explanations for dish forecasts.
+
+Explanations are only computed when asked for (/store/{id}/explain). The
+forecast runs as usual while collecting each day's tree-model input row;
+SHAP values for the whole horizon matrix then come from a single batched
+call and are summed into the FEATURE_GROUPS used by the training pipeline.
+
+Dishes served by a distilled student (app.inference.serves_student) are
+explained by the student itself: it is linear, so each day's term
+contributions are an exact decomposition of its whole forecast, grouped the
+same way (trend and Fourier terms under "Seasonality").
+
+TreeExplainers are cached per loaded tree model (weakly, so they go away
+with the model when a store is reloaded after retraining).
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.inference import ModelStore, predict_dish, tree_feature_names
+from app.metrics import stage_timer
+from pipeline_common import FEATURE_GROUPS, feature_group_index
+from student_models import student_terms, term_names
+
+_explainers: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+_explainers_lock = threading.Lock()
+
+
+def get_explainer(tree_model: Any) -> Any:
+    """Return the cached TreeExplainer for a loaded tree model, building it once."""
+    with _explainers_lock:
+        explainer = _explainers.get(tree_model)
+        if explainer is None:
+            try:
+                import shap  # type: ignore
+            except Exception as e:
+                raise RuntimeError("shap is not installed") from e
+            with stage_timer("shap_explainer_build"):
+                explainer = shap.TreeExplainer(tree_model)
+            _explainers[tree_model] = explainer
+        return explainer
+
+
+def explain_matrix(tree_model: Any, X: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Batched SHAP for a (days x tree features) matrix.
+    Returns the residual model's base value and per-group contributions per row.
+    """
+    explainer = get_explainer(tree_model)
+    with stage_timer("shap_values"):
+        sv = np.asarray(explainer.shap_values(X), dtype=float)
+    base_value = float(np.ravel(explainer.expected_value)[0])
+    group_index = feature_group_index(list(X.columns), FEATURE_GROUPS)
+    groups = {g: sv[:, idx].sum(axis=1) for g, idx in group_index.items()}
+    return {"base_value": base_value, "groups": groups}
+
+
+def explain_student(student: Dict[str, Any], frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Exact per-group contributions of a student's forecast per row of frame
+    (its input rows): yhat = max(base_value + sum(groups), 0).
+    """
+    terms, _ = student_terms(student, frame)
+    group_of = {f: g for g, feats in FEATURE_GROUPS.items() for f in feats}
+    n_calendar = len(term_names(student)) - len(student["inputs"])
+    groups: Dict[str, np.ndarray] = {}
+    for j, name in enumerate(term_names(student)):
+        group = "Seasonality" if j < n_calendar else group_of.get(name, "Other")
+        groups[group] = groups.get(group, 0.0) + terms[:, j]
+    return {"base_value": float(student["intercept"]), "groups": groups}
+
+
+def explain_dish(
+    store: ModelStore,
+    dish: str,
+    recent_sales: List[float],
+    horizon_days: int,
+    address: str = "Shanghai, China",
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    country_code: Optional[str] = None,
+    weather_rows: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Forecast a dish and attach, per day, the grouped SHAP contributions to
+    its residual: residual_hat ~= base_value + sum(groups). For a dish
+    served by its student the groups decompose the whole forecast instead
+    ("explains": "yhat").
+    """
+    feature_rows: List[Dict[str, float]] = []
+    result = predict_dish(
+        store=store,
+        dish=dish,
+        recent_sales=recent_sales,
+        horizon_days=horizon_days,
+        address=address,
+        latitude=latitude,
+        longitude=longitude,
+        country_code=country_code,
+        weather_rows=weather_rows,
+        feature_rows=feature_rows,
+    )
+    meta = store.registry.get(dish, {})
+    if result.get("distilled"):
+        explained = explain_student(meta["student"], pd.DataFrame(feature_rows))
+        result["explains"] = "yhat"
+    else:
+        X = pd.DataFrame(feature_rows, columns=tree_feature_names(meta))
+        explained = explain_matrix(store.get_dish_model(dish).tree_model, X)
+        result["explains"] = "residual_hat"
+
+    result["base_value"] = round(explained["base_value"], 4)
+    for i, row in enumerate(result["predictions"]):
+        row["explanation"] = {
+            g: round(float(values[i]), 4) for g, values in explained["groups"].items()
+        }
+    return result
@@ -0,0 +1,132 @@
+"""
+Stale-while-revalidate cache for store forecasts.
+
+Every complete store forecast is kept (LRU-bounded) keyed by store, model
+version and request parameters. Reads that opt in get the cached payload
+immediately with its age; if it is older than the soft TTL a single
+background refresh recomputes it, and entries older than the max staleness
+are never served.
+
+Staleness bounds are configured per endpoint through FORECAST_SWR_POLICIES,
+a JSON object such as
+
+    {"store_predict": {"soft_ttl": 10800, "max_stale": 86400},
+     "dashboard":     {"soft_ttl": 3600,  "max_stale": 172800}}
+
+Callers pick a policy by name (``cache_policy``) and may tighten it further
+with ``max_stale_seconds``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StalenessPolicy:
+    soft_ttl: float   # older than this -> serve, then refresh in background
+    max_stale: float  # older than this -> never served, recompute inline
+
+
+DEFAULT_POLICIES: Dict[str, StalenessPolicy] = {
+    "store_predict": StalenessPolicy(soft_ttl=3 * 3600.0, max_stale=24 * 3600.0),
+    "dashboard": StalenessPolicy(soft_ttl=3600.0, max_stale=48 * 3600.0),
+}
+
+
+def load_policies() -> Dict[str, StalenessPolicy]:
+    policies = dict(DEFAULT_POLICIES)
+    raw = os.getenv("FORECAST_SWR_POLICIES")
+    if raw:
+        try:
+            for name, cfg in json.loads(raw).items():
+                policies[name] = StalenessPolicy(
+                    soft_ttl=float(cfg["soft_ttl"]), max_stale=float(cfg["max_stale"])
+                )
+        except Exception as e:
+            logger.warning("Ignoring invalid FORECAST_SWR_POLICIES: %s", e)
+    return policies
+
+
+@dataclass
+class CachedForecast:
+    payload: Dict[str, Any]
+    computed_at: float  # time.time()
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.computed_at)
+
+
+class ForecastCache:
+    def __init__(self, max_entries: int = 2048, refresh_workers: int = 2) -> None:
+        self.max_entries = max_entries
+        self.policies = load_policies()
+        self._entries: "OrderedDict[Hashable, CachedForecast]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: Set[Hashable] = set()
+        self._pool = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="swr-refresh")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def policy(self, name: str, max_stale_seconds: Optional[float] = None) -> StalenessPolicy:
+        """Named policy, tightened by max_stale_seconds; raises ValueError for an unknown name."""
+        base = self.policies.get(name)
+        if base is None:
+            raise ValueError(f"Unknown cache_policy '{name}' (known: {', '.join(sorted(self.policies))})")
+        if max_stale_seconds is None:
+            return base
+        max_stale = min(base.max_stale, float(max_stale_seconds))
+        return StalenessPolicy(soft_ttl=min(base.soft_ttl, max_stale), max_stale=max_stale)
+
+    def get(self, key: Hashable) -> Optional[CachedForecast]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, payload: Dict[str, Any], computed_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = CachedForecast(payload, computed_at or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            stale = [k for k in self._entries if predicate(k)]
+            for k in stale:
+                del self._entries[k]
+            return len(stale)
+
+    def refresh_in_background(self, key: Hashable, compute: Callable[[], Dict[str, Any]]) -> bool:
+        """Recompute an entry off the request path; at most one refresh per key."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        def run() -> None:
+            try:
+                payload = compute()
+                if payload.get("status") == "ok":
+                    self.put(key, payload)
+            except Exception as e:
+                logger.warning("Background forecast refresh failed for %s: %s", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._pool.submit(run)
+        return True
@@ -1,28 +1,35 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import logging
 import os
+import threading
+import time
 import joblib
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-import holidays
 import numpy as np
 import pandas as pd
 
-from training_logic import PipelineConfig, WEATHER_COLS, get_location_details, safe_filename
-
-try:
-    import openmeteo_requests  # type: ignore
-    from retry_requests import retry  # type: ignore
-except Exception:  # pragma: no cover
-    openmeteo_requests = None  # type: ignore
-    retry = None  # type: ignore
+from app.metrics import stage_timer
+from app.resilience import NOMINATIM, OPEN_METEO
+from app.singleflight import SingleFlight
+# Serving only needs the lightweight shared definitions; the training stack
+# (training_logic_v2: optuna, sklearn, sqlalchemy, tree libraries) is imported
+# on demand by StoreModelManager.train_store_models.
+from pipeline_common import HOLIDAY_YEARS, WEATHER_COLS, geocode_address, safe_filename
+from student_models import lag_contribution, predict_student
 
+logger = logging.getLogger(__name__)
 
 TIME_FEATURES = ["day_of_week", "month", "day", "dayofyear", "is_weekend"]
 LAGS = (1, 7, 14)
 ROLL_WINDOWS = (7, 14, 28)
+HISTORY_DAYS = max(max(LAGS), max(ROLL_WINDOWS))  # older sales never reach a feature
 TREE_FEATURES = TIME_FEATURES + ["is_public_holiday"] + WEATHER_COLS + [
     "y_lag_1",
     "y_lag_7",
@@ -35,6 +42,18 @@ TREE_FEATURES = TIME_FEATURES + ["is_public_holiday"] + WEATHER_COLS + [
     "y_roll_std_28",
     "prophet_yhat",
 ]
+# Direct multi-horizon models also see the horizon step (lags are the origin's)
+DIRECT_TREE_FEATURES = TREE_FEATURES + ["horizon"]
+
+# How long a failed artifact load is remembered before it is retried.
+ARTIFACT_FAILURE_TTL_SECONDS = float(os.getenv("ARTIFACT_FAILURE_TTL_SECONDS", "5"))
+
+# Serve distilled students (registry "student") instead of Prophet + tree when present.
+SERVE_STUDENTS = os.getenv("ML_SERVE_STUDENTS", "1") != "0"
+
+# Stores whose coordinates round to the same cell share one weather forecast.
+WEATHER_GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", "0.1"))
+WEATHER_CACHE_TTL_SECONDS = float(os.getenv("WEATHER_CACHE_TTL_SECONDS", "3600"))
 
 
 @dataclass(frozen=True)
@@ -49,20 +68,51 @@ class ModelStore:
     def __init__(self, model_dir: str = "models") -> None:
         self.model_dir = Path(model_dir)
         self.registry: Dict[str, Dict[str, Any]] = {}
+        self.version = ""  # changes whenever champion_registry.pkl is rewritten
         self._cache: Dict[str, LoadedDishModel] = {}
+        self._loads: SingleFlight[LoadedDishModel] = SingleFlight(failure_ttl=ARTIFACT_FAILURE_TTL_SECONDS)
 
     def load_registry(self) -> None:
         registry_path = self.model_dir / "champion_registry.pkl"
         if not registry_path.exists():
             raise FileNotFoundError(f"Missing registry: {registry_path}")
-        self.registry = joblib.load(str(registry_path))
+        with stage_timer("registry_load"):
+            stat = registry_path.stat()
+            self.registry = joblib.load(str(registry_path))
+        self.version = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
 
     def list_dishes(self) -> List[str]:
         return sorted(self.registry.keys())
 
+    def recent_sales_state(self) -> Tuple[Dict[str, Tuple[int, int]], List[str]]:
+        """
+        (mtime_ns, size) of each dish's recent_sales_*.pkl, plus the dishes
+        without one (their history comes from the database instead).
+        Only stats files, so it is cheap enough to run before every forecast.
+        """
+        state: Dict[str, Tuple[int, int]] = {}
+        missing: List[str] = []
+        for dish in self.list_dishes():
+            path = self.model_dir / f"recent_sales_{safe_filename(dish)}.pkl"
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                missing.append(dish)
+                continue
+            state[dish] = (st.st_mtime_ns, st.st_size)
+        return state, missing
+
     def get_dish_model(self, dish: str) -> LoadedDishModel:
-        if dish in self._cache:
-            return self._cache[dish]
+        cached = self._cache.get(dish)
+        if cached is not None:
+            return cached
+        # One loader per dish; concurrent cold requests wait for its result
+        return self._loads.do(dish, lambda: self._load_dish_model(dish))
+
+    def _load_dish_model(self, dish: str) -> LoadedDishModel:
+        cached = self._cache.get(dish)
+        if cached is not None:
+            return cached
 
         meta = self.registry.get(dish)
         if meta is None:
@@ -81,8 +131,9 @@ class ModelStore:
                 f"Missing model files for '{dish}': {prophet_path.name}, {tree_path.name}"
             )
 
-        prophet_model = joblib.load(str(prophet_path))
-        tree_model = joblib.load(str(tree_path))
+        with stage_timer("artifact_load"):
+            prophet_model = joblib.load(str(prophet_path))
+            tree_model = joblib.load(str(tree_path))
 
         loaded = LoadedDishModel(
             dish=dish,
@@ -115,11 +166,34 @@ def _compute_lag_features_from_history(sales_history: List[float]) -> Dict[str,
     return features
 
 
-def _fetch_weather_forecast(latitude: float, longitude: float, forecast_days: int) -> pd.DataFrame:
-    if openmeteo_requests is None or retry is None:
-        raise RuntimeError("openmeteo-requests / retry-requests not available")
+def lag_feature_matrix(history: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Vectorized _compute_lag_features_from_history over a (batch x days)
+    history, for forecasts that run many paths or scenarios at once.
+    """
+    n = history.shape[1]
+    features: Dict[str, np.ndarray] = {}
+    fallback = history[:, -1]
+    for lag in LAGS:
+        features[f"y_lag_{lag}"] = history[:, -lag] if n >= lag else fallback
+    for w in ROLL_WINDOWS:
+        window = history[:, -w:]
+        features[f"y_roll_mean_{w}"] = window.mean(axis=1)
+        features[f"y_roll_std_{w}"] = (
+            window.std(axis=1, ddof=1) if window.shape[1] >= 2 else np.zeros(len(history))
+        )
+    return features
+
 
-    session = retry(retries=3, backoff_factor=0.5)
+def _fetch_weather_forecast(latitude: float, longitude: float, forecast_days: int) -> pd.DataFrame:
+    try:
+        import openmeteo_requests  # type: ignore
+        from retry_requests import retry  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise RuntimeError("openmeteo-requests / retry-requests not available") from e
+
+    # No client-side retries: the circuit breaker hedges slow or failed calls instead
+    session = retry(retries=0)
     om = openmeteo_requests.Client(session=session)
 
     url = "https://api.open-meteo.com/v1/forecast"
@@ -131,9 +205,40 @@ def _fetch_weather_forecast(latitude: float, longitude: float, forecast_days: in
         "timezone": "auto",
     }
 
-    responses = om.weather_api(url, params=params)
-    daily = responses[0].Daily()
+    with stage_timer("weather_fetch"):
+        responses = OPEN_METEO.call(lambda: om.weather_api(url, params=params))
+    return _daily_weather_frame(responses[0].Daily())
+
+
+def fetch_weather_archive(
+    latitude: float, longitude: float, start_date: pd.Timestamp, end_date: pd.Timestamp
+) -> pd.DataFrame:
+    """Observed daily WEATHER_COLS between two dates (inclusive) from the Open-Meteo archive."""
+    try:
+        import openmeteo_requests  # type: ignore
+        from retry_requests import retry  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise RuntimeError("openmeteo-requests / retry-requests not available") from e
+
+    session = retry(retries=0)
+    om = openmeteo_requests.Client(session=session)
+
+    url = "https://archive-api.open-meteo.com/v1/archive"
+    params = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+        "daily": WEATHER_COLS,
+        "timezone": "auto",
+    }
+
+    with stage_timer("weather_fetch"):
+        responses = OPEN_METEO.call(lambda: om.weather_api(url, params=params))
+    return _daily_weather_frame(responses[0].Daily())
 
+
+def _daily_weather_frame(daily: Any) -> pd.DataFrame:
     dates = pd.date_range(
         start=pd.to_datetime(daily.Time(), unit="s", utc=True),
         end=pd.to_datetime(daily.TimeEnd(), unit="s", utc=True),
@@ -154,6 +259,73 @@ def _fetch_weather_forecast(latitude: float, longitude: float, forecast_days: in
     return df
 
 
+def weather_grid_cell(latitude: float, longitude: float) -> Tuple[float, float]:
+    """Snap coordinates to the weather grid so nearby stores share one forecast."""
+    step = WEATHER_GRID_DEG
+    return (round(round(latitude / step) * step, 4), round(round(longitude / step) * step, 4))
+
+
+_weather_cache: Dict[Tuple[float, float], Tuple[float, List[Dict[str, Any]]]] = {}
+_weather_cache_lock = threading.Lock()
+
+
+def get_shared_weather_rows(latitude: float, longitude: float) -> List[Dict[str, Any]]:
+    """
+    Return the 16-day forecast for the grid cell containing (lat, lon) as
+    JSON-friendly rows (date as YYYY-MM-DD), fetching at most once per cell
+    per WEATHER_CACHE_TTL_SECONDS. When the weather API is unavailable (or
+    its circuit is open) an expired entry is served; raises if there is none.
+    """
+    cell = weather_grid_cell(latitude, longitude)
+    now = time.monotonic()
+    with _weather_cache_lock:
+        hit = _weather_cache.get(cell)
+    if hit is not None and now - hit[0] < WEATHER_CACHE_TTL_SECONDS:
+        return hit[1]
+
+    try:
+        weather_df = _fetch_weather_forecast(latitude=cell[0], longitude=cell[1], forecast_days=16)
+    except Exception:
+        if hit is not None:
+            return hit[1]  # a stale forecast beats the default-weather fallback
+        raise
+    rows = weather_df.to_dict(orient="records")
+    for row in rows:
+        if hasattr(row.get("date"), "strftime"):
+            row["date"] = row["date"].strftime("%Y-%m-%d")
+
+    with _weather_cache_lock:
+        _weather_cache[cell] = (now, rows)
+    return rows
+
+
+def weather_fingerprint(latitude: float, longitude: float) -> str:
+    """
+    Digest of the shared forecast for the cell containing (lat, lon), or
+    "unavailable" when the weather API fails (predictions then use defaults).
+    """
+    try:
+        rows = get_shared_weather_rows(latitude, longitude)
+    except Exception:
+        return "unavailable"
+    raw = json.dumps(rows, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+@lru_cache(maxsize=64)
+def _country_holidays(country_code: str, years: Tuple[int, ...]) -> Any:
+    """Holiday calendars are identical across dishes and stores of a country."""
+    import holidays
+
+    return holidays.country_holidays(country_code, years=list(years))
+
+
+def holiday_flags(dates: Any, country_code: Optional[str]) -> np.ndarray:
+    """1.0 for public holidays of country_code among dates, else 0.0."""
+    local_hols = _country_holidays(country_code, HOLIDAY_YEARS) if country_code else None
+    return np.array([float(int(d in local_hols)) if local_hols is not None else 0.0 for d in dates])
+
+
 def _prepare_future_weather(
     start_date: pd.Timestamp,
     horizon_days: int,
@@ -205,10 +377,72 @@ def _prepare_future_weather(
     return future_weather.sort_values("date").reset_index(drop=True)
 
 
-def predict_dish(
+_geocode_cache: Dict[str, Tuple[Optional[float], Optional[float], Optional[str]]] = {}
+_geocode_cache_lock = threading.Lock()
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "1024"))
+
+
+def _geocode(address: str) -> Tuple[Optional[float], Optional[float], Optional[str]]:
+    """
+    Geocode through the Nominatim circuit breaker. Successful lookups are
+    remembered (addresses do not move), failures return (None, None, None)
+    so callers use their default location.
+    """
+    with _geocode_cache_lock:
+        hit = _geocode_cache.get(address)
+    if hit is not None:
+        return hit
+    try:
+        result = NOMINATIM.call(lambda: geocode_address(address, timeout=NOMINATIM.timeout))
+    except Exception as e:
+        logger.warning("Geocoding unavailable for '%s': %s", address, e)
+        return None, None, None
+    if result[0] is not None:
+        with _geocode_cache_lock:
+            if len(_geocode_cache) >= GEOCODE_CACHE_MAX_ENTRIES:
+                _geocode_cache.pop(next(iter(_geocode_cache)))
+            _geocode_cache[address] = result
+    return result
+
+
+def resolve_location(
+    address: str,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    country_code: Optional[str] = None,
+) -> Tuple[Optional[float], Optional[float], Optional[str]]:
+    """Fill missing lat/lon/country code by geocoding the address."""
+    lat, lon, cc = latitude, longitude, country_code
+    if lat is None or lon is None or not cc:
+        with stage_timer("location_lookup"):
+            lat_geo, lon_geo, cc_geo = _geocode(address)
+        lat = lat if lat is not None else lat_geo
+        lon = lon if lon is not None else lon_geo
+        cc = cc or cc_geo
+    return lat, lon, cc
+
+
+def forecast_start_date(start_date: Optional[str] = None) -> pd.Timestamp:
+    """Explicit start date, else tomorrow (local time)."""
+    if start_date:
+        return pd.to_datetime(start_date).normalize()
+    return pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+
+
+@dataclass
+class ForecastInputs:
+    """Everything a dish forecast needs besides the sales history."""
+    loaded: LoadedDishModel
+    start: pd.Timestamp
+    future_weather: pd.DataFrame  # one row per horizon day
+    prophet_yhat: np.ndarray      # Prophet forecast per horizon day
+    prophet_trend: np.ndarray     # Prophet trend component per horizon day
+    local_hols: Any               # holidays calendar or None
+
+
+def prepare_forecast_inputs(
     store: ModelStore,
     dish: str,
-    recent_sales: List[float],
     horizon_days: int,
     start_date: Optional[str] = None,
     address: str = "Shanghai, China",
@@ -216,29 +450,35 @@ def predict_dish(
     longitude: Optional[float] = None,
     country_code: Optional[str] = None,
     weather_rows: Optional[List[Dict[str, Any]]] = None,
-) -> Dict[str, Any]:
-    if not recent_sales:
-        raise ValueError("recent_sales cannot be empty")
-
+) -> ForecastInputs:
+    """Load the dish model, resolve location/weather and run Prophet for the horizon."""
     if horizon_days < 1 or horizon_days > 30:
         raise ValueError("horizon_days must be in [1, 30]")
 
     loaded = store.get_dish_model(dish)
-    cfg = PipelineConfig()
+    start, future_weather, cc = prepare_forecast_weather(
+        horizon_days, start_date, address, latitude, longitude, country_code, weather_rows,
+    )
+    return build_forecast_inputs(loaded, start, future_weather, cc)
 
-    lat = latitude
-    lon = longitude
-    cc = country_code
-    if lat is None or lon is None or not cc:
-        lat_geo, lon_geo, cc_geo = get_location_details(address)
-        lat = lat if lat is not None else lat_geo
-        lon = lon if lon is not None else lon_geo
-        cc = cc or cc_geo
 
+def prepare_forecast_weather(
+    horizon_days: int,
+    start_date: Optional[str] = None,
+    address: str = "Shanghai, China",
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    country_code: Optional[str] = None,
+    weather_rows: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[pd.Timestamp, pd.DataFrame, Optional[str]]:
+    """(start, future weather, country code) of a forecast, without loading any model."""
+    if horizon_days < 1 or horizon_days > 30:
+        raise ValueError("horizon_days must be in [1, 30]")
+    lat, lon, cc = resolve_location(address, latitude, longitude, country_code)
     if lat is None or lon is None:
         raise RuntimeError("Unable to resolve latitude/longitude")
 
-    start = pd.to_datetime(start_date).normalize() if start_date else pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+    start = forecast_start_date(start_date)
     future_weather = _prepare_future_weather(
         start_date=start,
         horizon_days=horizon_days,
@@ -246,52 +486,268 @@ def predict_dish(
         longitude=float(lon),
         weather_rows=weather_rows,
     )
+    return start, future_weather, cc
+
 
+def build_forecast_inputs(
+    loaded: LoadedDishModel,
+    start: pd.Timestamp,
+    future_weather: pd.DataFrame,
+    country_code: Optional[str] = None,
+) -> ForecastInputs:
+    """Run Prophet over every row of future_weather (date + WEATHER_COLS) and attach holidays."""
     prophet_input = future_weather.rename(columns={"date": "ds"})
-    prophet_pred = loaded.prophet_model.predict(prophet_input[["ds"] + WEATHER_COLS])
+    with stage_timer("prophet_predict"):
+        prophet_pred = loaded.prophet_model.predict(prophet_input[["ds"] + WEATHER_COLS])
     prophet_yhat = prophet_pred["yhat"].astype(float).to_numpy()
+    prophet_trend = prophet_pred["trend"].astype(float).to_numpy()
+
+    local_hols = _country_holidays(country_code, HOLIDAY_YEARS) if country_code else None
+    return ForecastInputs(loaded, start, future_weather, prophet_yhat, prophet_trend, local_hols)
+
+
+def exogenous_features(inputs: ForecastInputs, i: int) -> Dict[str, float]:
+    """Calendar, holiday, weather and Prophet features of horizon day i (no lags)."""
+    row = inputs.future_weather.iloc[i]
+    dt = pd.to_datetime(row["date"])
+    feat: Dict[str, float] = {
+        "day_of_week": float(dt.dayofweek),
+        "month": float(dt.month),
+        "day": float(dt.day),
+        "dayofyear": float(dt.dayofyear),
+        "is_weekend": float(int(dt.dayofweek >= 5)),
+        "is_public_holiday": float(int(dt in inputs.local_hols)) if inputs.local_hols is not None else 0.0,
+        "prophet_yhat": float(inputs.prophet_yhat[i]),
+    }
+    for c in WEATHER_COLS:
+        feat[c] = float(row.get(c, 0.0))
+    return feat
+
+
+def direct_horizon(meta: Dict[str, Any]) -> Optional[int]:
+    """Trained horizon of a dish in direct multi-horizon mode, None for recursive dishes."""
+    if meta.get("forecast_mode") != "direct":
+        return None
+    return int(meta.get("direct_horizon") or 30)
+
+
+def tree_feature_names(meta: Dict[str, Any]) -> List[str]:
+    """Tree-model input columns of a dish, by its registry entry."""
+    return DIRECT_TREE_FEATURES if direct_horizon(meta) else TREE_FEATURES
+
+
+def serves_student(meta: Dict[str, Any]) -> bool:
+    """True when a dish is served by its distilled student (see SERVE_STUDENTS)."""
+    return SERVE_STUDENTS and bool(meta.get("student"))
+
+
+def student_step(
+    student: Dict[str, Any],
+    dates: Any,
+    weather: np.ndarray,
+    is_public_holiday: Any,
+    horizon: Any,
+    lag_feats: Dict[str, np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    predict_student for a batch of rows (paths, scenarios or origins): dates
+    and the holiday flag per row or shared, weather (rows x WEATHER_COLS),
+    the horizon step and lag_feature_matrix() of each row's history.
+    Returns (base, lag_part) per row.
+    """
+    frame = pd.DataFrame({
+        "date": dates,
+        "is_public_holiday": is_public_holiday,
+        "horizon": horizon,
+        **lag_feats,
+        **{col: weather[:, j] for j, col in enumerate(WEATHER_COLS)},
+    })
+    with stage_timer("student_predict"):
+        return predict_student(student, frame)
+
+
+def interval_offsets(meta: Dict[str, Any], step: int, dow: int) -> Tuple[float, float]:
+    """
+    (lower, upper) offsets to add to yhat for horizon step (1-based) on a
+    weekday, looked up in the registry's CV error-quantile table: the
+    (weekday, step) cell when populated, else the step row. Steps past the
+    table use its last row. Registries without a table fall back to +/- MAE.
+    """
+    table = meta.get("error_quantiles")
+    if not table or not table.get("by_step"):
+        mae = float(meta.get("mae") or 0.0)
+        return -mae, mae
+
+    idx = min(step, len(table["by_step"])) - 1
+    cell = None
+    if table.get("by_dow_step"):
+        cell = table["by_dow_step"][dow][idx]
+    # The outermost levels bound the band, whatever interval_quantiles held
+    quantiles = cell or table["by_step"][idx]
+    return float(quantiles[0]), float(quantiles[-1])
+
+
+def _predict_student_dish(
+    dish: str,
+    meta: Dict[str, Any],
+    recent_sales: List[float],
+    horizon_days: int,
+    start_date: Optional[str],
+    address: str,
+    latitude: Optional[float],
+    longitude: Optional[float],
+    country_code: Optional[str],
+    weather_rows: Optional[List[Dict[str, Any]]],
+    feature_rows: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    predict_dish() for a dish with a distilled student. prophet_yhat and
+    residual_hat report the student's base (trend, seasonality, holiday,
+    weather) and lag contributions. feature_rows, if given, receives each
+    day's student input row (date, inputs and the lags actually used).
+    """
+    start, future_weather, cc = prepare_forecast_weather(
+        horizon_days, start_date, address, latitude, longitude, country_code, weather_rows,
+    )
+    dates = pd.to_datetime(future_weather["date"])
 
-    local_hols = holidays.country_holidays(cc, years=cfg.holiday_years) if cc else None
+    student = meta["student"]
+    direct = direct_horizon(meta)
     sales_history = [float(x) for x in recent_sales]
+    lags = _compute_lag_features_from_history(sales_history)
+    frame = future_weather[["date"] + WEATHER_COLS].assign(
+        is_public_holiday=holiday_flags(dates, cc),
+        horizon=np.minimum(np.arange(1, len(dates) + 1), direct or 1).astype(float),
+        **lags,
+    )
+    with stage_timer("student_predict"):
+        base, lag_part = predict_student(student, frame)
 
     rows: List[Dict[str, Any]] = []
-    for i, row in future_weather.iterrows():
-        dt = pd.to_datetime(row["date"])
-        feat: Dict[str, float] = {
-            "day_of_week": float(dt.dayofweek),
-            "month": float(dt.month),
-            "day": float(dt.day),
-            "dayofyear": float(dt.dayofyear),
-            "is_weekend": float(int(dt.dayofweek >= 5)),
-            "is_public_holiday": float(int(dt in local_hols)) if local_hols is not None else 0.0,
-            "prophet_yhat": float(prophet_yhat[i]),
-        }
+    for i, dt in enumerate(dates):
+        if not direct and i > 0:
+            # Recursive: only the lag contribution changes as predictions feed back
+            lags = _compute_lag_features_from_history(sales_history)
+            lag_part[i] = lag_contribution(student, lags)
+            if feature_rows is not None:
+                frame.loc[frame.index[i], list(lags)] = list(lags.values())
+        yhat = max(0.0, float(base[i] + lag_part[i]))
+        lo, hi = interval_offsets(meta, i + 1, int(dt.dayofweek))
+        rows.append({
+            "date": dt.strftime("%Y-%m-%d"),
+            "yhat": yhat,
+            "prophet_yhat": float(base[i]),
+            "residual_hat": float(lag_part[i]),
+            "lower": max(0.0, yhat + lo),
+            "upper": max(0.0, yhat + hi),
+        })
+        sales_history.append(yhat)
 
-        for c in WEATHER_COLS:
-            feat[c] = float(row.get(c, 0.0))
+    if feature_rows is not None:
+        feature_rows.extend(frame.to_dict("records"))
+    return {
+        "dish": dish,
+        "model": meta.get("model"),
+        "model_combo": f"Student[{student['kind']}] of Prophet+{meta.get('model')}",
+        "distilled": True,
+        "horizon_days": horizon_days,
+        "start_date": start.strftime("%Y-%m-%d"),
+        "predictions": rows,
+    }
+
+
+def _prediction_row(
+    inputs: ForecastInputs, meta: Dict[str, Any], i: int, feat: Dict[str, float], resid_hat: float
+) -> Dict[str, Any]:
+    yhat = max(0.0, feat["prophet_yhat"] + resid_hat)
+    lo, hi = interval_offsets(meta, i + 1, int(feat["day_of_week"]))
+    return {
+        "date": pd.to_datetime(inputs.future_weather["date"].iloc[i]).strftime("%Y-%m-%d"),
+        "yhat": yhat,
+        "prophet_yhat": feat["prophet_yhat"],
+        "residual_hat": resid_hat,
+        "lower": max(0.0, yhat + lo),
+        "upper": max(0.0, yhat + hi),
+    }
 
-        feat.update(_compute_lag_features_from_history(sales_history))
 
-        X_one = pd.DataFrame([{k: feat.get(k, 0.0) for k in TREE_FEATURES}])
-        resid_hat = float(loaded.tree_model.predict(X_one)[0])
-        yhat = max(0.0, feat["prophet_yhat"] + resid_hat)
+def predict_dish(
+    store: ModelStore,
+    dish: str,
+    recent_sales: List[float],
+    horizon_days: int,
+    start_date: Optional[str] = None,
+    address: str = "Shanghai, China",
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    country_code: Optional[str] = None,
+    weather_rows: Optional[List[Dict[str, Any]]] = None,
+    feature_rows: Optional[List[Dict[str, float]]] = None,
+) -> Dict[str, Any]:
+    """
+    Recursive Prophet + tree-residual forecast for one dish.
+    Dishes trained in direct mode take the fast path instead: the lags of the
+    forecast origin plus the horizon step, one batched predict for all days.
+    Dishes with a distilled student are served by it (no Prophet or tree
+    artifact is loaded; see serves_student).
+    Pass a list as feature_rows to receive the model input row of each
+    forecast day (used to explain the forecast without recomputing it):
+    tree-model rows, or student rows when the result has "distilled".
+    """
+    if not recent_sales:
+        raise ValueError("recent_sales cannot be empty")
 
-        rows.append(
-            {
-                "date": dt.strftime("%Y-%m-%d"),
-                "yhat": yhat,
-                "prophet_yhat": feat["prophet_yhat"],
-                "residual_hat": resid_hat,
-            }
+    student_meta = store.registry.get(dish, {})
+    if serves_student(student_meta):
+        return _predict_student_dish(
+            dish, student_meta, recent_sales, horizon_days, start_date,
+            address, latitude, longitude, country_code, weather_rows, feature_rows,
         )
-        sales_history.append(yhat)
+
+    inputs = prepare_forecast_inputs(
+        store, dish, horizon_days, start_date, address,
+        latitude, longitude, country_code, weather_rows,
+    )
+    loaded = inputs.loaded
+    meta = store.registry.get(dish, {})
+    sales_history = [float(x) for x in recent_sales]
+    n_days = len(inputs.future_weather)
+
+    rows: List[Dict[str, Any]] = []
+    direct = direct_horizon(meta)
+    if direct:
+        origin_lags = _compute_lag_features_from_history(sales_history)
+        feats = [
+            {**exogenous_features(inputs, i), **origin_lags, "horizon": float(min(i + 1, direct))}
+            for i in range(n_days)
+        ]
+        tree_rows = [{k: feat.get(k, 0.0) for k in DIRECT_TREE_FEATURES} for feat in feats]
+        if feature_rows is not None:
+            feature_rows.extend(tree_rows)
+        with stage_timer("tree_predict"):
+            resid_hats = loaded.tree_model.predict(pd.DataFrame(tree_rows, columns=DIRECT_TREE_FEATURES))
+        for i, (feat, resid_hat) in enumerate(zip(feats, resid_hats)):
+            rows.append(_prediction_row(inputs, meta, i, feat, float(resid_hat)))
+    else:
+        for i in range(n_days):
+            feat = exogenous_features(inputs, i)
+            feat.update(_compute_lag_features_from_history(sales_history))
+
+            tree_row = {k: feat.get(k, 0.0) for k in TREE_FEATURES}
+            if feature_rows is not None:
+                feature_rows.append(tree_row)
+            X_one = pd.DataFrame([tree_row])
+            with stage_timer("tree_predict"):
+                resid_hat = float(loaded.tree_model.predict(X_one)[0])
+            rows.append(_prediction_row(inputs, meta, i, feat, resid_hat))
+            sales_history.append(rows[-1]["yhat"])
 
     return {
         "dish": dish,
         "model": loaded.champion,
         "model_combo": f"Prophet+{loaded.champion}",
         "horizon_days": horizon_days,
-        "start_date": start.strftime("%Y-%m-%d"),
+        "start_date": inputs.start.strftime("%Y-%m-%d"),
         "predictions": rows,
     }
 
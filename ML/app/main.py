@@ -1,18 +1,69 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import os
 import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import asynccontextmanager
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Literal, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
+import joblib
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 
-from app.inference import ModelStore, create_store_from_env, predict_dish
+from app import cold_start, inference
+from app.admission import PREDICT_LANE, PREDICT_PATHS, AdmissionMiddleware, AdmissionRejected
+from app.inference import (
+    ModelStore,
+    create_store_from_env,
+    forecast_start_date,
+    get_shared_weather_rows,
+    predict_dish,
+    resolve_location,
+    safe_filename,
+    weather_fingerprint,
+)
+from app.backfill import backfill_origins, iter_backfill
+from app.deadline import Deadline
+from app.etag import attach as attach_etag, conditional, make_etag
+from app.events import TERMINAL_EVENTS, check_callback_url, format_sse
+from app.explain import explain_dish
+from app.forecast_cache import ForecastCache
+from app.materialized import MATERIALIZED_HORIZON_DAYS, MaterializedForecasts
+from app.metrics import (
+    DISHES_PREDICTED,
+    REQUEST_SECONDS,
+    REQUESTS_IN_FLIGHT,
+    gauge,
+    render_latest,
+    stage_timer,
+)
+from app.probabilistic import DEFAULT_QUANTILES, sample_dish_paths
+from app.profiling import check_debug_token, load_profile, start_if_requested
+from app.resilience import breaker_states
+from app.routing import CLUSTER, ROUTED_HEADER, StoreRoutingMiddleware
+from app.scenarios import forecast_store_scenarios
+from app.serialization import (
+    columnar_response,
+    dish_to_columnar,
+    dumps_json,
+    negotiate_media_type,
+    store_to_columnar,
+)
 from app.store_manager import StoreModelManager
 
+logger = logging.getLogger(__name__)
+
 
 store: Optional[ModelStore] = None
 manager: Optional[StoreModelManager] = None
+forecast_cache = ForecastCache(max_entries=int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "2048")))
+materialized = MaterializedForecasts()
 
 
 @asynccontextmanager
@@ -25,8 +76,8 @@ async def lifespan(app: FastAPI):
         store = None  # No global models yet, that's OK
 
     # Store-aware manager
-    import os
     manager = StoreModelManager(base_model_dir=os.getenv("MODEL_DIR", "models"))
+    _start_materialize_schedule()
     yield
 
 
@@ -37,6 +88,71 @@ app = FastAPI(
 )
 
 
+# Admission control: predict endpoints share a bounded lane; /health and
+# /metrics have no lane and are served on the event loop, so they stay
+# responsive when the threadpool is saturated.
+app.add_middleware(AdmissionMiddleware, routes=[(PREDICT_PATHS, PREDICT_LANE)])
+# Store routing (added after admission, so it wraps it): requests for stores
+# another node owns leave before taking an admission slot here. The
+# track_requests wrapper below is registered later and sits outside both.
+# Only /store/{id}/... paths are routed here; the multi-store endpoints split
+# their store ids by owner themselves. No-op unless ML_CLUSTER_NODES and
+# ML_NODE_ID are set.
+app.add_middleware(StoreRoutingMiddleware, cluster=CLUSTER)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    return exc.to_response()
+
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    request.state.received_at = time.monotonic()  # deadline budgets start here
+    REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=getattr(route, "path", "unmatched"),
+            method=request.method,
+            status=str(status),
+        )
+
+
+def _cache_stat(key: str) -> float:
+    return float(manager.cache_stats()[key]) if manager is not None else 0.0
+
+
+gauge("smartsus_ml_loaded_stores", "Stores whose registry is loaded in memory.",
+      lambda: _cache_stat("loaded_stores"))
+gauge("smartsus_ml_cached_dish_models", "Dish model pairs (Prophet + tree) held in memory.",
+      lambda: _cache_stat("cached_dish_models") + (len(store._cache) if store is not None else 0))
+gauge("smartsus_ml_stores_training", "Stores currently training.",
+      lambda: _cache_stat("stores_training"))
+gauge("smartsus_ml_training_queue_depth", "Stores waiting in the training queue.",
+      lambda: _cache_stat("training_queue_depth"))
+gauge("smartsus_ml_predict_lane_active", "Predict requests holding an admission slot.",
+      lambda: float(PREDICT_LANE.active))
+gauge("smartsus_ml_predict_lane_waiting", "Predict requests waiting for an admission slot.",
+      lambda: float(PREDICT_LANE.waiting))
+gauge("smartsus_ml_forecast_cache_entries", "Store forecasts held for stale-while-revalidate.",
+      lambda: float(len(forecast_cache)))
+gauge("smartsus_ml_training_event_subscribers", "Open /store/{id}/events streams.",
+      lambda: float(manager.events.subscriber_count()) if manager is not None else 0.0)
+gauge("smartsus_ml_store_metadata_entries", "Stores with cached coordinates / country code.",
+      lambda: _cache_stat("store_metadata_entries"))
+gauge("smartsus_ml_weather_cache_entries", "Weather grid cells with a cached forecast.",
+      lambda: float(len(inference._weather_cache)))
+
+
 class PredictRequest(BaseModel):
     dish: str = Field(..., description="Dish name that exists in champion_registry.pkl")
     recent_sales: List[float] = Field(..., min_length=1, description="Recent daily sales history")
@@ -50,6 +166,10 @@ class PredictRequest(BaseModel):
         None,
         description="Optional custom weather list for horizon dates",
     )
+    layout: Literal["records", "columnar"] = Field(
+        "records",
+        description="'columnar' returns one array per column (compact, encoded via Accept header)",
+    )
 
 
 class PredictResponse(BaseModel):
@@ -62,7 +182,7 @@ class PredictResponse(BaseModel):
 
 
 @app.get("/health")
-def health() -> Dict[str, Any]:
+async def health() -> Dict[str, Any]:
     """Health check endpoint for ALB/ECS."""
     dishes_count = 0
     if store is not None:
@@ -71,33 +191,103 @@ def health() -> Dict[str, Any]:
         "status": "ok",
         "dishes": dishes_count,
         "manager_ready": manager is not None,
+        "upstreams": breaker_states(),
+        "node_id": CLUSTER.node_id,
     }
 
 
+@app.get("/cluster")
+async def cluster(store_id: Optional[int] = None) -> Dict[str, Any]:
+    """Cluster membership, routing mode and (with ?store_id=) the owning node."""
+    return CLUSTER.describe(store_id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/dishes")
-def dishes() -> Dict[str, List[str]]:
+def dishes(request: Request, response: Response) -> Any:
     if store is None:
         raise HTTPException(status_code=503, detail="Model store not initialized")
-    return {"dishes": store.list_dishes()}
+    etag = make_etag("dishes", store.version)
+    return conditional(request, etag) or attach_etag({"dishes": store.list_dishes()}, response, etag)
+
+
+def _representation(layout: str, request: Request) -> str:
+    """Columnar bodies are encoded per Accept, so it is part of the ETag."""
+    if layout == "columnar":
+        return negotiate_media_type(request.headers.get("accept"))
+    return "records"
+
+
+def _run_profiled(request: Request, response: Response, label: str, fn: Callable[[], Any]) -> Any:
+    """Run fn, under the debug profiler when the request asks for it (see app.profiling)."""
+    profile = start_if_requested(request, label)
+    if profile is None:
+        return fn()
+    with profile:
+        result = fn()
+    target = result if isinstance(result, Response) else response
+    target.headers["X-Profile-Id"] = profile.profile_id
+    return result
+
+
+@app.get("/debug/profiles/{profile_id}")
+def debug_profile(profile_id: str, request: Request, format: str = "json") -> Any:
+    """Fetch a stored request profile: JSON summary or collapsed flame-graph stacks."""
+    check_debug_token(request)
+    data = load_profile(profile_id, format)
+    if format == "collapsed":
+        return PlainTextResponse(data)
+    return data
 
 
 @app.post("/predict", response_model=PredictResponse)
-def predict(req: PredictRequest) -> Dict[str, Any]:
+def predict(req: PredictRequest, request: Request, response: Response) -> Dict[str, Any]:
+    return _run_profiled(
+        request, response, f"predict:{req.dish}", lambda: _predict(req, request, response)
+    )
+
+
+def _predict(req: PredictRequest, request: Request, response: Response) -> Any:
     if store is None:
         raise HTTPException(status_code=503, detail="Model store not initialized")
+    if req.dish not in store.registry:
+        raise HTTPException(status_code=404, detail=f"Dish not found in registry: {req.dish}")
+
+    # Resolve every input up front so the ETag can be decided before any model runs
+    lat, lon, cc = resolve_location(req.address, req.latitude, req.longitude, req.country_code)
+    weather_rows = req.weather_rows
+    if weather_rows is None and lat is not None and lon is not None:
+        try:
+            weather_rows = get_shared_weather_rows(float(lat), float(lon))
+        except Exception as e:
+            logger.warning("Weather API failed for /predict (%s), using fallback", e)
+
+    etag = make_etag(
+        "predict", store.version, req.model_dump(exclude={"weather_rows"}),
+        weather_rows, forecast_start_date(req.start_date).strftime("%Y-%m-%d"),
+        _representation(req.layout, request),
+    )
+    cached = conditional(request, etag)
+    if cached is not None:
+        return cached
 
     try:
-        return predict_dish(
+        result = predict_dish(
             store=store,
             dish=req.dish,
             recent_sales=req.recent_sales,
             horizon_days=req.horizon_days,
             start_date=req.start_date,
             address=req.address,
-            latitude=req.latitude,
-            longitude=req.longitude,
-            country_code=req.country_code,
-            weather_rows=req.weather_rows,
+            latitude=lat,
+            longitude=lon,
+            country_code=cc,
+            weather_rows=weather_rows,
         )
     except KeyError as e:
         raise HTTPException(status_code=404, detail=str(e)) from e
@@ -106,6 +296,11 @@ def predict(req: PredictRequest) -> Dict[str, Any]:
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
+    if req.layout == "columnar":
+        payload = {"dish": result["dish"], **dish_to_columnar(result)}
+        return attach_etag(columnar_response(payload, request.headers.get("accept")), response, etag)
+    return attach_etag(result, response, etag)
+
 
 # =====================================================================
 # Store-aware endpoints (called by .NET backend)
@@ -118,14 +313,40 @@ class StorePredictRequest(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     country_code: Optional[str] = None
+    layout: Literal["records", "columnar"] = Field(
+        "records",
+        description="'columnar' returns one array per column (compact, encoded via Accept header)",
+    )
+    timeout_ms: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Time budget; dishes not started in time are listed in skipped_dishes (also X-Request-Timeout-Ms)",
+    )
+    provisional: bool = Field(
+        True,
+        description="Serve a cold-start forecast (status 'provisional') while the store is training or has too little data",
+    )
+    cache_policy: Optional[str] = Field(
+        None,
+        description="Serve the cached forecast stale-while-revalidate using this FORECAST_SWR_POLICIES entry (e.g. 'dashboard')",
+    )
+    max_stale_seconds: Optional[float] = Field(
+        None, ge=0, description="Tighten the policy's staleness bound for this call"
+    )
 
 
 class StorePredictResponse(BaseModel):
     store_id: int
-    status: str  # "ok" | "training" | "insufficient_data" | "error"
+    status: str  # "ok" | "partial" | "provisional" | "training" | "insufficient_data" | "error"
     message: Optional[str] = None
     days_available: Optional[int] = None
     predictions: Optional[Dict[str, Any]] = None  # dish -> predictions
+    skipped_dishes: Optional[List[str]] = None  # set when status == "partial"
+    cached: Optional[bool] = None  # served from the forecast cache
+    materialized: Optional[bool] = None  # served from the nightly materialized forecasts
+    provisional: Optional[bool] = None  # status "provisional": cold-start forecast, full models not available yet
+    provisional_reason: Optional[str] = None  # "training" | "insufficient_data"
+    age_seconds: Optional[float] = None  # age of the served forecast
 
 
 class TrainingProgressResponse(BaseModel):
@@ -144,6 +365,25 @@ class StoreStatusResponse(BaseModel):
     training_progress: Optional[TrainingProgressResponse] = None
 
 
+@app.get("/store/{store_id}/metadata")
+def store_metadata(store_id: int) -> Dict[str, Any]:
+    """Cached coordinates, country code and weather grid cell of a store."""
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+    return manager.get_store_metadata(store_id).to_dict()
+
+
+@app.delete("/store/{store_id}/metadata")
+def store_metadata_invalidate(store_id: int) -> Dict[str, Any]:
+    """Invalidation hook: call after a store's location changes."""
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+    dropped = manager.store_metadata.invalidate(store_id)
+    # Forecasts computed with the old coordinates are keyed without them
+    forecast_cache.invalidate(lambda key: key[0] == store_id)
+    return {"store_id": store_id, "invalidated": bool(dropped)}
+
+
 @app.get("/store/{store_id}/status", response_model=StoreStatusResponse)
 def store_status(store_id: int) -> Dict[str, Any]:
     """Check if models exist for a store, and how much data is available."""
@@ -159,13 +399,16 @@ def store_status(store_id: int) -> Dict[str, Any]:
         if ms:
             dishes = ms.list_dishes()
 
-    # Check available data — gracefully handle DB failures
+    # Check available data — gracefully handle DB failures. While training,
+    # callers poll this: the count the run fetched (or a short-lived cache) is used.
     days_available = None
     try:
-        _, days_available = manager.fetch_store_sales(store_id)
+        if is_training:
+            days_available = manager.cached_sales_days(store_id)
+        else:
+            _, days_available = manager.fetch_store_sales(store_id)
     except Exception as e:
-        import logging
-        logging.getLogger(__name__).warning(
+        logger.warning(
             "Could not fetch sales data for store %d: %s", store_id, e
         )
 
@@ -186,16 +429,33 @@ def store_status(store_id: int) -> Dict[str, Any]:
     }
 
 
+class StoreTrainRequest(BaseModel):
+    callback_url: Optional[str] = Field(
+        None,
+        description="POSTed the terminal training event (completed / error / insufficient_data); "
+                    "http(s) only, host must be in TRAINING_CALLBACK_ALLOWED_HOSTS",
+    )
+
+
 @app.post("/store/{store_id}/train")
-def store_train(store_id: int) -> Dict[str, Any]:
+def store_train(store_id: int, req: Optional[StoreTrainRequest] = None) -> Dict[str, Any]:
     """
     Trigger model training for a store.
-    Returns immediately; training runs in a background thread.
+    Returns immediately; training runs in a background thread. Progress is
+    pushed on /store/{store_id}/events and, with callback_url, the outcome
+    is POSTed there when training ends.
     """
     if manager is None:
         raise HTTPException(status_code=503, detail="Manager not initialized")
+    callback_url = req.callback_url if req is not None else None
+    if callback_url:
+        try:
+            check_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
 
     if manager.is_training(store_id):
+        manager.enqueue_training(store_id, callback_url)  # only registers the callback
         return {"status": "already_training", "store_id": store_id}
 
     # Quick data check
@@ -218,31 +478,73 @@ def store_train(store_id: int) -> Dict[str, Any]:
             },
         )
 
-    # Start training in background
-    thread = threading.Thread(
-        target=manager.train_store_models, args=(store_id,), daemon=True
-    )
-    thread.start()
+    # Queue training in background (AdmissionRejected -> 503 when the queue is full)
+    manager.enqueue_training(store_id, callback_url)
 
     return {
         "status": "training_started",
         "store_id": store_id,
-        "message": "Model training started in background. Poll /store/{store_id}/status to check progress.",
+        "message": f"Model training started in background. Follow /store/{store_id}/events for progress.",
     }
 
 
-@app.post("/store/{store_id}/predict", response_model=StorePredictResponse)
-def store_predict(store_id: int, req: StorePredictRequest) -> Dict[str, Any]:
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+
+
+@app.get("/store/{store_id}/events")
+async def store_events(store_id: int, request: Request) -> StreamingResponse:
     """
-    Generate predictions for ALL dishes of a store.
-    - If models exist → predict immediately
-    - If no models & data < 100 days → return insufficient_data
-    - If no models & data >= 100 days → trigger training & return training status
+    Server-sent events for a store's training: the current state first
+    ("idle" when nothing is queued or running), then "queued" / "progress"
+    events as they happen. The stream ends after a terminal event
+    (completed / error / insufficient_data) or right after "idle".
     """
     if manager is None:
         raise HTTPException(status_code=503, detail="Manager not initialized")
 
-    # Check if training is in progress
+    sub, last = manager.events.subscribe(store_id)
+    _, queue = sub
+
+    async def generate() -> AsyncIterator[str]:
+        try:
+            if manager.is_training(store_id) and last is not None and last["type"] not in TERMINAL_EVENTS:
+                yield format_sse(last)
+            elif manager.is_training(store_id):
+                yield format_sse({"type": "queued", "store_id": store_id, "ts": time.time()})
+            else:
+                yield format_sse({
+                    "type": "idle", "store_id": store_id, "ts": time.time(),
+                    "has_models": manager.has_models(store_id),
+                    "last_event": last,
+                })
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            manager.events.unsubscribe(store_id, sub)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _store_not_ready(store_id: int, trigger_training: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Return a status payload when a store cannot be predicted yet, else None.
+    Triggers background training when enough data exists but no models do
+    (unless trigger_training is False).
+    """
     if manager.is_training(store_id):
         return {
             "store_id": store_id,
@@ -250,104 +552,146 @@ def store_predict(store_id: int, req: StorePredictRequest) -> Dict[str, Any]:
             "message": "Model training in progress. Please retry later.",
         }
 
-    # Check if models exist
-    ms = manager.get_store(store_id)
-    if ms is None:
-        # No models — check data availability
-        try:
-            _, days_available = manager.fetch_store_sales(store_id)
-        except Exception as e:
-            return {
-                "store_id": store_id,
-                "status": "error",
-                "message": f"Cannot connect to database to check sales data: {e}",
-                "days_available": 0,
-            }
+    if manager.get_store(store_id) is not None:
+        return None
 
-        if days_available < StoreModelManager.MIN_TRAINING_DAYS:
-            return {
-                "store_id": store_id,
-                "status": "insufficient_data",
-                "message": f"Need at least {StoreModelManager.MIN_TRAINING_DAYS} days of sales data to train models. Currently have {days_available} days.",
-                "days_available": days_available,
-            }
+    # No models — check data availability
+    try:
+        _, days_available = manager.fetch_store_sales(store_id)
+    except Exception as e:
+        return {
+            "store_id": store_id,
+            "status": "error",
+            "message": f"Cannot connect to database to check sales data: {e}",
+            "days_available": 0,
+        }
 
-        # Enough data — trigger training
-        thread = threading.Thread(
-            target=manager.train_store_models, args=(store_id,), daemon=True
-        )
-        thread.start()
+    if days_available < StoreModelManager.MIN_TRAINING_DAYS:
         return {
             "store_id": store_id,
-            "status": "training",
-            "message": "No models found. Training started. Please retry in a few minutes.",
+            "status": "insufficient_data",
+            "message": f"Need at least {StoreModelManager.MIN_TRAINING_DAYS} days of sales data to train models. Currently have {days_available} days.",
+            "days_available": days_available,
         }
 
-    # Models exist — predict all dishes
-    dishes = ms.list_dishes()
+    if not trigger_training:
+        return {
+            "store_id": store_id,
+            "status": "no_models",
+            "message": "No models found for this store.",
+            "days_available": days_available,
+        }
+
+    # Enough data — queue training (AdmissionRejected -> 503 when the queue is full)
+    manager.enqueue_training(store_id)
+    return {
+        "store_id": store_id,
+        "status": "training",
+        "message": "No models found. Training started. Please retry in a few minutes.",
+    }
+
+
+def _resolve_store_location(
+    store_id: int, req: StorePredictRequest
+) -> Tuple[Optional[float], Optional[float], Optional[str]]:
+    """Use request coordinates when given, filling the gaps from the Store table."""
     lat = req.latitude
     lon = req.longitude
     cc = req.country_code
 
     if lat is None or lon is None or not cc:
-        db_lat, db_lon, db_cc = manager.fetch_store_location(store_id)
+        db_lat, db_lon, db_cc = manager.get_store_metadata(store_id).location
         lat = lat or db_lat
         lon = lon or db_lon
         cc = cc or db_cc
+    return lat, lon, cc
 
-    # Fetch weather ONCE for all dishes (avoid 17x duplicate API calls)
-    shared_weather_rows = None
-    if lat is not None and lon is not None:
-        try:
-            from app.inference import _fetch_weather_forecast
-            weather_df = _fetch_weather_forecast(
-                latitude=float(lat),
-                longitude=float(lon),
-                forecast_days=min(16, req.horizon_days + 2),
-            )
-            shared_weather_rows = weather_df.to_dict(orient="records")
-            # Convert dates to string for JSON serialization
-            for row in shared_weather_rows:
-                if hasattr(row.get("date"), "strftime"):
-                    row["date"] = row["date"].strftime("%Y-%m-%d")
-            import logging
-            logging.getLogger(__name__).info(
-                "Store %d: Fetched weather once for %d days, sharing across %d dishes",
-                store_id, len(shared_weather_rows), len(dishes),
-            )
-        except Exception as e:
-            import logging
-            logging.getLogger(__name__).warning(
-                "Store %d: Weather API failed (%s), predictions will use fallback",
-                store_id, e,
-            )
 
-    all_predictions: Dict[str, Any] = {}
+def _fetch_shared_weather(
+    store_id: int,
+    lat: Optional[float],
+    lon: Optional[float],
+    n_dishes: int,
+) -> Optional[List[Dict[str, Any]]]:
+    """Fetch weather ONCE for all dishes (avoid 17x duplicate API calls)."""
+    if lat is None or lon is None:
+        return None
+    try:
+        rows = get_shared_weather_rows(float(lat), float(lon))
+        logger.info(
+            "Store %d: Fetched weather once for %d days, sharing across %d dishes",
+            store_id, len(rows), n_dishes,
+        )
+        return rows
+    except Exception as e:
+        logger.warning(
+            "Store %d: Weather API failed (%s), predictions will use fallback",
+            store_id, e,
+        )
+        return None
 
-    for dish in dishes:
-        try:
-            # Get recent sales from stored data
-            recent_sales_path = ms.model_dir / f"recent_sales_{dish.replace(' ', '_').replace('-', '_').replace('/', '_')}.pkl"
-            if recent_sales_path.exists():
-                import joblib
-                recent_df = joblib.load(str(recent_sales_path))
-                recent_sales = recent_df["sales"].astype(float).tolist()
+
+def _recent_sales_loader(store_id: int, ms: ModelStore) -> Callable[[str], List[float]]:
+    """
+    Return dish -> recent daily sales, read from the stored recent_sales file
+    or, failing that, from the DB (fetched at most once per store).
+    """
+    db: Dict[str, Any] = {}
+
+    def recent_sales_for(dish: str) -> List[float]:
+        recent_sales_path = ms.model_dir / f"recent_sales_{safe_filename(dish)}.pkl"
+        if recent_sales_path.exists():
+            recent_df = joblib.load(str(recent_sales_path))
+            recent_sales = recent_df["sales"].astype(float).tolist()
+        else:
+            # Fallback: fetch from DB (once per store, not once per dish)
+            if "sales" not in db:
+                db["sales"], _ = manager.fetch_store_sales(store_id)
+            db_sales = db["sales"]
+            if db_sales is not None:
+                dish_sales = db_sales[db_sales["dish"] == dish].sort_values("date").tail(28)
+                recent_sales = dish_sales["sales"].astype(float).tolist()
             else:
-                # Fallback: fetch from DB
-                df, _ = manager.fetch_store_sales(store_id)
-                if df is not None:
-                    dish_sales = df[df["dish"] == dish].sort_values("date").tail(28)
-                    recent_sales = dish_sales["sales"].astype(float).tolist()
-                else:
-                    recent_sales = [0.0] * 14  # Last resort
+                recent_sales = [0.0] * 14  # Last resort
+        return recent_sales or [0.0] * 14
+
+    return recent_sales_for
 
-            if not recent_sales:
-                recent_sales = [0.0] * 14
 
+def _iter_store_predictions(
+    store_id: int,
+    ms: ModelStore,
+    req: StorePredictRequest,
+    shared_weather_rows: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yield (dish, prediction) pairs one dish at a time.
+    Failures are yielded as {"error": ...} so one bad dish never aborts the store.
+    Pass shared_weather_rows to reuse weather fetched for several stores.
+    With a deadline, stops before the first dish that no longer fits the budget;
+    callers treat dishes that were never yielded as skipped.
+    """
+    dishes = ms.list_dishes()
+    lat, lon, cc = _resolve_store_location(store_id, req)
+    if shared_weather_rows is None:
+        shared_weather_rows = _fetch_shared_weather(store_id, lat, lon, len(dishes))
+
+    recent_sales_for = _recent_sales_loader(store_id, ms)
+
+    for dish in dishes:
+        if deadline is not None and deadline.should_stop():
+            logger.info(
+                "Store %d: deadline reached (cancelled=%s), stopping before '%s'",
+                store_id, deadline.cancelled, dish,
+            )
+            return
+        dish_started = time.perf_counter()
+        try:
             result = predict_dish(
                 store=ms,
                 dish=dish,
-                recent_sales=recent_sales,
+                recent_sales=recent_sales_for(dish),
                 horizon_days=req.horizon_days,
                 address=req.address or "Shanghai, China",
                 latitude=lat,
@@ -355,12 +699,872 @@ def store_predict(store_id: int, req: StorePredictRequest) -> Dict[str, Any]:
                 country_code=cc,
                 weather_rows=shared_weather_rows,
             )
-            all_predictions[dish] = result
+            DISHES_PREDICTED.inc(outcome="ok")
         except Exception as e:
-            all_predictions[dish] = {"error": str(e)}
+            DISHES_PREDICTED.inc(outcome="error")
+            result = {"error": str(e)}
+        if deadline is not None:
+            deadline.record(time.perf_counter() - dish_started)
+        yield dish, result
+
 
+@app.post("/store/{store_id}/predict", response_model=StorePredictResponse)
+def store_predict(
+    store_id: int, req: StorePredictRequest, request: Request, response: Response
+) -> Dict[str, Any]:
+    """
+    Generate predictions for ALL dishes of a store.
+    - If models exist → predict immediately
+    - If no models & data < 100 days → return insufficient_data
+    - If no models & data >= 100 days → trigger training & return training status
+    """
+    return _run_profiled(
+        request, response, f"store_predict:{store_id}",
+        lambda: _store_predict(store_id, req, request, response),
+    )
+
+
+def _store_predict(
+    store_id: int, req: StorePredictRequest, request: Request, response: Response
+) -> Any:
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+
+    not_ready = _store_not_ready(store_id)
+    if not_ready is not None:
+        if req.provisional and not_ready["status"] in ("training", "insufficient_data"):
+            provisional = _provisional_payload(store_id, req, not_ready)
+            if provisional is not None:
+                return _render_store_payload(provisional, req, request)
+        return not_ready
+
+    # Models exist — predict all dishes
+    ms = manager.get_store(store_id)
+    cache_key = _forecast_cache_key(store_id, ms, req)
+
+    if req.cache_policy:
+        try:
+            policy = forecast_cache.policy(req.cache_policy, req.max_stale_seconds)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        entry = forecast_cache.get(cache_key)
+        if entry is not None and entry.age() <= policy.max_stale:
+            if entry.age() > policy.soft_ttl:
+                forecast_cache.refresh_in_background(
+                    cache_key, lambda: _compute_store_payload(store_id, ms, req)
+                )
+            # The served body is the cached one, so tag that rather than current inputs
+            etag = make_etag("store_predict:cached", cache_key, entry.computed_at,
+                             _representation(req.layout, request))
+            not_modified = conditional(request, etag)
+            if not_modified is not None:
+                return not_modified
+            payload = {**entry.payload, "cached": True, "age_seconds": round(entry.age(), 1)}
+            return attach_etag(_render_store_payload(payload, req, request), response, etag)
+
+    inputs_tag = _store_inputs_tag(store_id, ms, req)
+    etag = make_etag(inputs_tag, req.horizon_days, _representation(req.layout, request))
+    not_modified = conditional(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    payload = _read_materialized(store_id, inputs_tag, req.horizon_days)
+    if payload is None:
+        deadline = Deadline.from_request(request, req.timeout_ms)
+        payload = _compute_store_payload(store_id, ms, req, deadline)
+    if payload["status"] != "ok":
+        etag = None  # a partial forecast is not a complete representation
+    else:
+        forecast_cache.put(cache_key, payload)
+    if req.cache_policy:
+        payload = {**payload, "cached": False, "age_seconds": 0.0}
+    return attach_etag(_render_store_payload(payload, req, request), response, etag)
+
+
+@app.post("/store/{store_id}/predict/write")
+def store_predict_write(store_id: int, req: StorePredictRequest, request: Request) -> Dict[str, Any]:
+    """
+    Forecast a store and write the batch straight into ForecastData (see
+    StoreModelManager.write_forecasts) instead of returning it; only a
+    summary comes back. A fresh materialized forecast is used when there is
+    one. When the deadline cuts the forecast short, the dishes that finished
+    are written and the rest are listed in skipped_dishes.
+    """
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+
+    not_ready = _store_not_ready(store_id)
+    if not_ready is not None:
+        return not_ready
+
+    started = time.perf_counter()
+    ms = manager.get_store(store_id)
+    payload = _read_materialized(store_id, _store_inputs_tag(store_id, ms, req), req.horizon_days)
+    source = "materialized"
+    if payload is None:
+        payload = _compute_store_payload(store_id, ms, req, Deadline.from_request(request, req.timeout_ms))
+        source = "computed"
+    if payload["status"] == "ok":
+        forecast_cache.put(_forecast_cache_key(store_id, ms, req), payload)
+
+    try:
+        summary = manager.write_forecasts(store_id, payload["predictions"])
+    except Exception as e:
+        logger.error("Store %d: forecast write failed: %s", store_id, e)
+        raise HTTPException(
+            status_code=503,
+            detail={"status": "error", "message": f"Forecast write failed: {e}"},
+        ) from e
     return {
         "store_id": store_id,
-        "status": "ok",
+        "status": payload["status"],
+        "source": source,
+        **summary,
+        "skipped_dishes": payload.get("skipped_dishes", []),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+    }
+
+
+def _provisional_payload(
+    store_id: int, req: StorePredictRequest, not_ready: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """
+    Cold-start forecast for a store without usable models (see app.cold_start),
+    or None when there is no sales history to fit it on. Its status is
+    "provisional", never "ok", so callers that store "ok" forecasts skip it.
+
+    The result is kept in the forecast cache for as long as the store's state
+    (training, or the same days of data) and the start date stay the same, so
+    polling a training store neither re-reads its sales nor refits.
+    """
+    start = forecast_start_date()
+    cache_key = (
+        store_id, "cold_start", not_ready["status"], not_ready.get("days_available"),
+        req.horizon_days, start.strftime("%Y-%m-%d"),
+    )
+    entry = forecast_cache.get(cache_key)
+    if entry is not None:
+        return entry.payload
+
+    sales, days_available = manager.fetch_store_sales(store_id)
+    if sales is None or sales.empty:
+        return None
+    with stage_timer("cold_start_fit"):
+        predictions = cold_start.forecast_store(sales, req.horizon_days, start)
+    payload = {
+        "store_id": store_id,
+        "status": "provisional",
+        "predictions": predictions,
+        "provisional": True,
+        "provisional_reason": not_ready["status"],
+        "message": not_ready.get("message"),
+        "days_available": days_available,
+    }
+    forecast_cache.put(cache_key, payload)
+    return payload
+
+
+def _store_inputs_tag(store_id: int, ms: ModelStore, req: StorePredictRequest) -> str:
+    """
+    Hash of everything a store forecast depends on except the horizon,
+    computed without loading or running any model: registry version,
+    recent-sales files (or the SalesData watermark for dishes that read sales
+    from the DB), the shared weather forecast, resolved location and start
+    date. Used for ETags and to validate materialized forecasts.
+    """
+    lat, lon, cc = _resolve_store_location(store_id, req)
+    sales_state, db_dishes = ms.recent_sales_state()
+    watermark = manager.fetch_sales_watermark(store_id) if db_dishes else None
+    weather = (
+        weather_fingerprint(float(lat), float(lon)) if lat is not None and lon is not None else None
+    )
+    # The address only matters when it has to be geocoded
+    address = req.address if lat is None or lon is None else None
+    return make_etag(
+        "store_inputs", store_id, ms.version, sorted(sales_state.items()), watermark, weather,
+        address, lat, lon, cc, forecast_start_date().strftime("%Y-%m-%d"),
+    )
+
+
+def _read_materialized(store_id: int, inputs_tag: str, horizon_days: int) -> Optional[Dict[str, Any]]:
+    try:
+        predictions = materialized.read_store(store_id, inputs_tag, horizon_days)
+    except Exception as e:
+        logger.warning("Store %d: materialized forecast unreadable (%s), computing live", store_id, e)
+        return None
+    if predictions is None:
+        return None
+    return {"store_id": store_id, "status": "ok", "predictions": predictions, "materialized": True}
+
+
+def _forecast_cache_key(store_id: int, ms: ModelStore, req: StorePredictRequest) -> Tuple[Any, ...]:
+    """Everything that changes the numbers: model version, request parameters, start date."""
+    return (
+        store_id, ms.version, req.horizon_days,
+        req.address, req.latitude, req.longitude, req.country_code,
+        # A forecast cached yesterday starts a day in the past today
+        forecast_start_date(None).strftime("%Y-%m-%d"),
+    )
+
+
+def _compute_store_payload(
+    store_id: int,
+    ms: ModelStore,
+    req: StorePredictRequest,
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
+    """Predict every dish of a store; status is "partial" when the deadline cut it short."""
+    all_predictions: Dict[str, Any] = dict(
+        _iter_store_predictions(store_id, ms, req, deadline=deadline)
+    )
+    skipped = [d for d in ms.list_dishes() if d not in all_predictions]
+
+    payload: Dict[str, Any] = {
+        "store_id": store_id,
+        "status": "partial" if skipped else "ok",
         "predictions": all_predictions,
     }
+    if skipped:
+        payload["skipped_dishes"] = skipped
+    return payload
+
+
+def _render_store_payload(payload: Dict[str, Any], req: StorePredictRequest, request: Request) -> Any:
+    if req.layout == "columnar":
+        extra = {k: v for k, v in payload.items() if k not in ("store_id", "status", "predictions")}
+        columnar = store_to_columnar(payload["store_id"], payload["status"], payload["predictions"], **extra)
+        return columnar_response(columnar, request.headers.get("accept"))
+    return payload
+
+
+def _ndjson_line(record: Dict[str, Any]) -> bytes:
+    with stage_timer("serialization"):
+        return dumps_json(record) + b"\n"
+
+
+@app.post("/store/{store_id}/predict/stream")
+def store_predict_stream(store_id: int, req: StorePredictRequest, request: Request) -> StreamingResponse:
+    """
+    Streaming variant of /store/{store_id}/predict (NDJSON).
+
+    Emits one {"type": "dish", ...} record per dish as soon as it is computed,
+    followed by a final {"type": "summary", ...} record. When the store is not
+    ready (training / insufficient_data / error) only the summary is emitted.
+    """
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+
+    not_ready = _store_not_ready(store_id)
+    if not_ready is not None:
+        return StreamingResponse(
+            iter([_ndjson_line({"type": "summary", **not_ready})]),
+            media_type="application/x-ndjson",
+        )
+
+    ms = manager.get_store(store_id)
+    deadline = Deadline.from_request(request, req.timeout_ms, watch_disconnect=False)
+
+    def generate() -> Iterator[bytes]:
+        started = time.perf_counter()
+        ok = 0
+        failed = 0
+        done = set()
+        for dish, result in _iter_store_predictions(store_id, ms, req, deadline=deadline):
+            done.add(dish)
+            if "error" in result:
+                failed += 1
+            else:
+                ok += 1
+            if req.layout == "columnar":
+                result = dish_to_columnar(result)
+            yield _ndjson_line({"type": "dish", "dish": dish, **result})
+        skipped = [d for d in ms.list_dishes() if d not in done]
+        yield _ndjson_line({
+            "type": "summary",
+            "store_id": store_id,
+            "status": "partial" if skipped else "ok",
+            "dishes_ok": ok,
+            "dishes_failed": failed,
+            "skipped_dishes": skipped,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+        })
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+class StoreQuantileRequest(StorePredictRequest):
+    n_paths: int = Field(500, ge=10, le=5000, description="Sample paths simulated per dish")
+    quantiles: List[float] = Field(list(DEFAULT_QUANTILES), min_length=1, max_length=20)
+    seed: Optional[int] = Field(None, description="Fix for reproducible paths")
+
+
+@app.post("/store/{store_id}/predict/quantiles")
+def store_predict_quantiles(store_id: int, req: StoreQuantileRequest, request: Request) -> Dict[str, Any]:
+    """
+    Probabilistic forecast: per-day quantiles from n_paths simulated sample
+    paths (noise drawn from each dish's stored CV residuals).
+    """
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+    if any(not 0.0 <= q <= 1.0 for q in req.quantiles):
+        raise HTTPException(status_code=400, detail="quantiles must be within [0, 1]")
+
+    not_ready = _store_not_ready(store_id)
+    if not_ready is not None:
+        return not_ready
+
+    ms = manager.get_store(store_id)
+    dishes = ms.list_dishes()
+    lat, lon, cc = _resolve_store_location(store_id, req)
+    weather_rows = _fetch_shared_weather(store_id, lat, lon, len(dishes))
+    recent_sales_for = _recent_sales_loader(store_id, ms)
+    deadline = Deadline.from_request(request, req.timeout_ms)
+
+    predictions: Dict[str, Any] = {}
+    for dish in dishes:
+        if deadline.should_stop():
+            break
+        dish_started = time.perf_counter()
+        try:
+            predictions[dish] = sample_dish_paths(
+                store=ms,
+                dish=dish,
+                recent_sales=recent_sales_for(dish),
+                horizon_days=req.horizon_days,
+                n_paths=req.n_paths,
+                quantiles=sorted(req.quantiles),
+                seed=req.seed,
+                address=req.address or "Shanghai, China",
+                latitude=lat,
+                longitude=lon,
+                country_code=cc,
+                weather_rows=weather_rows,
+            )
+        except Exception as e:
+            predictions[dish] = {"error": str(e)}
+        deadline.record(time.perf_counter() - dish_started)
+
+    skipped = [d for d in dishes if d not in predictions]
+    payload: Dict[str, Any] = {
+        "store_id": store_id,
+        "status": "partial" if skipped else "ok",
+        "predictions": predictions,
+    }
+    if skipped:
+        payload["skipped_dishes"] = skipped
+    return payload
+
+
+class StoreExplainRequest(StorePredictRequest):
+    dishes: Optional[List[str]] = Field(None, description="Dishes to explain (default: all)")
+
+
+@app.post("/store/{store_id}/explain")
+def store_explain(store_id: int, req: StoreExplainRequest) -> Dict[str, Any]:
+    """
+    Forecast with grouped SHAP explanations (Seasonality, Holiday, Weather,
+    Lags/Trend, ProphetTrend) of each day's tree residual. SHAP runs once per
+    dish over the whole horizon, with explainers cached per loaded model.
+    Dishes served by a distilled student (SERVE_STUDENTS) are explained by
+    the student's own additive terms instead; "explains" says whether a
+    dish's groups sum to yhat or to the tree residual.
+    """
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+
+    not_ready = _store_not_ready(store_id)
+    if not_ready is not None:
+        return not_ready
+
+    ms = manager.get_store(store_id)
+    dishes = req.dishes or ms.list_dishes()
+    unknown = [d for d in dishes if d not in ms.registry]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Dishes not found for store {store_id}: {unknown}")
+
+    lat, lon, cc = _resolve_store_location(store_id, req)
+    weather_rows = _fetch_shared_weather(store_id, lat, lon, len(dishes))
+    recent_sales_for = _recent_sales_loader(store_id, ms)
+
+    explanations: Dict[str, Any] = {}
+    for dish in dishes:
+        try:
+            explanations[dish] = explain_dish(
+                store=ms,
+                dish=dish,
+                recent_sales=recent_sales_for(dish),
+                horizon_days=req.horizon_days,
+                address=req.address or "Shanghai, China",
+                latitude=lat,
+                longitude=lon,
+                country_code=cc,
+                weather_rows=weather_rows,
+            )
+        except Exception as e:
+            explanations[dish] = {"error": str(e)}
+
+    return {"store_id": store_id, "status": "ok", "explanations": explanations}
+
+
+class StoreBackfillRequest(BaseModel):
+    origin_start: str = Field(..., description="First forecast origin (YYYY-MM-DD)")
+    origin_end: str = Field(..., description="Last forecast origin (YYYY-MM-DD)")
+    horizon_days: int = Field(7, ge=1, le=30)
+    dishes: Optional[List[str]] = Field(None, description="Dishes to backfill (default: all)")
+    address: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    country_code: Optional[str] = None
+    weather_rows: Optional[List[Dict[str, Any]]] = Field(
+        None, description="Observed weather for the span (default: Open-Meteo archive)"
+    )
+    include_in_sample: bool = Field(
+        False,
+        description="Also forecast origins inside the models' training window (flagged in_sample, "
+                    "reported separately from the out-of-sample MAE)",
+    )
+
+
+@app.post("/store/{store_id}/backfill")
+def store_backfill(store_id: int, req: StoreBackfillRequest) -> StreamingResponse:
+    """
+    Forecasts "as of" every origin in [origin_start, origin_end], with lag
+    state rebuilt from actual sales before each origin (see app.backfill).
+    Streams NDJSON: one record per (dish, origin), then a summary with MAE.
+
+    Every origin uses the current models, so origins on or before a dish's
+    training cut-off would be in-sample; they are skipped (counted in the
+    summary's origins_in_sample) unless include_in_sample is set.
+    """
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+    if not manager.has_models(store_id):
+        raise HTTPException(status_code=404, detail=f"No models for store {store_id}")
+    try:
+        origins = backfill_origins(req.origin_start, req.origin_end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    ms = manager.get_store(store_id)
+    unknown = [d for d in req.dishes or [] if d not in ms.registry]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Dishes not found for store {store_id}: {unknown}")
+
+    lat, lon, cc = _resolve_store_location(store_id, req)
+    lat, lon, cc = resolve_location(req.address or "Shanghai, China", lat, lon, cc)
+    if lat is None or lon is None:
+        raise HTTPException(status_code=400, detail="Unable to resolve latitude/longitude")
+    sales, _ = manager.fetch_store_sales(store_id)
+    if sales is None or sales.empty:
+        raise HTTPException(status_code=404, detail=f"No sales history for store {store_id}")
+
+    def generate() -> Iterator[bytes]:
+        try:
+            for record in iter_backfill(
+                ms, sales, origins, req.horizon_days, float(lat), float(lon), cc,
+                dishes=req.dishes, weather_rows=req.weather_rows,
+                include_in_sample=req.include_in_sample,
+            ):
+                yield _ndjson_line({"store_id": store_id, **record})
+        except Exception as e:
+            logger.exception("Store %d: backfill failed", store_id)
+            yield _ndjson_line({"type": "error", "store_id": store_id, "error": str(e)})
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+class WeatherScenario(BaseModel):
+    name: str = Field(..., min_length=1, max_length=64)
+    weather_rows: Optional[List[Dict[str, Any]]] = Field(
+        None, description="Override rows: date plus any weather columns to replace that day"
+    )
+    offsets: Optional[Dict[str, float]] = Field(
+        None, description="Added to a weather column on every day, e.g. {'precipitation_sum': 10}"
+    )
+
+
+class StoreScenarioRequest(StorePredictRequest):
+    scenarios: List[WeatherScenario] = Field(..., min_length=1, max_length=50)
+    dishes: Optional[List[str]] = Field(None, description="Dishes to evaluate (default: all)")
+
+
+@app.post("/store/{store_id}/scenarios")
+def store_scenarios(store_id: int, req: StoreScenarioRequest, request: Request) -> Dict[str, Any]:
+    """
+    What-if weather forecasts: every dish under the baseline weather and each
+    scenario, evaluated in one batched pass (see app.scenarios).
+    """
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+
+    not_ready = _store_not_ready(store_id)
+    if not_ready is not None:
+        return not_ready
+
+    ms = manager.get_store(store_id)
+    dishes = req.dishes or ms.list_dishes()
+    unknown = [d for d in dishes if d not in ms.registry]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Dishes not found for store {store_id}: {unknown}")
+
+    lat, lon, cc = _resolve_store_location(store_id, req)
+    weather_rows = _fetch_shared_weather(store_id, lat, lon, len(dishes))
+    deadline = Deadline.from_request(request, req.timeout_ms)
+
+    try:
+        result = forecast_store_scenarios(
+            store=ms,
+            dishes=dishes,
+            recent_sales_for=_recent_sales_loader(store_id, ms),
+            horizon_days=req.horizon_days,
+            scenarios=[s.model_dump() for s in req.scenarios],
+            address=req.address or "Shanghai, China",
+            latitude=lat,
+            longitude=lon,
+            country_code=cc,
+            weather_rows=weather_rows,
+            deadline=deadline,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    payload: Dict[str, Any] = {
+        "store_id": store_id,
+        "status": "partial" if result["skipped_dishes"] else "ok",
+        "scenarios": result["scenarios"],
+    }
+    if result["errors"]:
+        payload["errors"] = result["errors"]
+    if result["skipped_dishes"]:
+        payload["skipped_dishes"] = result["skipped_dishes"]
+    return payload
+
+
+# =====================================================================
+# Bulk multi-store forecasts (nightly fleet refresh)
+# =====================================================================
+
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "8"))
+
+
+class BulkStorePredictRequest(BaseModel):
+    store_ids: List[int] = Field(..., min_length=1, max_length=5000)
+    horizon_days: int = Field(14, ge=1, le=30)
+    max_concurrency: int = Field(4, ge=1, description=f"Capped at BULK_MAX_CONCURRENCY ({BULK_MAX_CONCURRENCY})")
+    trigger_training: bool = Field(False, description="Start training for stores that have data but no models")
+    layout: Literal["records", "columnar"] = "records"
+
+
+def _iter_bulk_store_results(req: BulkStorePredictRequest, routed: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one store payload per requested store, in completion order.
+
+    With cluster routing on, each other node's stores are sent to it as one
+    routed /stores/predict sub-request (run while this node predicts its
+    own); a group whose owner is unreachable is predicted here. A request
+    that was routed already is served entirely where it lands.
+    """
+    store_ids = list(dict.fromkeys(req.store_ids))  # de-dup, keep order
+    groups = {CLUSTER.node_id: store_ids} if routed else CLUSTER.group_by_owner(store_ids)
+    local = groups.pop(CLUSTER.node_id, [])
+    if not groups:
+        yield from _iter_local_store_results(req, local)
+        return
+
+    with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="bulk-forward") as pool:
+        forwards = {
+            pool.submit(
+                CLUSTER.post_to_owner, owner, "/stores/predict", {**req.model_dump(), "store_ids": sids},
+            ): sids
+            for owner, sids in groups.items()
+        }
+        yield from _iter_local_store_results(req, local)
+        for fut in as_completed(forwards):
+            body = fut.result()
+            if body is None:
+                yield from _iter_local_store_results(req, forwards[fut])
+            else:
+                yield from body["stores"].values()
+
+
+def _iter_local_store_results(req: BulkStorePredictRequest, store_ids: List[int]) -> Iterator[Dict[str, Any]]:
+    """
+    Predict the given stores on this node, yielding in completion order.
+
+    Locations are resolved with a single SQL query, stores are grouped by
+    weather grid cell so each cell's forecast is fetched once, and stores are
+    predicted concurrently on a bounded thread pool.
+    """
+    ready: Dict[int, ModelStore] = {}
+    for sid in store_ids:
+        try:
+            not_ready = _store_not_ready(sid, trigger_training=req.trigger_training)
+        except AdmissionRejected as e:
+            not_ready = {"store_id": sid, "status": "error", "message": e.message}
+        if not_ready is not None:
+            yield not_ready
+        else:
+            ready[sid] = manager.get_store(sid)
+
+    if not ready:
+        return
+
+    metadata = manager.store_metadata.get_many(list(ready))
+    locations = {sid: meta.location for sid, meta in metadata.items()}
+    by_cell: Dict[Optional[Tuple[float, float]], List[int]] = defaultdict(list)
+    for sid in ready:
+        by_cell[metadata[sid].weather_cell].append(sid)
+
+    cell_weather: Dict[Optional[Tuple[float, float]], Optional[List[Dict[str, Any]]]] = {}
+    for cell, sids in by_cell.items():
+        cell_weather[cell] = (
+            _fetch_shared_weather(sids[0], cell[0], cell[1], len(sids)) if cell is not None else None
+        )
+    logger.info(
+        "Bulk predict: %d stores ready across %d weather cells", len(ready), len(by_cell)
+    )
+
+    def run_store(sid: int, cell: Optional[Tuple[float, float]]) -> Dict[str, Any]:
+        lat, lon, cc = locations.get(sid, (None, None, None))
+        store_req = StorePredictRequest(
+            store_id=sid,
+            horizon_days=req.horizon_days,
+            latitude=lat,
+            longitude=lon,
+            country_code=cc,
+            layout=req.layout,
+        )
+        preds = dict(
+            _iter_store_predictions(sid, ready[sid], store_req, shared_weather_rows=cell_weather[cell])
+        )
+        if req.layout == "columnar":
+            return store_to_columnar(sid, "ok", preds)
+        return {"store_id": sid, "status": "ok", "predictions": preds}
+
+    workers = max(1, min(req.max_concurrency, BULK_MAX_CONCURRENCY, len(ready)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-predict") as pool:
+        futures = {
+            pool.submit(run_store, sid, cell): sid
+            for cell, sids in by_cell.items()
+            for sid in sids
+        }
+        for fut in as_completed(futures):
+            sid = futures[fut]
+            try:
+                yield fut.result()
+            except Exception as e:
+                yield {"store_id": sid, "status": "error", "message": str(e)}
+
+
+@app.post("/stores/predict")
+def stores_predict(req: BulkStorePredictRequest, request: Request) -> Any:
+    """Forecast many stores in one call; returns {"stores": {store_id: payload}, "summary": {...}}."""
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+
+    started = time.perf_counter()
+    stores: Dict[str, Any] = {}
+    counts: Dict[str, int] = defaultdict(int)
+    for result in _iter_bulk_store_results(req, routed=ROUTED_HEADER in request.headers):
+        stores[str(result["store_id"])] = result
+        counts[result["status"]] += 1
+
+    payload = {
+        "stores": stores,
+        "summary": {
+            "requested": len(req.store_ids),
+            "by_status": dict(counts),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+        },
+    }
+    if req.layout == "columnar":
+        return columnar_response(payload, request.headers.get("accept"))
+    return payload
+
+
+@app.post("/stores/predict/stream")
+def stores_predict_stream(req: BulkStorePredictRequest, request: Request) -> StreamingResponse:
+    """NDJSON variant of /stores/predict: one {"type": "store"} record per store, then a summary."""
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+    routed = ROUTED_HEADER in request.headers
+
+    def generate() -> Iterator[bytes]:
+        started = time.perf_counter()
+        counts: Dict[str, int] = defaultdict(int)
+        for result in _iter_bulk_store_results(req, routed=routed):
+            counts[result["status"]] += 1
+            yield _ndjson_line({"type": "store", **result})
+        yield _ndjson_line({
+            "type": "summary",
+            "requested": len(req.store_ids),
+            "by_status": dict(counts),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+        })
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+# =====================================================================
+# Materialized forecasts (nightly precompute, see app.materialized)
+# =====================================================================
+
+MATERIALIZE_CONCURRENCY = int(os.getenv("MATERIALIZE_CONCURRENCY", "4"))
+MATERIALIZE_AT = os.getenv("MATERIALIZE_AT")  # "HH:MM" local time; unset = no in-service schedule
+_materialize_lock = threading.Lock()
+
+
+def _current_inputs_tag(store_id: int) -> Tuple[Optional[ModelStore], Optional[str]]:
+    ms = manager.get_store(store_id)
+    if ms is None:
+        return None, None
+    req = StorePredictRequest(store_id=store_id, horizon_days=MATERIALIZED_HORIZON_DAYS)
+    return ms, _store_inputs_tag(store_id, ms, req)
+
+
+def _materialize_store(store_id: int, force: bool) -> str:
+    ms, tag = _current_inputs_tag(store_id)
+    if ms is None:
+        return "no_models"
+    run = materialized.run(store_id)
+    if not force and run is not None and run["inputs_tag"] == tag:
+        return "fresh"
+
+    req = StorePredictRequest(store_id=store_id, horizon_days=MATERIALIZED_HORIZON_DAYS)
+    payload = _compute_store_payload(store_id, ms, req)
+    n_rows = materialized.write_store(
+        store_id, tag, req.horizon_days, forecast_start_date().strftime("%Y-%m-%d"),
+        payload["predictions"],
+    )
+    logger.info("Store %d: materialized %d forecast rows", store_id, n_rows)
+    return "materialized"
+
+
+def materialize_stores(
+    store_ids: Optional[List[int]] = None, force: bool = False, routed: bool = False,
+) -> Dict[str, Any]:
+    """
+    Precompute forecasts for the given stores (default: every store with
+    models). Stores whose inputs are unchanged since their last run are
+    skipped unless force is set. Returns a per-store outcome summary.
+
+    Explicit store ids owned by other nodes are sent to their owner as a
+    routed, synchronous /materialize (or done here if it is unreachable).
+    """
+    if not _materialize_lock.acquire(blocking=False):
+        return {"status": "already_running"}
+    try:
+        started = time.perf_counter()
+        # Each node precomputes only the stores it owns on the hash ring
+        ids = store_ids or [sid for sid in manager.list_store_ids() if CLUSTER.owns(sid)]
+        groups = {CLUSTER.node_id: ids} if routed else CLUSTER.group_by_owner(ids)
+        ids = groups.pop(CLUSTER.node_id, [])
+        outcomes: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(groups)), thread_name_prefix="materialize-forward") as forwarder, \
+                ThreadPoolExecutor(max_workers=MATERIALIZE_CONCURRENCY, thread_name_prefix="materialize") as pool:
+            forwards = {
+                forwarder.submit(
+                    CLUSTER.post_to_owner, owner, "/materialize",
+                    {"store_ids": sids, "force": force, "wait": True},
+                ): sids
+                for owner, sids in groups.items()
+            }
+            futures = {pool.submit(_materialize_store, sid, force): sid for sid in ids}
+            for fut in as_completed(forwards):
+                body = fut.result()
+                if body is None:
+                    futures.update({pool.submit(_materialize_store, sid, force): sid for sid in forwards[fut]})
+                elif body.get("status") == "done":
+                    outcomes.update(body["stores"])
+                else:  # the owner's own run is in progress
+                    outcomes.update({str(sid): body.get("status", "error") for sid in forwards[fut]})
+            for fut in as_completed(futures):
+                sid = futures[fut]
+                try:
+                    outcomes[str(sid)] = fut.result()
+                except Exception as e:
+                    logger.error("Store %d: materialization failed: %s", sid, e)
+                    outcomes[str(sid)] = f"error: {e}"
+        counts: Dict[str, int] = defaultdict(int)
+        for outcome in outcomes.values():
+            counts[outcome.split(":")[0]] += 1
+        return {
+            "status": "done",
+            "stores": outcomes,
+            "by_outcome": dict(counts),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+        }
+    finally:
+        _materialize_lock.release()
+
+
+def materialization_report(store_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """Freshness of materialized forecasts against each store's current inputs."""
+    ids = store_ids or [sid for sid in manager.list_store_ids() if CLUSTER.owns(sid)]
+    current: Dict[int, Optional[str]] = {}
+    for sid in ids:
+        try:
+            current[sid] = _current_inputs_tag(sid)[1]
+        except Exception as e:
+            logger.warning("Store %d: cannot compute inputs tag: %s", sid, e)
+            current[sid] = None
+    report = materialized.freshness(current)
+    if store_ids:
+        report = [r for r in report if r["store_id"] in set(store_ids)]
+    return {
+        "stores": report,
+        "out_of_date": [r["store_id"] for r in report if r["state"] != "fresh"],
+    }
+
+
+def _start_materialize_schedule() -> None:
+    """Run materialize_stores() daily at MATERIALIZE_AT in a daemon thread."""
+    if not MATERIALIZE_AT:
+        return
+    hour, minute = (int(x) for x in MATERIALIZE_AT.split(":"))
+
+    def loop() -> None:
+        while True:
+            now = pd.Timestamp.now()
+            next_run = now.normalize() + pd.Timedelta(hours=hour, minutes=minute)
+            if next_run <= now:
+                next_run += pd.Timedelta(days=1)
+            time.sleep((next_run - now).total_seconds())
+            try:
+                summary = materialize_stores()
+                logger.info("Nightly materialization: %s", summary.get("by_outcome"))
+            except Exception as e:
+                logger.error("Nightly materialization crashed: %s", e)
+
+    threading.Thread(target=loop, name="materialize-schedule", daemon=True).start()
+
+
+class MaterializeRequest(BaseModel):
+    store_ids: Optional[List[int]] = Field(None, description="Default: every store with models")
+    force: bool = Field(False, description="Recompute stores whose inputs are unchanged")
+    wait: bool = Field(False, description="Run synchronously and return the summary")
+
+
+@app.post("/materialize")
+def materialize(req: MaterializeRequest, request: Request) -> Dict[str, Any]:
+    """Trigger the materialization job (background unless wait=true)."""
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+    routed = ROUTED_HEADER in request.headers
+    if req.wait:
+        return materialize_stores(req.store_ids, force=req.force, routed=routed)
+    if _materialize_lock.locked():
+        return {"status": "already_running"}
+    threading.Thread(
+        target=materialize_stores, args=(req.store_ids, req.force, routed),
+        name="materialize", daemon=True,
+    ).start()
+    return {"status": "started"}
+
+
+@app.get("/materialize/freshness")
+def materialize_freshness() -> Dict[str, Any]:
+    """Stores whose materialized forecast is missing or out of date."""
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Manager not initialized")
+    return materialization_report()
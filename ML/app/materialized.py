@@ -0,0 +1,255 @@
+"""
+Materialized store forecasts.
+
+A nightly batch job precomputes each store's horizon forecast and writes it
+to a local SQLite database keyed by (store_id, dish, date). Alongside the
+rows it records the *inputs tag* the forecast was computed from (model
+version, recent-sales state, weather fingerprint, location and start date —
+the same inputs the ETag uses). /store/{id}/predict serves straight from
+this table while the store's current inputs tag still matches; otherwise it
+falls back to computing live.
+
+Run the job from the service (POST /materialize) or as a CLI:
+
+    cd ML
+    python -m app.materialized run                 # every store with models
+    python -m app.materialized run --store-ids 1 2
+    python -m app.materialized report              # stale / missing stores
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MATERIALIZED_DB = os.getenv("MATERIALIZED_DB", "materialized/forecasts.sqlite")
+# Materialize the longest horizon the API serves; shorter requests are a prefix
+# of it because the forecast is recursive day by day.
+MATERIALIZED_HORIZON_DAYS = int(os.getenv("MATERIALIZED_HORIZON_DAYS", "30"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecast_runs (
+    store_id     INTEGER PRIMARY KEY,
+    inputs_tag   TEXT    NOT NULL,
+    horizon_days INTEGER NOT NULL,
+    start_date   TEXT    NOT NULL,
+    computed_at  REAL    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS forecast_dishes (
+    store_id    INTEGER NOT NULL,
+    dish        TEXT    NOT NULL,
+    model       TEXT,
+    model_combo TEXT,
+    error       TEXT,
+    PRIMARY KEY (store_id, dish)
+);
+CREATE TABLE IF NOT EXISTS forecasts (
+    store_id     INTEGER NOT NULL,
+    dish         TEXT    NOT NULL,
+    date         TEXT    NOT NULL,
+    yhat         REAL    NOT NULL,
+    prophet_yhat REAL    NOT NULL,
+    residual_hat REAL    NOT NULL,
+    lower        REAL    NOT NULL,
+    upper        REAL    NOT NULL,
+    PRIMARY KEY (store_id, dish, date)
+);
+"""
+# Bump when the tables change; older databases are dropped and rebuilt by the next run.
+_SCHEMA_VERSION = 2
+
+
+class MaterializedForecasts:
+    """SQLite-backed forecast table; one connection per call, WAL for concurrent readers."""
+
+    def __init__(self, path: str = MATERIALIZED_DB) -> None:
+        self.path = Path(path)
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    # closing() closes the connection; the inner `with conn` only commits
+                    with closing(sqlite3.connect(self.path)) as conn, conn:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        if conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                            conn.executescript(
+                                "DROP TABLE IF EXISTS forecasts;"
+                                "DROP TABLE IF EXISTS forecast_dishes;"
+                                "DROP TABLE IF EXISTS forecast_runs;"
+                            )
+                            conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+                        conn.executescript(_SCHEMA)
+                    self._initialized = True
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def write_store(
+        self,
+        store_id: int,
+        inputs_tag: str,
+        horizon_days: int,
+        start_date: str,
+        predictions: Dict[str, Dict[str, Any]],
+    ) -> int:
+        """Replace a store's materialized forecast atomically; returns the row count."""
+        dish_rows = []
+        rows = []
+        for dish, result in predictions.items():
+            dish_rows.append((store_id, dish, result.get("model"), result.get("model_combo"), result.get("error")))
+            for p in result.get("predictions", []):
+                rows.append((
+                    store_id, dish, p["date"], p["yhat"], p["prophet_yhat"], p["residual_hat"],
+                    p["lower"], p["upper"],
+                ))
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM forecasts WHERE store_id = ?", (store_id,))
+                conn.execute("DELETE FROM forecast_dishes WHERE store_id = ?", (store_id,))
+                conn.executemany("INSERT INTO forecast_dishes VALUES (?, ?, ?, ?, ?)", dish_rows)
+                conn.executemany("INSERT INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO forecast_runs VALUES (?, ?, ?, ?, ?)",
+                    (store_id, inputs_tag, horizon_days, start_date, time.time()),
+                )
+        finally:
+            conn.close()
+        return len(rows)
+
+    def run(self, store_id: int) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM forecast_runs WHERE store_id = ?", (store_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row is not None else None
+
+    def runs(self) -> Dict[int, Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            return {r["store_id"]: dict(r) for r in conn.execute("SELECT * FROM forecast_runs")}
+        finally:
+            conn.close()
+
+    def read_store(
+        self, store_id: int, inputs_tag: str, horizon_days: int
+    ) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Return {dish: predict_dish-shaped result} for the first horizon_days,
+        or None when nothing is materialized for these inputs.
+        """
+        conn = self._connect()
+        try:
+            run = conn.execute(
+                "SELECT * FROM forecast_runs WHERE store_id = ? AND inputs_tag = ?",
+                (store_id, inputs_tag),
+            ).fetchone()
+            if run is None or run["horizon_days"] < horizon_days:
+                return None
+            dishes = conn.execute(
+                "SELECT * FROM forecast_dishes WHERE store_id = ? ORDER BY dish", (store_id,)
+            ).fetchall()
+            rows = conn.execute(
+                "SELECT dish, date, yhat, prophet_yhat, residual_hat, lower, upper FROM forecasts "
+                "WHERE store_id = ? ORDER BY dish, date",
+                (store_id,),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        by_dish: Dict[str, List[Dict[str, Any]]] = {}
+        for r in rows:
+            by_dish.setdefault(r["dish"], []).append({
+                "date": r["date"],
+                "yhat": r["yhat"],
+                "prophet_yhat": r["prophet_yhat"],
+                "residual_hat": r["residual_hat"],
+                "lower": r["lower"],
+                "upper": r["upper"],
+            })
+
+        predictions: Dict[str, Dict[str, Any]] = {}
+        for d in dishes:
+            if d["error"]:
+                predictions[d["dish"]] = {"error": d["error"]}
+                continue
+            predictions[d["dish"]] = {
+                "dish": d["dish"],
+                "model": d["model"],
+                "model_combo": d["model_combo"],
+                "horizon_days": horizon_days,
+                "start_date": run["start_date"],
+                "predictions": by_dish.get(d["dish"], [])[:horizon_days],
+            }
+        return predictions
+
+    def freshness(self, current_tags: Dict[int, Optional[str]]) -> List[Dict[str, Any]]:
+        """
+        Compare materialized runs with each store's current inputs tag.
+        A None tag means the store could not be evaluated (e.g. no models).
+        """
+        runs = self.runs()
+        now = time.time()
+        report = []
+        for store_id in sorted(set(current_tags) | set(runs)):
+            run = runs.get(store_id)
+            tag = current_tags.get(store_id)
+            if run is None:
+                state = "missing"
+            elif tag is None:
+                state = "orphaned"
+            elif run["inputs_tag"] != tag:
+                state = "stale"
+            else:
+                state = "fresh"
+            report.append({
+                "store_id": store_id,
+                "state": state,
+                "start_date": run["start_date"] if run else None,
+                "age_seconds": round(now - run["computed_at"], 1) if run else None,
+            })
+        return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Materialize store forecasts")
+    parser.add_argument("command", choices=["run", "report"])
+    parser.add_argument("--store-ids", type=int, nargs="*")
+    parser.add_argument("--model-dir", default=os.getenv("MODEL_DIR", "models"))
+    parser.add_argument("--force", action="store_true", help="Recompute stores that are already fresh")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # The job reuses the service's own prediction path, so it runs in-process
+    from app import main as service
+    from app.store_manager import StoreModelManager
+
+    service.manager = StoreModelManager(base_model_dir=args.model_dir)
+    store_ids = args.store_ids or None
+    if args.command == "run":
+        result = service.materialize_stores(store_ids, force=args.force)
+    else:
+        result = service.materialization_report(store_ids)
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Opt-in per-request profiling for slow forecasts.
+
+A request is profiled when it carries ``X-Debug-Profile: 1`` (or ``?profile=1``)
+together with ``X-Debug-Token`` matching the ML_DEBUG_TOKEN environment
+variable. Profiling is disabled entirely when ML_DEBUG_TOKEN is unset.
+
+Each profiled request records:
+- a deterministic cProfile run, summarised as call counts / timings for the
+  hot inference functions (predict_dish, _prepare_future_weather,
+  Prophet.predict, ...) plus the top functions by cumulative time;
+- a wall-clock stack sampler producing collapsed stacks
+  ("frame;frame;frame count"), loadable by flamegraph.pl / speedscope.
+
+Both are persisted under ML_PROFILE_DIR and referenced by the X-Profile-Id
+response header; fetch them with GET /debug/profiles/{profile_id}.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+
+PROFILE_DIR = Path(os.getenv("ML_PROFILE_DIR", "/tmp/smartsus_profiles"))
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("ML_PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000.0
+MAX_STACK_DEPTH = 128
+TOP_N = 25
+
+HOT_FUNCTIONS = {
+    "predict_dish",
+    "_prepare_future_weather",
+    "_fetch_weather_forecast",
+    "_compute_lag_features_from_history",
+    "get_dish_model",
+    "get_location_details",
+    "geocode_address",
+}
+
+
+def _debug_token() -> Optional[str]:
+    return os.getenv("ML_DEBUG_TOKEN") or None
+
+
+def check_debug_token(request: Request) -> None:
+    """Raise 403 unless the request carries the configured debug token."""
+    expected = _debug_token()
+    supplied = request.headers.get("x-debug-token", "")
+    if expected is None or not hmac.compare_digest(supplied.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Invalid or missing debug token")
+
+
+def profiling_requested(request: Request) -> bool:
+    flag = request.headers.get("x-debug-profile") or request.query_params.get("profile")
+    return (flag or "").lower() in ("1", "true", "yes", "on")
+
+
+class _StackSampler(threading.Thread):
+    """Sample one thread's Python stack at a fixed interval."""
+
+    def __init__(self, target_ident: int, interval: float) -> None:
+        super().__init__(name="profile-sampler", daemon=True)
+        self.target_ident = target_ident
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_ident)
+            if frame is None:
+                continue
+            names: List[str] = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=1.0)
+
+
+def _is_hot(filename: str, func: str) -> bool:
+    if func in HOT_FUNCTIONS:
+        return True
+    # Prophet.predict / Prophet.predict_* live in prophet/forecaster.py
+    return func.startswith("predict") and "prophet" in filename.replace("\\", "/")
+
+
+def _summarise(profile: cProfile.Profile) -> Dict[str, Any]:
+    stats = pstats.Stats(profile).stats  # {(file, line, func): (cc, nc, tt, ct, callers)}
+
+    def row(key, value) -> Dict[str, Any]:
+        filename, line, func = key
+        _, ncalls, tottime, cumtime, _ = value
+        return {
+            "function": f"{func} ({os.path.basename(filename)}:{line})",
+            "calls": ncalls,
+            "self_s": round(tottime, 6),
+            "cumulative_s": round(cumtime, 6),
+        }
+
+    hot = [row(k, v) for k, v in stats.items() if _is_hot(k[0], k[2])]
+    top = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:TOP_N]
+    return {
+        "hot_functions": sorted(hot, key=lambda r: r["cumulative_s"], reverse=True),
+        "top_cumulative": [row(k, v) for k, v in top],
+    }
+
+
+class RequestProfile:
+    """Context manager profiling the calling thread; results saved on exit."""
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self._profile = cProfile.Profile()
+        self._sampler: Optional[_StackSampler] = None
+        self._started = 0.0
+
+    def __enter__(self) -> "RequestProfile":
+        self._started = time.perf_counter()
+        self._sampler = _StackSampler(threading.get_ident(), SAMPLE_INTERVAL_SECONDS)
+        self._sampler.start()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._profile.disable()
+        self._sampler.stop()
+        elapsed = time.perf_counter() - self._started
+
+        summary = {
+            "profile_id": self.profile_id,
+            "label": self.label,
+            "wall_s": round(elapsed, 6),
+            "samples": sum(self._sampler.stacks.values()),
+            "sample_interval_ms": SAMPLE_INTERVAL_SECONDS * 1000.0,
+            **_summarise(self._profile),
+        }
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        (PROFILE_DIR / f"{self.profile_id}.json").write_text(json.dumps(summary, indent=2))
+        (PROFILE_DIR / f"{self.profile_id}.collapsed").write_text(
+            "\n".join(f"{stack} {n}" for stack, n in self._sampler.stacks.most_common()) + "\n"
+        )
+        self._profile.dump_stats(str(PROFILE_DIR / f"{self.profile_id}.pstats"))
+
+
+def start_if_requested(request: Request, label: str) -> Optional[RequestProfile]:
+    """Return a RequestProfile when profiling was asked for (403 on a bad token)."""
+    if not profiling_requested(request):
+        return None
+    check_debug_token(request)
+    return RequestProfile(label)
+
+
+def load_profile(profile_id: str, fmt: str = "json") -> Any:
+    """Load a stored profile: 'json' summary or 'collapsed' flame-graph stacks."""
+    if not profile_id.replace("-", "").isalnum():
+        raise HTTPException(status_code=400, detail="Invalid profile id")
+    suffix = {"json": ".json", "collapsed": ".collapsed"}.get(fmt)
+    if suffix is None:
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'collapsed'")
+    path = PROFILE_DIR / f"{profile_id}{suffix}"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"Profile not found: {profile_id}")
+    text = path.read_text()
+    return json.loads(text) if fmt == "json" else text
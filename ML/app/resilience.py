@@ -0,0 +1,209 @@
+"""
+Circuit breakers and hedged calls for external dependencies.
+
+Open-Meteo and Nominatim sit on the request path (weather for a forecast,
+geocoding for a store without coordinates). Without protection an outage
+costs every request the HTTP client's retries before the fallback kicks in.
+Each dependency gets one shared CircuitBreaker instead:
+
+- every call runs in a small worker pool with a strict overall timeout;
+- a call that has not answered after ``hedge_after`` seconds (or failed) is
+  hedged with another attempt, up to ``max_attempts``; the first success wins;
+- ``failure_threshold`` consecutive failures open the breaker, and while it
+  is open calls fail immediately with CircuitOpenError so callers go straight
+  to cached or default data; after ``reset_timeout`` one probe call is let
+  through (half-open) and its outcome closes or re-opens the breaker.
+
+Breaker state and call outcomes are exported as Prometheus metrics.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Set, TypeVar
+
+from app.metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0.0, HALF_OPEN: 1.0, OPEN: 2.0}
+
+BREAKER_STATE: Gauge = REGISTRY.register(Gauge(
+    "smartsus_ml_upstream_breaker_state",
+    "Circuit breaker state per external dependency (0 closed, 1 half-open, 2 open).",
+    labelnames=("dependency",),
+))
+UPSTREAM_CALLS: Counter = REGISTRY.register(Counter(
+    "smartsus_ml_upstream_calls_total",
+    "Calls to external dependencies, by outcome (ok, error, timeout, short_circuited).",
+    labelnames=("dependency", "outcome"),
+))
+UPSTREAM_HEDGES: Counter = REGISTRY.register(Counter(
+    "smartsus_ml_upstream_hedged_attempts_total",
+    "Extra attempts started because an upstream call was slow or failed.",
+    labelnames=("dependency",),
+))
+
+# Timed-out attempts cannot be cancelled; the bounded pool caps how many linger.
+_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("UPSTREAM_POOL_WORKERS", "16")), thread_name_prefix="upstream"
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+def hedged_call(
+    fn: Callable[[], T],
+    timeout: float,
+    hedge_after: float,
+    max_attempts: int,
+    on_hedge: Callable[[], None] = lambda: None,
+) -> T:
+    """
+    Run fn in the worker pool and return the first successful result.
+    Another attempt starts when none has answered within hedge_after seconds
+    or when an attempt fails, up to max_attempts in total. Raises
+    TimeoutError after timeout seconds, or the last error when every attempt
+    failed.
+    """
+    deadline = time.monotonic() + timeout
+    pending: Set[Future] = {_pool.submit(fn)}
+    started = 1
+    last_error: BaseException = TimeoutError(f"no response within {timeout:.1f}s")
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"no response within {timeout:.1f}s")
+        can_hedge = started < max_attempts
+        done, pending = wait(
+            pending, timeout=min(remaining, hedge_after) if can_hedge else remaining,
+            return_when=FIRST_COMPLETED,
+        )
+        for future in done:
+            error = future.exception()
+            if error is None:
+                return future.result()
+            last_error = error
+        if not pending and not can_hedge:
+            raise last_error
+        if can_hedge and time.monotonic() < deadline:
+            pending.add(_pool.submit(fn))
+            started += 1
+            on_hedge()
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        hedge_after: float = 1.0,
+        max_attempts: int = 2,
+    ) -> None:
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_after = hedge_after
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        BREAKER_STATE.set(_STATE_VALUES[CLOSED], dependency=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logger.warning("Upstream '%s' circuit %s -> %s", self.name, self._state, state)
+        self._state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], dependency=self.name)
+
+    def _acquire(self) -> bool:
+        """True if a call may go out now (closed, or the single half-open probe)."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._probing:
+                return False
+            self._set_state(HALF_OPEN)
+            self._probing = True
+            return True
+
+    def _record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                self._set_state(CLOSED)
+                return
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """Call fn through the breaker (timeout + hedging); raises CircuitOpenError when open."""
+        if not self._acquire():
+            UPSTREAM_CALLS.inc(dependency=self.name, outcome="short_circuited")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = hedged_call(
+                fn, self.timeout, self.hedge_after, self.max_attempts,
+                on_hedge=lambda: UPSTREAM_HEDGES.inc(dependency=self.name),
+            )
+        except TimeoutError:
+            UPSTREAM_CALLS.inc(dependency=self.name, outcome="timeout")
+            self._record(False)
+            raise
+        except Exception:
+            UPSTREAM_CALLS.inc(dependency=self.name, outcome="error")
+            self._record(False)
+            raise
+        UPSTREAM_CALLS.inc(dependency=self.name, outcome="ok")
+        self._record(True)
+        return result
+
+
+def _breaker_from_env(name: str, prefix: str, timeout: float, max_attempts: int) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT_SECONDS", str(timeout))),
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET_SECONDS", "30")),
+        hedge_after=float(os.getenv(f"{prefix}_HEDGE_AFTER_SECONDS", "1.0")),
+        max_attempts=int(os.getenv(f"{prefix}_MAX_ATTEMPTS", str(max_attempts))),
+    )
+
+
+OPEN_METEO = _breaker_from_env("open_meteo", "OPEN_METEO", timeout=4.0, max_attempts=2)
+# Nominatim's usage policy allows one request per second, so it is not hedged by default
+NOMINATIM = _breaker_from_env("nominatim", "NOMINATIM", timeout=3.0, max_attempts=1)
+
+BREAKERS: Dict[str, CircuitBreaker] = {b.name: b for b in (OPEN_METEO, NOMINATIM)}
+
+
+def breaker_states() -> Dict[str, str]:
+    return {name: b.state for name, b in BREAKERS.items()}
+
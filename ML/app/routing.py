@@ -0,0 +1,290 @@
+"""
+Consistent-hash store routing across ML nodes.
+
+Every /store/{id}/... request belongs to one owning node, chosen by a
+consistent-hash ring over the cluster members (each with ML_VNODES virtual
+nodes), so a store's models, caches and training live on one node and
+adding or removing a node only moves ~1/N of the stores.
+
+StoreRoutingMiddleware (pure ASGI) sends requests for stores owned
+elsewhere to the owner, either by
+
+- redirect: 307 to the owner (method and body preserved), or
+- forward:  proxy the request and stream the owner's response back; if the
+            owner is unreachable the request is served locally instead.
+
+Multi-store endpoints (/stores/predict, /materialize) have no store in the
+path, so the middleware cannot route them; they split their store ids with
+Cluster.group_by_owner and send each other node its share through
+Cluster.post_to_owner, serving a group locally if its owner is unreachable.
+
+Forwarded requests carry X-ML-Routed-From (redirects a ``_routed_from``
+query parameter); a request that was already routed once is always served
+where it lands, so members with disagreeing configs cannot loop.
+
+Configuration (routing is off unless both are set):
+
+    ML_CLUSTER_NODES="a=http://127.0.0.1:8001,b=http://127.0.0.1:8002,c=http://127.0.0.1:8003"
+    ML_NODE_ID=a
+    ML_ROUTING_MODE=redirect | forward   (default: redirect)
+
+Locally, run one uvicorn per port with the same ML_CLUSTER_NODES and its
+own ML_NODE_ID, then ask any node; GET /cluster?store_id=N shows the owner.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+from urllib.parse import parse_qs, urlencode
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+ROUTED_HEADER = "x-ml-routed-from"
+ROUTED_PARAM = "_routed_from"
+NODE_HEADER = "x-ml-node"
+STORE_PATH: Pattern[str] = re.compile(r"^/store/(\d+)(/|$)")
+_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host",
+}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring mapping store ids to node ids."""
+
+    def __init__(self, nodes: Dict[str, str], vnodes: int = 64) -> None:
+        if not nodes:
+            raise ValueError("A hash ring needs at least one node")
+        self.nodes = dict(nodes)  # node id -> base URL
+        self.vnodes = vnodes
+        points: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node_id}#{i}"), node_id) for node_id in self.nodes for i in range(vnodes)
+        )
+        self._keys = [p[0] for p in points]
+        self._owners = [p[1] for p in points]
+
+    def owner(self, store_id: int) -> str:
+        idx = bisect.bisect(self._keys, _hash(f"store:{store_id}")) % len(self._keys)
+        return self._owners[idx]
+
+    def distribution(self, store_ids: List[int]) -> Dict[str, int]:
+        counts = {node_id: 0 for node_id in self.nodes}
+        for sid in store_ids:
+            counts[self.owner(sid)] += 1
+        return counts
+
+
+def parse_nodes(spec: str) -> Dict[str, str]:
+    """'a=http://h1:8000,b=http://h2:8000' (or bare URLs, used as their own ids)."""
+    nodes: Dict[str, str] = {}
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        node_id, sep, url = entry.partition("=")
+        if not sep:
+            node_id, url = entry, entry
+        nodes[node_id.strip()] = url.strip().rstrip("/")
+    return nodes
+
+
+class Cluster:
+    def __init__(self, ring: Optional[HashRing], node_id: Optional[str], mode: str) -> None:
+        if mode not in ("redirect", "forward"):
+            raise ValueError(f"Unknown ML_ROUTING_MODE: {mode}")
+        if ring is not None and node_id not in ring.nodes:
+            raise ValueError(f"ML_NODE_ID '{node_id}' is not in ML_CLUSTER_NODES")
+        self.ring = ring
+        self.node_id = node_id
+        self.mode = mode
+
+    @classmethod
+    def from_env(cls) -> "Cluster":
+        nodes = parse_nodes(os.getenv("ML_CLUSTER_NODES", ""))
+        node_id = os.getenv("ML_NODE_ID") or None
+        ring = HashRing(nodes, vnodes=int(os.getenv("ML_VNODES", "64"))) if nodes and node_id else None
+        return cls(ring, node_id, os.getenv("ML_ROUTING_MODE", "redirect"))
+
+    @property
+    def enabled(self) -> bool:
+        return self.ring is not None
+
+    def owner(self, store_id: int) -> Optional[str]:
+        return self.ring.owner(store_id) if self.ring is not None else None
+
+    def owns(self, store_id: int) -> bool:
+        """True when this node owns the store (always, with routing off)."""
+        return self.ring is None or self.ring.owner(store_id) == self.node_id
+
+    def group_by_owner(self, store_ids: List[int]) -> Dict[Optional[str], List[int]]:
+        """Store ids grouped by owning node, in request order (all under node_id with routing off)."""
+        groups: Dict[Optional[str], List[int]] = {}
+        for sid in store_ids:
+            groups.setdefault(self.owner(sid) or self.node_id, []).append(sid)
+        return groups
+
+    def post_to_owner(
+        self, owner: str, path: str, payload: Dict[str, Any], timeout: float = 300.0,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        POST a JSON sub-request to another member as a routed request (it
+        serves it where it lands). None when the owner is unreachable or
+        fails, so the caller can serve the stores locally instead.
+        """
+        import requests
+
+        url = f"{self.ring.nodes[owner]}{path}"
+        try:
+            resp = requests.post(
+                url, json=payload, timeout=(2.0, timeout),
+                headers={ROUTED_HEADER: self.node_id, "accept": "application/json"},
+            )
+            resp.raise_for_status()
+            return resp.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Forward to %s failed (%s); serving locally", url, e)
+            return None
+
+    def describe(self, store_id: Optional[int] = None) -> Dict[str, Any]:
+        info: Dict[str, Any] = {
+            "enabled": self.enabled,
+            "node_id": self.node_id,
+            "mode": self.mode,
+            "nodes": self.ring.nodes if self.ring is not None else {},
+        }
+        if store_id is not None:
+            info["store_id"] = store_id
+            info["owner"] = self.owner(store_id) or self.node_id
+        return info
+
+
+class StoreRoutingMiddleware:
+    """Redirect or forward /store/{id}/... requests to the store's owning node."""
+
+    def __init__(self, app: Any, cluster: Cluster, forward_timeout: float = 300.0) -> None:
+        self.app = app
+        self.cluster = cluster
+        self.forward_timeout = forward_timeout
+
+    def _target(self, scope: Dict[str, Any]) -> Optional[str]:
+        """Owner base URL when this request must leave this node, else None."""
+        if scope["type"] != "http" or not self.cluster.enabled:
+            return None
+        match = STORE_PATH.match(scope.get("path", ""))
+        if match is None:
+            return None
+        headers = dict(scope.get("headers") or [])
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if ROUTED_HEADER.encode() in headers or ROUTED_PARAM in query:
+            return None  # routed once already: never bounce again
+        owner = self.cluster.owner(int(match.group(1)))
+        if owner == self.cluster.node_id:
+            return None
+        return self.cluster.ring.nodes[owner]
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        target = self._target(scope)
+        if target is None:
+            await self.app(scope, receive, self._tag(scope, send))
+            return
+        if self.cluster.mode == "redirect":
+            await self._redirect(scope, receive, send, target)
+        else:
+            await self._forward(scope, receive, send, target)
+
+    def _tag(self, scope: Dict[str, Any], send: Callable) -> Callable:
+        """Add X-ML-Node to store responses served here, to see who answered."""
+        if scope["type"] != "http" or not self.cluster.enabled or not STORE_PATH.match(scope.get("path", "")):
+            return send
+
+        async def tagged(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [
+                    *message.get("headers", []), (NODE_HEADER.encode(), self.cluster.node_id.encode()),
+                ]}
+            await send(message)
+
+        return tagged
+
+    async def _redirect(self, scope: Dict[str, Any], receive: Callable, send: Callable, target: str) -> None:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        query[ROUTED_PARAM] = [self.cluster.node_id]
+        location = f"{target}{scope['path']}?{urlencode(query, doseq=True)}"
+        response = JSONResponse(
+            status_code=307,
+            content={"status": "moved", "owner": location},
+            headers={"Location": location},
+        )
+        await response(scope, receive, send)
+
+    async def _forward(self, scope: Dict[str, Any], receive: Callable, send: Callable, target: str) -> None:
+        import requests
+
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+
+        headers = {
+            k.decode("latin-1"): v.decode("latin-1")
+            for k, v in scope.get("headers") or []
+            if k.decode("latin-1").lower() not in _HOP_HEADERS
+        }
+        headers[ROUTED_HEADER] = self.cluster.node_id
+        query = scope.get("query_string", b"").decode("latin-1")
+        url = f"{target}{scope['path']}" + (f"?{query}" if query else "")
+
+        try:
+            upstream = await asyncio.to_thread(
+                requests.request, scope["method"], url,
+                data=body, headers=headers, stream=True, timeout=(2.0, self.forward_timeout),
+            )
+        except requests.RequestException as e:
+            logger.warning("Forward to %s failed (%s); serving locally", url, e)
+            replayed = False
+
+            async def replay() -> Dict[str, Any]:
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+
+            await self.app(scope, replay, self._tag(scope, send))
+            return
+
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": upstream.status_code,
+                "headers": [
+                    (k.lower().encode("latin-1"), v.encode("latin-1"))
+                    for k, v in upstream.raw.headers.items()
+                    if k.lower() not in _HOP_HEADERS
+                ],
+            })
+            # Raw bytes, still content-encoded, so the upstream headers stay valid.
+            # amt=None yields chunked responses (NDJSON, SSE) chunk by chunk as they arrive.
+            chunks = upstream.raw.stream(None, decode_content=False)
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, b"")
+                if not chunk:
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            upstream.close()
+
+
+CLUSTER = Cluster.from_env()
@@ -0,0 +1,347 @@
+"""
+What-if weather scenarios.
+
+A scenario is an alternative weather matrix for the forecast horizon: the
+store's weather forecast with some days/columns overridden (``weather_rows``)
+and/or shifted (``offsets``, e.g. {"precipitation_sum": 10}). Every dish of a
+store is evaluated under every scenario in one batched pass instead of
+S x D separate forecasts:
+
+- Prophet runs once per dish on the base weather. Its weather regressors are
+  linear, so each scenario only shifts yhat by coef . (x_scenario - x_base)
+  (times the trend for multiplicative regressors). Those shifts are computed
+  for all scenarios x dishes x days with a single einsum.
+- The recursive tree-residual forecast runs with the scenarios as the batch
+  dimension: one (S x TREE_FEATURES) tree_model.predict per dish and day,
+  each scenario keeping its own lag state.
+
+Dishes served by a distilled student (app.inference.serves_student) are
+forecast by the student, as /predict serves them, with the same scenario
+batching; their records carry "distilled": true.
+
+The base forecast is always returned as the "baseline" scenario so callers
+can diff against it.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.inference import (
+    HISTORY_DAYS,
+    TREE_FEATURES,
+    ForecastInputs,
+    ModelStore,
+    direct_horizon,
+    exogenous_features,
+    holiday_flags,
+    lag_feature_matrix,
+    prepare_forecast_inputs,
+    prepare_forecast_weather,
+    serves_student,
+    student_step,
+)
+from app.metrics import stage_timer
+from pipeline_common import WEATHER_COLS
+
+if TYPE_CHECKING:
+    from app.deadline import Deadline
+
+BASELINE = "baseline"
+
+_coefficients: "weakref.WeakKeyDictionary[Any, Tuple[np.ndarray, np.ndarray]]" = weakref.WeakKeyDictionary()
+_coefficients_lock = threading.Lock()
+
+
+def regressor_coefficients(prophet_model: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (additive, multiplicative) coefficients of a fitted Prophet model's
+    WEATHER_COLS regressors, in data units, cached per loaded model. A column
+    that is not a regressor of the model gets 0 in both.
+    """
+    with _coefficients_lock:
+        cached = _coefficients.get(prophet_model)
+    if cached is not None:
+        return cached
+
+    from prophet.utilities import regressor_coefficients as _prophet_coefficients
+
+    additive = np.zeros(len(WEATHER_COLS))
+    multiplicative = np.zeros(len(WEATHER_COLS))
+    if getattr(prophet_model, "extra_regressors", None):
+        coefs = _prophet_coefficients(prophet_model).set_index("regressor")
+        for j, col in enumerate(WEATHER_COLS):
+            if col not in coefs.index:
+                continue
+            row = coefs.loc[col]
+            target = multiplicative if row["regressor_mode"] == "multiplicative" else additive
+            target[j] = float(row["coef"])
+
+    with _coefficients_lock:
+        _coefficients[prophet_model] = (additive, multiplicative)
+    return additive, multiplicative
+
+
+def scenario_weather(base: pd.DataFrame, spec: Dict[str, Any]) -> np.ndarray:
+    """
+    (days x WEATHER_COLS) weather matrix of one scenario: the base forecast,
+    with weather_rows overriding the dates/columns they mention, then offsets
+    added per column.
+    """
+    frame = base[["date"] + WEATHER_COLS].copy()
+    frame["date"] = pd.to_datetime(frame["date"]).dt.normalize()
+
+    rows = spec.get("weather_rows") or []
+    if rows:
+        override = pd.DataFrame(rows)
+        if "date" not in override.columns:
+            raise ValueError(f"Scenario '{spec.get('name')}': weather_rows need a date")
+        unknown = sorted(set(override.columns) - {"date"} - set(WEATHER_COLS))
+        if unknown:
+            raise ValueError(f"Scenario '{spec.get('name')}': unknown weather columns {unknown}")
+        override["date"] = pd.to_datetime(override["date"]).dt.normalize()
+        override = override.drop_duplicates("date", keep="last").set_index("date")
+        frame = frame.set_index("date")
+        frame.update(override)
+        frame = frame.reset_index()
+
+    for col, delta in (spec.get("offsets") or {}).items():
+        if col not in WEATHER_COLS:
+            raise ValueError(f"Scenario '{spec.get('name')}': unknown weather column '{col}'")
+        frame[col] = frame[col].astype(float) + float(delta)
+
+    return frame[WEATHER_COLS].to_numpy(dtype=float)
+
+
+def _prophet_scenarios(
+    inputs: List[ForecastInputs],
+    weather: np.ndarray,
+) -> np.ndarray:
+    """
+    (scenarios x dishes x days) Prophet yhat. weather is (scenarios x days x
+    WEATHER_COLS) with the base weather at index 0.
+    """
+    coefs = [regressor_coefficients(x.loaded.prophet_model) for x in inputs]
+    additive = np.stack([c[0] for c in coefs])           # dishes x cols
+    multiplicative = np.stack([c[1] for c in coefs])     # dishes x cols
+    base_yhat = np.stack([x.prophet_yhat for x in inputs])   # dishes x days
+    trend = np.stack([x.prophet_trend for x in inputs])      # dishes x days
+
+    shift = weather - weather[:1]                        # scenarios x days x cols
+    delta = np.einsum("stc,dc->sdt", shift, additive)
+    if multiplicative.any():
+        delta += trend[None] * np.einsum("stc,dc->sdt", shift, multiplicative)
+    return base_yhat[None] + delta
+
+
+def _tree_scenarios(
+    inputs: ForecastInputs,
+    meta: Dict[str, Any],
+    recent_sales: List[float],
+    weather: np.ndarray,
+    prophet_yhat: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Recursive residual forecast of one dish with scenarios as the batch
+    dimension (direct multi-horizon dishes keep the origin's lags).
+    Returns (yhat, residual_hat), each (scenarios x days).
+    """
+    direct = direct_horizon(meta)
+    n_scen, n_days, _ = weather.shape
+    history = np.tile(np.asarray(recent_sales, dtype=float)[-HISTORY_DAYS:], (n_scen, 1))
+    yhat = np.empty((n_scen, n_days))
+    resid = np.empty((n_scen, n_days))
+
+    for i in range(n_days):
+        feat = exogenous_features(inputs, i)
+        batch = lag_feature_matrix(history)
+        batch["prophet_yhat"] = prophet_yhat[:, i]
+        for j, col in enumerate(WEATHER_COLS):
+            batch[col] = weather[:, i, j]
+        X = pd.DataFrame({
+            k: batch[k] if k in batch else np.full(n_scen, feat.get(k, 0.0))
+            for k in TREE_FEATURES
+        })
+        if direct:
+            X["horizon"] = float(min(i + 1, direct))
+        with stage_timer("tree_predict"):
+            resid[:, i] = np.asarray(inputs.loaded.tree_model.predict(X), dtype=float)
+        yhat[:, i] = np.maximum(prophet_yhat[:, i] + resid[:, i], 0.0)
+        if not direct:
+            history = np.concatenate([history, yhat[:, i:i + 1]], axis=1)[:, -HISTORY_DAYS:]
+    return yhat, resid
+
+
+def _student_scenarios(
+    meta: Dict[str, Any],
+    recent_sales: List[float],
+    dates: pd.DatetimeIndex,
+    weather: np.ndarray,
+    holidays: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    _tree_scenarios for a dish served by its student.
+    Returns (yhat, base, lag_part), each (scenarios x days).
+    """
+    direct = direct_horizon(meta)
+    n_scen, n_days, _ = weather.shape
+    history = np.tile(np.asarray(recent_sales, dtype=float)[-HISTORY_DAYS:], (n_scen, 1))
+    yhat = np.empty((n_scen, n_days))
+    base = np.empty((n_scen, n_days))
+    lag_part = np.empty((n_scen, n_days))
+
+    for i in range(n_days):
+        base[:, i], lag_part[:, i] = student_step(
+            meta["student"], dates[i], weather[:, i, :], holidays[i],
+            float(min(i + 1, direct or 1)), lag_feature_matrix(history),
+        )
+        yhat[:, i] = np.maximum(base[:, i] + lag_part[:, i], 0.0)
+        if not direct:
+            history = np.concatenate([history, yhat[:, i:i + 1]], axis=1)[:, -HISTORY_DAYS:]
+    return yhat, base, lag_part
+
+
+def _scenario_record(
+    dish: str, model: Dict[str, Any], horizon_days: int, start: pd.Timestamp,
+    dates: List[str], yhat: np.ndarray, base: np.ndarray, resid: np.ndarray,
+) -> Dict[str, Any]:
+    return {
+        "dish": dish,
+        **model,
+        "horizon_days": horizon_days,
+        "start_date": start.strftime("%Y-%m-%d"),
+        "total": float(yhat.sum()),
+        "predictions": [
+            {
+                "date": dates[i],
+                "yhat": float(yhat[i]),
+                "prophet_yhat": float(base[i]),
+                "residual_hat": float(resid[i]),
+            }
+            for i in range(len(dates))
+        ],
+    }
+
+
+def forecast_store_scenarios(
+    store: ModelStore,
+    dishes: List[str],
+    recent_sales_for: Callable[[str], List[float]],
+    horizon_days: int,
+    scenarios: List[Dict[str, Any]],
+    address: str = "Shanghai, China",
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    country_code: Optional[str] = None,
+    weather_rows: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional["Deadline"] = None,
+) -> Dict[str, Any]:
+    """
+    Forecast every dish under the baseline and every scenario.
+    Returns {"scenarios": {name: {dish: result}}, "errors": {dish: error},
+    "skipped_dishes": [...]} where result is shaped like predict_dish() output
+    without intervals.
+    """
+    names = [BASELINE] + [s["name"] for s in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Scenario names must be unique and not '{BASELINE}'")
+
+    prepared: Dict[str, Tuple[ForecastInputs, List[float]]] = {}
+    students: Dict[str, List[float]] = {}
+    errors: Dict[str, str] = {}
+    skipped: List[str] = []
+    for dish in dishes:
+        if deadline is not None and deadline.should_stop():
+            skipped.append(dish)
+            continue
+        dish_started = time.perf_counter()
+        try:
+            recent_sales = recent_sales_for(dish)
+            if not recent_sales:
+                raise ValueError("recent_sales cannot be empty")
+            if serves_student(store.registry.get(dish, {})):
+                students[dish] = recent_sales
+            else:
+                inputs = prepare_forecast_inputs(
+                    store, dish, horizon_days, None, address,
+                    latitude, longitude, country_code, weather_rows,
+                )
+                prepared[dish] = (inputs, recent_sales)
+        except Exception as e:
+            errors[dish] = str(e)
+        if deadline is not None:
+            deadline.record(time.perf_counter() - dish_started)
+
+    student_cc: Optional[str] = None
+    if students:
+        try:
+            student_start, student_weather, student_cc = prepare_forecast_weather(
+                horizon_days, None, address, latitude, longitude, country_code, weather_rows,
+            )
+        except Exception as e:
+            errors.update({dish: str(e) for dish in students})
+            students = {}
+
+    out: Dict[str, Dict[str, Any]] = {name: {} for name in names}
+    if not prepared and not students:
+        return {"scenarios": out, "errors": errors, "skipped_dishes": skipped}
+
+    # Every dish shares the store's weather, so the scenario matrices are built once
+    if prepared:
+        first = next(iter(prepared.values()))[0]
+        start, base = first.start, first.future_weather
+    else:
+        start, base = student_start, student_weather
+    weather = np.stack([base[WEATHER_COLS].to_numpy(dtype=float)] + [
+        scenario_weather(base, spec) for spec in scenarios
+    ])
+    day_index = pd.DatetimeIndex(pd.to_datetime(base["date"]))
+    dates = day_index.strftime("%Y-%m-%d").tolist()
+
+    if students:
+        holidays = holiday_flags(day_index, student_cc)
+        for dish, recent_sales in students.items():
+            meta = store.registry.get(dish, {})
+            try:
+                yhat, base_part, lag_part = _student_scenarios(meta, recent_sales, day_index, weather, holidays)
+            except Exception as e:
+                errors[dish] = str(e)
+                continue
+            model = {
+                "model": meta.get("model"),
+                "model_combo": f"Student[{meta['student']['kind']}] of Prophet+{meta.get('model')}",
+                "distilled": True,
+            }
+            for s, name in enumerate(names):
+                out[name][dish] = _scenario_record(
+                    dish, model, horizon_days, start, dates, yhat[s], base_part[s], lag_part[s]
+                )
+
+    order = list(prepared)
+    if not order:
+        return {"scenarios": out, "errors": errors, "skipped_dishes": skipped}
+    with stage_timer("scenario_prophet"):
+        prophet_yhat = _prophet_scenarios([prepared[d][0] for d in order], weather)
+
+    for k, dish in enumerate(order):
+        inputs, recent_sales = prepared[dish]
+        try:
+            yhat, resid = _tree_scenarios(
+                inputs, store.registry.get(dish, {}), recent_sales, weather, prophet_yhat[:, k, :]
+            )
+        except Exception as e:
+            errors[dish] = str(e)
+            continue
+        model = {"model": inputs.loaded.champion, "model_combo": f"Prophet+{inputs.loaded.champion}"}
+        for s, name in enumerate(names):
+            out[name][dish] = _scenario_record(
+                dish, model, horizon_days, inputs.start, dates, yhat[s], prophet_yhat[s, k, :], resid[s]
+            )
+
+    return {"scenarios": out, "errors": errors, "skipped_dishes": skipped}
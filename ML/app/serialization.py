@@ -0,0 +1,183 @@
+"""
+Compact response encoding for forecast payloads.
+
+The default ("records") layout repeats the keys date / yhat / prophet_yhat /
+residual_hat / lower / upper for every forecast day and goes through Pydantic response_model
+validation. The opt-in "columnar" layout stores one shared date axis plus one
+array per column and per dish, and is encoded directly (no re-validation):
+
+- application/json                     -> orjson when installed, else stdlib json
+- application/msgpack                  -> msgpack (optional dependency)
+- application/vnd.apache.arrow.stream  -> Arrow IPC stream (optional dependency)
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.metrics import stage_timer
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgpack  # type: ignore
+except Exception:  # pragma: no cover
+    msgpack = None  # type: ignore
+
+# pyarrow is large; it is imported on the first Arrow-encoded response.
+
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+PREDICTION_COLUMNS = ("yhat", "prophet_yhat", "residual_hat", "lower", "upper")
+
+
+def dish_to_columnar(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert one predict_dish() result into column arrays (dates included)."""
+    if "error" in result:
+        return {"error": result["error"]}
+
+    rows = result.get("predictions") or []
+    out: Dict[str, Any] = {
+        k: v for k, v in result.items() if k not in ("dish", "predictions")
+    }
+    out["dates"] = [r["date"] for r in rows]
+    for col in PREDICTION_COLUMNS:
+        out[col] = [r.get(col) for r in rows]  # cold-start forecasts lack the hybrid columns
+    return out
+
+
+def store_to_columnar(
+    store_id: int,
+    status: str,
+    predictions: Dict[str, Dict[str, Any]],
+    **extra: Any,
+) -> Dict[str, Any]:
+    """
+    Build the columnar store payload:
+    {"store_id", "status", "dates": [...], "dishes": {dish: {"model", ..., "yhat": [...]}}}
+
+    All dishes of a store share start_date / horizon, so the date axis is
+    hoisted to the top level. A dish whose axis differs keeps its own "dates".
+    """
+    dates: Optional[List[str]] = None
+    dishes: Dict[str, Any] = {}
+
+    for dish, result in predictions.items():
+        col = dish_to_columnar(result)
+        if "error" not in col:
+            if dates is None:
+                dates = col["dates"]
+            if col["dates"] == dates:
+                del col["dates"]
+        dishes[dish] = col
+
+    payload: Dict[str, Any] = {"store_id": store_id, "status": status}
+    payload.update(extra)
+    payload["dates"] = dates or []
+    payload["dishes"] = dishes
+    return payload
+
+
+# ---------------------------------------------------------------------------
+# Encoders
+# ---------------------------------------------------------------------------
+
+def dumps_json(payload: Any) -> bytes:
+    """Fast JSON encoding of our own (already well-typed) outputs."""
+    if orjson is not None:
+        # default=str like the stdlib and msgpack paths (Timestamps etc.)
+        return orjson.dumps(payload, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def dumps_msgpack(payload: Any) -> bytes:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(payload, use_bin_type=True, default=str)
+
+
+def dumps_arrow(payload: Dict[str, Any]) -> bytes:
+    """
+    Encode a columnar store payload as an Arrow IPC stream in long format
+    (dish, date, yhat, prophet_yhat, residual_hat, lower, upper). Store-level fields and
+    per-dish metadata go into the schema metadata as JSON.
+    """
+    try:
+        import pyarrow as pa  # type: ignore
+    except Exception as e:
+        raise RuntimeError("pyarrow is not installed") from e
+
+    shared_dates = payload.get("dates") or []
+    dish_col: List[str] = []
+    date_col: List[str] = []
+    values: Dict[str, List[float]] = {c: [] for c in PREDICTION_COLUMNS}
+    dish_meta: Dict[str, Any] = {}
+
+    for dish, col in (payload.get("dishes") or {}).items():
+        meta = {k: v for k, v in col.items() if k not in PREDICTION_COLUMNS and k != "dates"}
+        dish_meta[dish] = meta
+        if "error" in col:
+            continue
+        dates = col.get("dates", shared_dates)
+        dish_col.extend([dish] * len(dates))
+        date_col.extend(dates)
+        for c in PREDICTION_COLUMNS:
+            values[c].extend(col[c])
+
+    store_meta = {k: v for k, v in payload.items() if k not in ("dates", "dishes")}
+    table = pa.table(
+        {
+            "dish": pa.array(dish_col, type=pa.string()).dictionary_encode(),
+            "date": pa.array(date_col, type=pa.string()),
+            **{c: pa.array(values[c], type=pa.float64()) for c in PREDICTION_COLUMNS},
+        }
+    ).replace_schema_metadata({
+        "store": json.dumps(store_meta, default=str),
+        "dishes": json.dumps(dish_meta, default=str),
+    })
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """Pick the body encoding from the Accept header (JSON unless asked otherwise)."""
+    accept = (accept or "").lower()
+    if ARROW_MEDIA_TYPE in accept:
+        return ARROW_MEDIA_TYPE
+    if MSGPACK_MEDIA_TYPE in accept or "application/x-msgpack" in accept:
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def encode_payload(payload: Dict[str, Any], media_type: str) -> Tuple[bytes, str]:
+    if media_type == ARROW_MEDIA_TYPE:
+        return dumps_arrow(payload), ARROW_MEDIA_TYPE
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return dumps_msgpack(payload), MSGPACK_MEDIA_TYPE
+    return dumps_json(payload), JSON_MEDIA_TYPE
+
+
+def columnar_response(payload: Dict[str, Any], accept: Optional[str]) -> Response:
+    """Encode a columnar payload per the Accept header, bypassing response_model."""
+    media_type = negotiate_media_type(accept)
+    if media_type == ARROW_MEDIA_TYPE and "dishes" not in payload:
+        raise HTTPException(status_code=406, detail="Arrow encoding is only available for store payloads")
+    try:
+        with stage_timer("serialization"):
+            body, media_type = encode_payload(payload, media_type)
+    except RuntimeError as e:
+        raise HTTPException(status_code=406, detail=str(e)) from e
+    return Response(content=body, media_type=media_type)
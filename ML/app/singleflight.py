@@ -0,0 +1,71 @@
+"""
+Per-key single-flight execution for expensive loads.
+
+Under FastAPI's threadpool several cold requests can ask for the same
+artifact at once. SingleFlight lets exactly one thread (the leader) run the
+loader for a key while the others wait for and share its result. A failed
+load is remembered for ``failure_ttl`` seconds so a burst of requests for a
+broken artifact does not retry it in a tight loop.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self, failure_ttl: float = 5.0) -> None:
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call[T]] = {}
+        self._failures: Dict[Hashable, Tuple[float, BaseException]] = {}
+
+    def do(self, key: Hashable, loader: Callable[[], T]) -> T:
+        """Run loader once per key among concurrent callers and return its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                failed = self._failures.get(key)
+                if failed is not None:
+                    if time.monotonic() - failed[0] < self.failure_ttl:
+                        raise failed[1]
+                    del self._failures[key]
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result  # type: ignore[return-value]
+
+        try:
+            call.result = loader()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._failures[key] = (time.monotonic(), e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def forget(self, key: Hashable) -> None:
+        """Drop a cached failure (e.g. after retraining wrote new artifacts)."""
+        with self._lock:
+            self._failures.pop(key, None)
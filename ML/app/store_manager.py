@@ -13,13 +13,18 @@ from __future__ import annotations
 import os
 import logging
 import threading
+import time
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
-from sqlalchemy import create_engine, text
 
-from app.inference import ModelStore
+from app.admission import TrainingQueue
+from app.events import TERMINAL_EVENTS, TrainingEvents, post_callbacks
+from app.inference import ARTIFACT_FAILURE_TTL_SECONDS, ModelStore
+from app.metrics import observe_stage, stage_timer
+from app.singleflight import SingleFlight
+from app.store_metadata import StoreMetadata, StoreMetadataCache
 
 logger = logging.getLogger(__name__)
 
@@ -33,10 +38,28 @@ class StoreModelManager:
         self.base_model_dir = Path(base_model_dir)
         self.base_model_dir.mkdir(parents=True, exist_ok=True)
         self._stores: Dict[int, ModelStore] = {}
+        self._store_loads: SingleFlight[Optional[ModelStore]] = SingleFlight(
+            failure_ttl=ARTIFACT_FAILURE_TTL_SECONDS
+        )
         self._training_lock = threading.Lock()
         self._training_in_progress: Dict[int, bool] = {}
         self._training_progress: Dict[int, Dict[str, Any]] = {}  # {store_id: {trained, failed, total, current_dish}}
+        self._training_callbacks: Dict[int, List[str]] = {}
+        self._sales_days: Dict[int, Tuple[float, int]] = {}  # {store_id: (monotonic time, unique days)}
+        self.sales_days_ttl = float(os.getenv("SALES_DAYS_TTL_SECONDS", "300"))
+        self.events = TrainingEvents()
         self._engine = None  # Cached SQLAlchemy engine
+        self.store_metadata = StoreMetadataCache(
+            self.fetch_store_location,
+            self.fetch_store_locations,
+            ttl=float(os.getenv("STORE_METADATA_TTL_SECONDS", "3600")),
+            max_entries=int(os.getenv("STORE_METADATA_MAX_ENTRIES", "10000")),
+        )
+        self._training_queue = TrainingQueue(
+            max_concurrent=int(os.getenv("TRAIN_MAX_CONCURRENCY", "1")),
+            max_queue=int(os.getenv("TRAIN_MAX_QUEUE", "16")),
+            retry_after=int(os.getenv("TRAIN_RETRY_AFTER_SECONDS", "60")),
+        )
 
     # ------------------------------------------------------------------
     # Public helpers
@@ -50,21 +73,82 @@ class StoreModelManager:
         registry_path = self.store_model_dir(store_id) / "champion_registry.pkl"
         return registry_path.exists()
 
+    def list_store_ids(self) -> List[int]:
+        """Stores that have a trained registry under base_model_dir."""
+        ids = []
+        for path in self.base_model_dir.glob("store_*/champion_registry.pkl"):
+            try:
+                ids.append(int(path.parent.name.removeprefix("store_")))
+            except ValueError:
+                continue
+        return sorted(ids)
+
     def is_training(self, store_id: int) -> bool:
-        return self._training_in_progress.get(store_id, False)
+        """True while a store is training or waiting in the training queue."""
+        return self._training_in_progress.get(store_id, False) or self._training_queue.is_pending(store_id)
+
+    def enqueue_training(self, store_id: int, callback_url: Optional[str] = None) -> str:
+        """
+        Queue background training for a store. callback_url, if given, is
+        POSTed the terminal training event (also when already queued).
+        Returns 'queued' or 'already_queued'; raises AdmissionRejected when the queue is full.
+        """
+        # Registered before submitting so a fast run cannot finish without it
+        if callback_url:
+            with self._training_lock:
+                self._training_callbacks.setdefault(store_id, []).append(callback_url)
+        if self._training_in_progress.get(store_id, False):
+            return "already_queued"
+        try:
+            status = self._training_queue.submit(store_id, self.train_store_models)
+        except Exception:
+            if callback_url:
+                with self._training_lock:
+                    self._training_callbacks.get(store_id, []).remove(callback_url)
+            raise
+        if status == "queued":
+            self.events.publish(store_id, "queued")
+        return status
 
     def get_training_progress(self, store_id: int) -> Optional[Dict[str, Any]]:
         """Return current training progress for a store, or None if not training."""
         return self._training_progress.get(store_id)
 
+    def _set_progress(self, store_id: int, **progress: Any) -> None:
+        self._training_progress[store_id] = progress
+        self.events.publish(store_id, "progress", **progress)
+
+    def get_store_metadata(self, store_id: int, refresh: bool = False) -> StoreMetadata:
+        """Cached coordinates / country code / weather cell of a store (see app.store_metadata)."""
+        return self.store_metadata.get(store_id, refresh=refresh)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Sizes of the in-memory caches (exported as /metrics gauges)."""
+        stores = list(self._stores.values())
+        return {
+            "loaded_stores": len(stores),
+            "cached_dish_models": sum(len(ms._cache) for ms in stores),
+            "stores_training": sum(1 for v in self._training_in_progress.values() if v),
+            "training_queue_depth": self._training_queue.depth(),
+            "store_metadata_entries": len(self.store_metadata),
+        }
+
     def get_store(self, store_id: int) -> Optional[ModelStore]:
         """Return a loaded ModelStore for the given store, or None."""
-        if store_id in self._stores:
-            return self._stores[store_id]
+        store = self._stores.get(store_id)
+        if store is not None:
+            return store
 
         if not self.has_models(store_id):
             return None
 
+        # Single-flight: concurrent first requests share one registry load
+        return self._store_loads.do(store_id, lambda: self._load_store(store_id))
+
+    def _load_store(self, store_id: int) -> ModelStore:
+        store = self._stores.get(store_id)
+        if store is not None:
+            return store
         store = ModelStore(model_dir=str(self.store_model_dir(store_id)))
         store.load_registry()
         self._stores[store_id] = store
@@ -73,6 +157,7 @@ class StoreModelManager:
     def reload_store(self, store_id: int) -> Optional[ModelStore]:
         """Force-reload models for a store (e.g. after training)."""
         self._stores.pop(store_id, None)
+        self._store_loads.forget(store_id)
         return self.get_store(store_id)
 
     # ------------------------------------------------------------------
@@ -89,6 +174,9 @@ class StoreModelManager:
             db_url = self._get_db_url()
             if not db_url:
                 return None
+            # Imported lazily: only needed once a DB-backed request arrives
+            from sqlalchemy import create_engine
+
             # Add connect_timeout to avoid hanging on unreachable DB
             connect_args = {"connect_timeout": 5}
             self._engine = create_engine(
@@ -99,6 +187,17 @@ class StoreModelManager:
             )
         return self._engine
 
+    def cached_sales_days(self, store_id: int) -> int:
+        """
+        Unique sales days of a store as seen by the last fetch_store_sales
+        (training runs one as it starts), re-read only once that is older
+        than sales_days_ttl. For status polls that must not query per call.
+        """
+        hit = self._sales_days.get(store_id)
+        if hit is not None and time.monotonic() - hit[0] < self.sales_days_ttl:
+            return hit[1]
+        return self.fetch_store_sales(store_id)[1]
+
     def fetch_store_sales(
         self, store_id: int
     ) -> Tuple[Optional[pd.DataFrame], int]:
@@ -114,6 +213,8 @@ class StoreModelManager:
             logger.warning("DATABASE_URL not set — cannot fetch store sales.")
             return None, 0
 
+        from sqlalchemy import text
+
         try:
             query = text("""
                 SELECT s.Date   AS date,
@@ -124,7 +225,8 @@ class StoreModelManager:
                 WHERE s.StoreId = :store_id
                 ORDER BY s.Date ASC
             """)
-            df = pd.read_sql(query, engine, params={"store_id": store_id})
+            with stage_timer("sql_fetch"):
+                df = pd.read_sql(query, engine, params={"store_id": store_id})
             df["date"] = pd.to_datetime(df["date"]).dt.normalize()
             df = (
                 df.groupby(["date", "dish"])
@@ -133,6 +235,7 @@ class StoreModelManager:
                 .sort_values("date")
             )
             unique_days = int(df["date"].nunique())
+            self._sales_days[store_id] = (time.monotonic(), unique_days)
             logger.info(
                 "Store %d: fetched %d rows, %d unique days.", store_id, len(df), unique_days
             )
@@ -141,11 +244,40 @@ class StoreModelManager:
             logger.error("Failed to fetch sales for store %d: %s", store_id, e)
             return None, 0
 
+    def fetch_sales_watermark(self, store_id: int) -> Optional[Tuple[Any, ...]]:
+        """
+        Cheap summary of a store's SalesData (row count, last date, total
+        quantity) that changes whenever sales are added or corrected.
+        Returns None when the database is unavailable.
+        """
+        engine = self._get_engine()
+        if not engine:
+            return None
+
+        from sqlalchemy import text
+
+        try:
+            query = text("""
+                SELECT COUNT(*) AS n, MAX(Date) AS last_date, SUM(Quantity) AS total
+                FROM SalesData
+                WHERE StoreId = :store_id
+            """)
+            with stage_timer("sql_fetch"):
+                with engine.connect() as conn:
+                    row = conn.execute(query, {"store_id": store_id}).one()
+            return (int(row.n), str(row.last_date), float(row.total or 0))
+        except Exception as e:
+            logger.error("Failed to fetch sales watermark for store %d: %s", store_id, e)
+            return None
+
     def fetch_store_location(self, store_id: int) -> Tuple[Optional[float], Optional[float], Optional[str]]:
         """Fetch store lat/lon/country_code from the database."""
         engine = self._get_engine()
         if not engine:
             return None, None, None
+
+        from sqlalchemy import text
+
         try:
             query = text("""
                 SELECT Latitude, Longitude, CountryCode
@@ -153,7 +285,8 @@ class StoreModelManager:
                 WHERE Id = :store_id
                 LIMIT 1
             """)
-            row = pd.read_sql(query, engine, params={"store_id": store_id})
+            with stage_timer("location_lookup"):
+                row = pd.read_sql(query, engine, params={"store_id": store_id})
             if row.empty:
                 return None, None, None
             lat = float(row.iloc[0]["Latitude"])
@@ -164,6 +297,150 @@ class StoreModelManager:
             logger.error("Failed to fetch store location for %d: %s", store_id, e)
             return None, None, None
 
+    def fetch_store_locations(
+        self, store_ids: List[int]
+    ) -> Dict[int, Tuple[Optional[float], Optional[float], Optional[str]]]:
+        """Fetch lat/lon/country_code for many stores with a single query."""
+        engine = self._get_engine()
+        if not engine or not store_ids:
+            return {}
+
+        from sqlalchemy import bindparam, text
+
+        try:
+            query = text("""
+                SELECT Id, Latitude, Longitude, CountryCode
+                FROM Store
+                WHERE Id IN :store_ids
+            """).bindparams(bindparam("store_ids", expanding=True))
+            with stage_timer("location_lookup"):
+                rows = pd.read_sql(query, engine, params={"store_ids": list(store_ids)})
+            return {
+                int(r["Id"]): (
+                    float(r["Latitude"]) if pd.notna(r["Latitude"]) else None,
+                    float(r["Longitude"]) if pd.notna(r["Longitude"]) else None,
+                    str(r["CountryCode"]) if r["CountryCode"] else None,
+                )
+                for _, r in rows.iterrows()
+            }
+        except Exception as e:
+            logger.error("Failed to fetch store locations for %d stores: %s", len(store_ids), e)
+            return {}
+
+    # ------------------------------------------------------------------
+    # Forecast write-back
+    # ------------------------------------------------------------------
+
+    FORECAST_WRITE_BATCH_ROWS = int(os.getenv("FORECAST_WRITE_BATCH_ROWS", "1000"))
+
+    def write_forecasts(self, store_id: int, predictions: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Replace a store's ForecastData rows with a forecast batch
+        ({dish: predict_dish() result}), the way the .NET backend saves
+        /store/{id}/predict output: dishes are matched to the store's Recipes
+        by name (case-insensitive), quantities are max(0, round(yhat)), and
+        the existing rows of the written recipes in the batch's date range are
+        deleted before the new ones are inserted with multi-row INSERTs, all
+        in one transaction. Recipes without a forecast in the batch (failed,
+        skipped or unmatched dishes) keep their rows. Returns a summary;
+        raises when the database is unavailable or the write fails (nothing
+        is written then).
+        """
+        engine = self._get_engine()
+        if not engine:
+            raise RuntimeError("DATABASE_URL not set — cannot write forecasts.")
+
+        import uuid
+        from datetime import datetime, timezone
+
+        from sqlalchemy import CHAR, Column, DateTime, Integer, MetaData, Table, bindparam, insert, text
+
+        forecast_table = Table(
+            "ForecastData", MetaData(),
+            Column("Id", CHAR(36), primary_key=True),
+            Column("StoreId", Integer),
+            Column("RecipeId", CHAR(36)),
+            Column("ForecastDate", DateTime),
+            Column("PredictedQuantity", Integer),
+            Column("CreatedAt", DateTime),
+            Column("UpdatedAt", DateTime),
+        )
+
+        with stage_timer("sql_fetch"):
+            recipes = pd.read_sql(
+                text("SELECT Id, Name FROM Recipes WHERE StoreId = :store_id"),
+                engine, params={"store_id": store_id},
+            )
+        recipe_ids = {str(r["Name"]).lower(): str(r["Id"]) for _, r in recipes.iterrows()}
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows: List[Dict[str, Any]] = []
+        unmatched: List[str] = []
+        failed: List[str] = []
+        for dish, result in predictions.items():
+            if "error" in result or not result.get("predictions"):
+                failed.append(dish)
+                continue
+            recipe_id = recipe_ids.get(dish.lower())
+            if recipe_id is None:
+                unmatched.append(dish)
+                continue
+            for day in result["predictions"]:
+                rows.append({
+                    "Id": str(uuid.uuid4()),
+                    "StoreId": store_id,
+                    "RecipeId": recipe_id,
+                    "ForecastDate": pd.Timestamp(day["date"]).normalize().to_pydatetime(),
+                    "PredictedQuantity": int(max(0, round(float(day["yhat"])))),
+                    "CreatedAt": now,
+                    "UpdatedAt": now,
+                })
+
+        deleted = 0
+        if rows:
+            min_date = min(r["ForecastDate"] for r in rows)
+            max_date = max(r["ForecastDate"] for r in rows)
+            with stage_timer("sql_write"):
+                with engine.begin() as conn:
+                    # Only the recipes written here: skipped / failed / unmatched
+                    # dishes keep their existing forecasts
+                    deleted = conn.execute(
+                        text("""
+                            DELETE FROM ForecastData
+                            WHERE StoreId = :store_id
+                              AND RecipeId IN :recipe_ids
+                              AND ForecastDate >= :min_date AND ForecastDate <= :max_date
+                        """).bindparams(
+                            bindparam("recipe_ids", expanding=True),
+                            # Typed like the inserted values, so both render alike
+                            bindparam("min_date", type_=DateTime),
+                            bindparam("max_date", type_=DateTime),
+                        ),
+                        {
+                            "store_id": store_id,
+                            "recipe_ids": sorted({r["RecipeId"] for r in rows}),
+                            "min_date": min_date,
+                            "max_date": max_date,
+                        },
+                    ).rowcount
+                    for i in range(0, len(rows), self.FORECAST_WRITE_BATCH_ROWS):
+                        conn.execute(insert(forecast_table).values(rows[i:i + self.FORECAST_WRITE_BATCH_ROWS]))
+            logger.info(
+                "Store %d: wrote %d forecast rows (%d replaced) for %s..%s.",
+                store_id, len(rows), deleted, min_date.date(), max_date.date(),
+            )
+
+        dates = sorted({r["ForecastDate"] for r in rows})
+        return {
+            "rows_written": len(rows),
+            "rows_deleted": int(deleted or 0),
+            "dishes_written": len(predictions) - len(unmatched) - len(failed),
+            "unmatched_dishes": unmatched,
+            "failed_dishes": failed,
+            "date_from": dates[0].strftime("%Y-%m-%d") if dates else None,
+            "date_to": dates[-1].strftime("%Y-%m-%d") if dates else None,
+        }
+
     # ------------------------------------------------------------------
     # Training
     # ------------------------------------------------------------------
@@ -172,8 +449,24 @@ class StoreModelManager:
         """
         Train ML models for a given store.
         This is a BLOCKING call — run it in a background thread.
-        Returns a summary dict.
+        Returns a summary dict, which is also published as the terminal
+        training event and POSTed to any registered callback URLs.
         """
+        result = self._train_store_models(store_id)
+        if result.get("status") == "already_training":
+            return result
+        status = result.get("status")
+        event = self.events.publish(
+            store_id, status if status in TERMINAL_EVENTS else "error",
+            **{k: v for k, v in result.items() if k not in ("status", "store_id")},
+        )
+        with self._training_lock:
+            callbacks = self._training_callbacks.pop(store_id, [])
+        if callbacks:
+            post_callbacks(callbacks, event)
+        return result
+
+    def _train_store_models(self, store_id: int) -> Dict[str, Any]:
         with self._training_lock:
             if self._training_in_progress.get(store_id):
                 return {"status": "already_training", "store_id": store_id}
@@ -193,17 +486,24 @@ class StoreModelManager:
                     "days_available": unique_days,
                 }
 
-            lat, lon, country_code = self.fetch_store_location(store_id)
+            # Training is rare: re-read the Store row so edited coordinates are picked up
+            lat, lon, country_code = self.get_store_metadata(store_id, refresh=True).location
 
             # Import training logic (heavy — only when needed)
             from training_logic_v2 import (
                 PipelineConfig,
                 process_dish,
                 add_local_context,
+                set_stage_observer,
             )
             import joblib
 
+            set_stage_observer(observe_stage)
             config = PipelineConfig()
+            # GPU probing fits dummy models on every tree library; allow turning it off
+            config.use_gpu = os.getenv("ML_USE_GPU", "1") != "0"
+            config.forecast_mode = os.getenv("ML_FORECAST_MODE", config.forecast_mode)
+            config.distill_student = os.getenv("ML_DISTILL_STUDENTS", "0") == "1"
             model_dir = str(self.store_model_dir(store_id))
             config.model_dir = model_dir
             Path(model_dir).mkdir(parents=True, exist_ok=True)
@@ -225,26 +525,24 @@ class StoreModelManager:
             total = len(dishes)
 
             # Initialize progress
-            self._training_progress[store_id] = {
-                "trained": 0,
-                "failed": 0,
-                "total": total,
-                "current_dish": None,
-            }
+            self._set_progress(store_id, trained=0, failed=0, total=total, current_dish=None)
 
             for i, dish in enumerate(dishes):
-                self._training_progress[store_id] = {
-                    "trained": trained,
-                    "failed": failed,
-                    "total": total,
-                    "current_dish": dish,
-                }
+                self._set_progress(store_id, trained=trained, failed=failed, total=total, current_dish=dish)
                 try:
-                    result = process_dish(dish, dish_frames[dish], cc, config)
+                    with stage_timer("train_dish"):
+                        result = process_dish(dish, dish_frames[dish], cc, config)
                     champion_map[dish] = {
                         "model": result["champion"],
                         "mae": result.get("champion_mae", 0.0),
                         "all_mae": result["mae"],
+                        "cv_residuals": result.get("cv_residuals", []),
+                        "cv_residuals_1step": result.get("cv_residuals_1step", []),
+                        "error_quantiles": result.get("error_quantiles"),
+                        "forecast_mode": result.get("forecast_mode", "recursive"),
+                        "direct_horizon": result.get("direct_horizon"),
+                        "student": result.get("student"),
+                        "train_end": result.get("train_end"),
                     }
                     trained += 1
                 except Exception as e:
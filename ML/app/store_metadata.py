@@ -0,0 +1,140 @@
+"""
+Cached store metadata (coordinates, country code, weather grid cell).
+
+Store coordinates almost never change, yet every store predict without
+coordinates in the request and every training run used to read them from
+the Store table. StoreMetadataCache keeps one entry per store for
+``ttl`` seconds:
+
+- concurrent misses for a store share one query (SingleFlight), and bulk
+  lookups fetch all missing stores with a single query;
+- a lookup that found nothing (unknown store, or the database unavailable)
+  is not cached, so it is retried on the next request;
+- invalidate(store_id) drops an entry (or all of them) after the store's
+  location is edited; DELETE /store/{id}/metadata calls it.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.inference import weather_grid_cell
+from app.singleflight import SingleFlight
+
+Location = Tuple[Optional[float], Optional[float], Optional[str]]
+
+
+@dataclass(frozen=True)
+class StoreMetadata:
+    store_id: int
+    latitude: Optional[float]
+    longitude: Optional[float]
+    country_code: Optional[str]
+    weather_cell: Optional[Tuple[float, float]]  # weather_grid_cell(lat, lon)
+    fetched_at: float  # time.time() of the database read
+
+    @property
+    def location(self) -> Location:
+        return self.latitude, self.longitude, self.country_code
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _metadata(store_id: int, location: Location) -> StoreMetadata:
+    lat, lon, cc = location
+    return StoreMetadata(
+        store_id=store_id,
+        latitude=lat,
+        longitude=lon,
+        country_code=cc,
+        weather_cell=weather_grid_cell(lat, lon) if lat is not None and lon is not None else None,
+        fetched_at=time.time(),
+    )
+
+
+class StoreMetadataCache:
+    """TTL + LRU cache of StoreMetadata in front of the Store table."""
+
+    def __init__(
+        self,
+        fetch_one: Callable[[int], Location],
+        fetch_many: Callable[[List[int]], Dict[int, Location]],
+        ttl: float = 3600.0,
+        max_entries: int = 10000,
+    ) -> None:
+        self._fetch_one = fetch_one
+        self._fetch_many = fetch_many
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[float, StoreMetadata]]" = OrderedDict()
+        self._loads: SingleFlight[StoreMetadata] = SingleFlight(failure_ttl=0.0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cached(self, store_id: int) -> Optional[StoreMetadata]:
+        with self._lock:
+            hit = self._entries.get(store_id)
+            if hit is None:
+                return None
+            if time.monotonic() - hit[0] >= self.ttl:
+                del self._entries[store_id]
+                return None
+            self._entries.move_to_end(store_id)
+            return hit[1]
+
+    def _put(self, meta: StoreMetadata) -> None:
+        if meta.location == (None, None, None):
+            return  # nothing found (or the database was down): retry next time
+        with self._lock:
+            self._entries[meta.store_id] = (time.monotonic(), meta)
+            self._entries.move_to_end(meta.store_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, store_id: int, refresh: bool = False) -> StoreMetadata:
+        """Metadata for one store; refresh bypasses (and replaces) the cached entry."""
+        if not refresh:
+            hit = self._cached(store_id)
+            if hit is not None:
+                return hit
+
+        def load() -> StoreMetadata:
+            meta = _metadata(store_id, self._fetch_one(store_id))
+            self._put(meta)
+            return meta
+
+        return self._loads.do(store_id, load)
+
+    def get_many(self, store_ids: List[int]) -> Dict[int, StoreMetadata]:
+        """Metadata for many stores; all misses are fetched with one query."""
+        out: Dict[int, StoreMetadata] = {}
+        missing: List[int] = []
+        for sid in store_ids:
+            hit = self._cached(sid)
+            if hit is not None:
+                out[sid] = hit
+            else:
+                missing.append(sid)
+        if missing:
+            fetched = self._fetch_many(missing)
+            for sid in missing:
+                meta = _metadata(sid, fetched.get(sid, (None, None, None)))
+                self._put(meta)
+                out[sid] = meta
+        return out
+
+    def invalidate(self, store_id: Optional[int] = None) -> int:
+        """Drop one store's entry (or every entry); returns how many were dropped."""
+        with self._lock:
+            if store_id is None:
+                n = len(self._entries)
+                self._entries.clear()
+                return n
+            return 1 if self._entries.pop(store_id, None) is not None else 0
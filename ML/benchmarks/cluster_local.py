@@ -0,0 +1,92 @@
+"""
+Local check for consistent-hash store routing.
+
+Starts one uvicorn process per port with the same ML_CLUSTER_NODES and its
+own ML_NODE_ID, then asks every node for the status of every store and
+asserts each answer came from the store's owner (X-ML-Node) and that the
+nodes agree on ownership. Also prints how many stores move when a node is
+added to the ring. Exits non-zero on any mismatch.
+
+    cd ML
+    python -m benchmarks.cluster_local --ports 8001 8002 8003 --stores 50 --mode forward
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import requests
+
+from app.routing import HashRing
+
+
+def _wait_ready(url: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1.0).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Multi-process store routing check")
+    parser.add_argument("--ports", type=int, nargs="+", default=[8001, 8002, 8003])
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--mode", choices=["redirect", "forward"], default="forward")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    nodes: Dict[str, str] = {f"n{i}": f"http://127.0.0.1:{p}" for i, p in enumerate(args.ports)}
+    spec = ",".join(f"{k}={v}" for k, v in nodes.items())
+    procs: List[subprocess.Popen] = []
+    try:
+        for node_id, url in nodes.items():
+            env = {**os.environ, "ML_CLUSTER_NODES": spec, "ML_NODE_ID": node_id, "ML_ROUTING_MODE": args.mode}
+            procs.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", url.rsplit(":", 1)[1]],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+        for url in nodes.values():
+            if not _wait_ready(url, args.startup_timeout):
+                print(f"{url} did not become ready")
+                return 2
+
+        ring = HashRing(nodes)
+        failures = 0
+        for sid in range(1, args.stores + 1):
+            expected = ring.owner(sid)
+            for node_id, url in nodes.items():
+                r = requests.get(f"{url}/store/{sid}/status", timeout=30)
+                served_by = r.headers.get("x-ml-node")
+                owner = requests.get(f"{url}/cluster", params={"store_id": sid}, timeout=5).json()["owner"]
+                if not r.ok or served_by != expected or owner != expected:
+                    failures += 1
+                    print(f"store {sid} via {node_id}: status={r.status_code} served_by={served_by} "
+                          f"reported_owner={owner} expected={expected}")
+
+        ids = list(range(1, args.stores + 1))
+        grown = HashRing({**nodes, "new": "http://127.0.0.1:0"})
+        moved = sum(ring.owner(s) != grown.owner(s) for s in ids)
+        print(f"distribution: {ring.distribution(ids)}")
+        print(f"adding a node moves {moved}/{len(ids)} stores "
+              f"(ideal ~{len(ids) / (len(nodes) + 1):.0f})")
+        print("routing OK" if failures == 0 else f"{failures} routing mismatches")
+        return 0 if failures == 0 else 1
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Cold-start benchmark for the inference service.
+
+Each run starts a fresh interpreter and reports:
+- import time of app.main (what uvicorn pays before serving),
+- which heavy training-only modules got imported along the way,
+- time to first prediction (registry + artifact load + predict_dish),
+- time of a second, warm prediction for comparison.
+
+Weather rows and coordinates are passed explicitly so no network is used.
+
+    cd ML
+    python -m benchmarks.cold_start --model-dir models/store_1 --runs 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HEAVY_MODULES = (
+    "optuna", "sklearn", "sqlalchemy", "geopy", "shap",
+    "xgboost", "catboost", "lightgbm", "prophet", "pyarrow",
+)
+
+
+def _child(model_dir: str) -> None:
+    t0 = time.perf_counter()
+    import app.main  # noqa: F401
+    import_s = time.perf_counter() - t0
+    heavy_after_import = sorted(m for m in HEAVY_MODULES if m in sys.modules)
+
+    import joblib
+    import pandas as pd
+
+    from app.inference import ModelStore, predict_dish, safe_filename
+
+    weather_rows = [
+        {
+            "date": d.strftime("%Y-%m-%d"),
+            "temperature_2m_max": 25.0,
+            "temperature_2m_min": 18.0,
+            "relative_humidity_2m_mean": 65.0,
+            "precipitation_sum": 0.0,
+        }
+        for d in pd.date_range(pd.Timestamp.now().normalize(), periods=20, freq="D")
+    ]
+
+    t1 = time.perf_counter()
+    ms = ModelStore(model_dir=model_dir)
+    ms.load_registry()
+    dishes = ms.list_dishes()
+    recent_path = Path(model_dir) / f"recent_sales_{safe_filename(dishes[0])}.pkl"
+    recent = joblib.load(str(recent_path))["sales"].astype(float).tolist() if recent_path.exists() else [10.0] * 28
+
+    def run(dish: str) -> None:
+        predict_dish(
+            store=ms, dish=dish, recent_sales=recent, horizon_days=14,
+            latitude=31.23, longitude=121.47, country_code="CN", weather_rows=weather_rows,
+        )
+
+    run(dishes[0])
+    first_s = time.perf_counter() - t1
+
+    t2 = time.perf_counter()
+    run(dishes[0])
+    warm_s = time.perf_counter() - t2
+
+    print(json.dumps({
+        "import_s": import_s,
+        "first_prediction_s": first_s,
+        "warm_prediction_s": warm_s,
+        "heavy_after_import": heavy_after_import,
+        "heavy_after_prediction": sorted(m for m in HEAVY_MODULES if m in sys.modules),
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inference service cold-start benchmark")
+    parser.add_argument("--model-dir", default="models/store_1")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.model_dir)
+        return
+
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.cold_start", "--child", "--model-dir", args.model_dir],
+            check=True, capture_output=True, text=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    def med(key: str) -> float:
+        return statistics.median(r[key] for r in results) * 1000.0
+
+    print(f"{args.runs} fresh interpreters, model dir {args.model_dir} (median)")
+    print(f"  import app.main          {med('import_s'):9.1f} ms")
+    print(f"  time to first prediction {med('first_prediction_s'):9.1f} ms")
+    print(f"  warm prediction          {med('warm_prediction_s'):9.1f} ms")
+    print(f"  heavy modules after import:     {', '.join(results[-1]['heavy_after_import']) or '-'}")
+    print(f"  heavy modules after prediction: {', '.join(results[-1]['heavy_after_prediction']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
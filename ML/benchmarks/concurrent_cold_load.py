@@ -0,0 +1,86 @@
+"""
+Stress check for single-flight artifact loading.
+
+Fires many concurrent "first requests" at a cold StoreModelManager and
+asserts that the registry and every Prophet / tree artifact is unpickled
+exactly once. joblib.load is wrapped with a counter and a small delay to
+widen the race window. Exits non-zero on any duplicate load.
+
+    cd ML
+    python -m benchmarks.concurrent_cold_load --store-id 1 --threads 32
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import app.inference as inference
+from app.store_manager import StoreModelManager
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Concurrent cold-load stress check")
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--store-id", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--load-delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    loads: Counter = Counter()
+    lock = threading.Lock()
+    real_load = inference.joblib.load
+
+    def counting_load(path, *a, **kw):
+        with lock:
+            loads[str(path)] += 1
+        time.sleep(args.load_delay_ms / 1000.0)
+        return real_load(path, *a, **kw)
+
+    inference.joblib.load = counting_load
+    try:
+        manager = StoreModelManager(base_model_dir=args.model_dir)
+        if not manager.has_models(args.store_id):
+            print(f"No models for store {args.store_id} under {args.model_dir}")
+            return 2
+
+        barrier = threading.Barrier(args.threads)
+
+        def cold_request(seed: int) -> int:
+            barrier.wait()
+            ms = manager.get_store(args.store_id)
+            dishes = ms.list_dishes()
+            random.Random(seed).shuffle(dishes)
+            ok = 0
+            for dish in dishes:
+                try:
+                    ms.get_dish_model(dish)
+                    ok += 1
+                except Exception:
+                    pass  # missing artifacts count as a (cached) failed load
+            return ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(cold_request, range(args.threads)))
+        elapsed = time.perf_counter() - started
+    finally:
+        inference.joblib.load = real_load
+
+    duplicates = {path: n for path, n in loads.items() if n != 1}
+    print(f"{args.threads} concurrent cold requests, {len(loads)} files, {sum(loads.values())} loads, {elapsed:.2f}s")
+    if duplicates:
+        for path, n in sorted(duplicates.items()):
+            print(f"  FAIL {path} loaded {n} times")
+        return 1
+    print("  OK every file loaded exactly once")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Compare response size and serialization time of the store forecast payload:
+today's "records" layout (Pydantic response_model + standard JSON encoder)
+versus the opt-in "columnar" layout (fast JSON / MessagePack / Arrow IPC).
+
+Uses a synthetic payload, so no trained models are needed:
+
+    cd ML
+    python -m benchmarks.serialization_bench --dishes 200 --horizon 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from app.main import StorePredictResponse
+from app.serialization import (
+    dumps_arrow,
+    dumps_json,
+    dumps_msgpack,
+    store_to_columnar,
+)
+
+
+def _synthetic_store_predictions(n_dishes: int, horizon: int) -> Dict[str, Dict[str, Any]]:
+    rng = random.Random(42)
+    dates = [d.strftime("%Y-%m-%d") for d in pd.date_range("2026-01-01", periods=horizon, freq="D")]
+    out: Dict[str, Dict[str, Any]] = {}
+    for i in range(n_dishes):
+        rows = []
+        for d in dates:
+            p = rng.uniform(5.0, 80.0)
+            r = rng.uniform(-5.0, 5.0)
+            rows.append({"date": d, "yhat": max(0.0, p + r), "prophet_yhat": p, "residual_hat": r})
+        out[f"Dish {i:04d}"] = {
+            "dish": f"Dish {i:04d}",
+            "model": "lightgbm",
+            "model_combo": "Prophet+lightgbm",
+            "horizon_days": horizon,
+            "start_date": dates[0],
+            "predictions": rows,
+        }
+    return out
+
+
+def _records_today(payload: Dict[str, Any]) -> bytes:
+    """What FastAPI does for the default endpoint: validate, jsonable_encoder, json.dumps."""
+    model = StorePredictResponse(**payload)
+    content = jsonable_encoder(model)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _time_it(fn: Callable[[], bytes], repeat: int) -> Tuple[float, int]:
+    body = fn()  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = fn()
+    return (time.perf_counter() - started) * 1000.0 / repeat, len(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dishes", type=int, default=100)
+    parser.add_argument("--horizon", type=int, default=14)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    predictions = _synthetic_store_predictions(args.dishes, args.horizon)
+    records_payload = {"store_id": 1, "status": "ok", "predictions": predictions}
+
+    cases: List[Tuple[str, Callable[[], bytes]]] = [
+        ("records  / response_model + json", lambda: _records_today(records_payload)),
+        ("columnar / fast json", lambda: dumps_json(store_to_columnar(1, "ok", predictions))),
+        ("columnar / msgpack", lambda: dumps_msgpack(store_to_columnar(1, "ok", predictions))),
+        ("columnar / arrow ipc", lambda: dumps_arrow(store_to_columnar(1, "ok", predictions))),
+    ]
+
+    print(f"{args.dishes} dishes x {args.horizon} days, {args.repeat} runs each")
+    print(f"{'format':<36} {'ms/op':>10} {'bytes':>12} {'size vs today':>14}")
+    baseline_size = None
+    for name, fn in cases:
+        try:
+            ms, size = _time_it(fn, args.repeat)
+        except RuntimeError as e:
+            print(f"{name:<36} {'skipped':>10} ({e})")
+            continue
+        baseline_size = baseline_size or size
+        print(f"{name:<36} {ms:>10.2f} {size:>12,d} {size / baseline_size:>13.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Lightweight definitions shared by the training pipeline and the inference service.
+
+Only the standard library is imported at module level so the serving path
+(`app.inference`) can use these without pulling in optuna, sklearn,
+sqlalchemy or the tree libraries that `training_logic_v2` needs. Geocoding
+imports geopy on first use.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+WEATHER_COLS = ['temperature_2m_max', 'temperature_2m_min',
+                'relative_humidity_2m_mean', 'precipitation_sum']
+
+HOLIDAY_YEARS = (2024, 2025, 2026)
+
+# Tree-model features grouped for SHAP explanations
+FEATURE_GROUPS: Dict[str, List[str]] = {
+    "Seasonality": ["day_of_week", "month", "day", "dayofyear", "is_weekend"],
+    "Holiday": ["is_public_holiday"],
+    "Weather": list(WEATHER_COLS),
+    "Lags/Trend": [
+        "y_lag_1", "y_lag_7", "y_lag_14",
+        "y_roll_mean_7", "y_roll_std_7",
+        "y_roll_mean_14", "y_roll_std_14",
+        "y_roll_mean_28", "y_roll_std_28",
+        "horizon",  # direct models: how old the origin lags are
+    ],
+    "ProphetTrend": ["prophet_yhat"],
+}
+
+
+def feature_group_index(features: Sequence[str], groups: Dict[str, List[str]]) -> Dict[str, List[int]]:
+    """Column positions of each group in `features`; ungrouped columns go to "Other"."""
+    feat_to_group = {f: g for g, feats in groups.items() for f in feats}
+    index: Dict[str, List[int]] = {}
+    for i, feat in enumerate(features):
+        index.setdefault(feat_to_group.get(feat, "Other"), []).append(i)
+    return index
+
+
+def safe_filename(name):
+    """Sanitize dish name for use as a filename."""
+    return name.replace(' ', '_').replace('-', '_').replace('/', '_')
+
+
+def geocode_address(
+    address, timeout: Optional[float] = None
+) -> Tuple[Optional[float], Optional[float], Optional[str]]:
+    """
+    Like get_location_details, but service errors (timeouts, HTTP failures)
+    propagate so callers such as a circuit breaker can tell them apart from
+    an address that simply was not found.
+    """
+    from geopy.geocoders import Nominatim
+
+    geolocator = Nominatim(user_agent="smartsus_chef_v3")
+    location = geolocator.geocode(address, addressdetails=True, timeout=timeout)
+    if location is None:
+        logger.warning("Could not geocode address: '%s'", address)
+        return None, None, None
+    lat = location.latitude
+    lon = location.longitude
+    country_code = location.raw.get('address', {}).get('country_code', '').upper()
+    logger.info("Geocoded '%s' -> Lat: %.4f, Lon: %.4f, Country: %s", address, lat, lon, country_code)
+    return lat, lon, country_code
+
+
+def get_location_details(address) -> Tuple[Optional[float], Optional[float], Optional[str]]:
+    """
+    Convert an address or postal code to (latitude, longitude, country_code)
+    using the Nominatim geocoding service (OpenStreetMap).
+    """
+    try:
+        return geocode_address(address)
+    except Exception as e:
+        logger.warning("Geocoding failed for '%s': %s", address, e)
+        return None, None, None
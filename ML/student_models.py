@@ -0,0 +1,132 @@
+"""
+Compact student models distilled from the Prophet + tree hybrid.
+
+A student is a ridge-regularized linear model over a linear trend, weekly
+and yearly Fourier terms, the holiday flag, weather and the same lag /
+rolling features the tree sees (plus the horizon step for direct dishes).
+It is fitted by training_logic_v2.distill_student to reproduce the
+champion's hybrid predictions, and stored inline in the registry as plain
+lists, so serving it needs neither the Prophet nor the tree artifact — a
+forecast day is one dot product.
+
+Only numpy and pandas are imported so both the training pipeline and the
+inference service can use it.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+STUDENT_KIND = "linear_fourier"
+
+
+def _design(frame: pd.DataFrame, student: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """(rows x terms) design matrix and a mask of the terms built from lags."""
+    dates = pd.to_datetime(frame["date"])
+    t = (dates - pd.Timestamp(student["origin"])).dt.days.to_numpy(dtype=float) / 365.25
+    dow = dates.dt.dayofweek.to_numpy(dtype=float)
+    doy = dates.dt.dayofyear.to_numpy(dtype=float)
+
+    columns: List[np.ndarray] = [t]
+    for k in range(1, student["weekly_order"] + 1):
+        columns += [np.sin(2 * np.pi * k * dow / 7.0), np.cos(2 * np.pi * k * dow / 7.0)]
+    for k in range(1, student["yearly_order"] + 1):
+        columns += [np.sin(2 * np.pi * k * doy / 365.25), np.cos(2 * np.pi * k * doy / 365.25)]
+    n_base = len(columns)
+    for name in student["inputs"]:
+        columns.append(frame[name].to_numpy(dtype=float))
+
+    lag_mask = np.zeros(len(columns), dtype=bool)
+    lag_mask[n_base:] = [name in student["lag_inputs"] for name in student["inputs"]]
+    return np.column_stack(columns), lag_mask
+
+
+def fit_student(
+    frame: pd.DataFrame,
+    target: np.ndarray,
+    inputs: Sequence[str],
+    lag_inputs: Sequence[str],
+    weekly_order: int = 3,
+    yearly_order: int = 4,
+    ridge: float = 1.0,
+) -> Dict[str, Any]:
+    """
+    Fit a student on frame (date + inputs) to target (the teacher's yhat).
+    Returns a picklable dict of plain lists.
+    """
+    student: Dict[str, Any] = {
+        "kind": STUDENT_KIND,
+        "origin": pd.to_datetime(frame["date"]).min().strftime("%Y-%m-%d"),
+        "weekly_order": int(weekly_order),
+        "yearly_order": int(yearly_order),
+        "inputs": list(inputs),
+        "lag_inputs": [c for c in lag_inputs if c in inputs],
+    }
+    X, _ = _design(frame, student)
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    Z = (X - mean) / scale
+
+    y = np.asarray(target, dtype=float)
+    intercept = float(y.mean())
+    gram = Z.T @ Z + ridge * np.eye(Z.shape[1])
+    coef = np.linalg.solve(gram, Z.T @ (y - intercept))
+
+    student.update({
+        "mean": mean.tolist(),
+        "scale": scale.tolist(),
+        "coef": coef.tolist(),
+        "intercept": intercept,
+    })
+    return student
+
+
+def lag_contribution(student: Dict[str, Any], values: Dict[str, float]) -> float:
+    """
+    lag_part of predict_student for one row, from its lag-input values only.
+    Lets a recursive forecast compute the base once and update just this.
+    """
+    n_base = 1 + 2 * student["weekly_order"] + 2 * student["yearly_order"]
+    total = 0.0
+    for j, name in enumerate(student["inputs"], start=n_base):
+        if name in student["lag_inputs"]:
+            z = (float(values[name]) - student["mean"][j]) / student["scale"][j]
+            total += student["coef"][j] * z
+    return total
+
+
+def term_names(student: Dict[str, Any]) -> List[str]:
+    """Names of the design terms, in student_terms column order."""
+    names = ["trend"]
+    for k in range(1, student["weekly_order"] + 1):
+        names += [f"weekly_sin_{k}", f"weekly_cos_{k}"]
+    for k in range(1, student["yearly_order"] + 1):
+        names += [f"yearly_sin_{k}", f"yearly_cos_{k}"]
+    return names + list(student["inputs"])
+
+
+def student_terms(student: Dict[str, Any], frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (rows x terms) contribution of every term (see term_names) and the
+    lag-term mask; a row's forecast is max(intercept + row sum, 0), so the
+    terms are an exact additive explanation of it.
+    """
+    X, lag_mask = _design(frame, student)
+    Z = (X - np.asarray(student["mean"])) / np.asarray(student["scale"])
+    return Z * np.asarray(student["coef"]), lag_mask
+
+
+def predict_student(student: Dict[str, Any], frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (base, lag_part) per row; the forecast is max(base + lag_part, 0).
+    base covers trend, seasonality, holiday and weather (the Prophet-like
+    part), lag_part the contribution of the recent-sales features.
+    """
+    terms, lag_mask = student_terms(student, frame)
+    lag_part = terms[:, lag_mask].sum(axis=1)
+    base = student["intercept"] + terms[:, ~lag_mask].sum(axis=1)
+    return base, lag_part
@@ -0,0 +1,131 @@
+"""
+Admission control: past its slots and wait queue a lane answers 429, a
+request that waits too long gets 503, both with Retry-After, and paths
+without a lane are never held back.
+"""
+
+import asyncio
+import re
+import threading
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("fastapi")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import StreamingResponse  # noqa: E402
+
+from app.admission import AdmissionMiddleware, AdmissionRejected, Lane, TrainingQueue  # noqa: E402
+
+
+def _app(lane, release):
+    inner = FastAPI()
+
+    @inner.get("/work")
+    async def work():
+        await release.wait()
+        return {"status": "ok"}
+
+    @inner.get("/stream")
+    async def stream():
+        async def body():
+            yield b"a"
+            await release.wait()
+            yield b"b"
+        return StreamingResponse(body())
+
+    @inner.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return AdmissionMiddleware(inner, routes=[(re.compile(r"^/(work|stream)$"), lane)])
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def _until(predicate):
+    while not predicate():
+        await asyncio.sleep(0.005)
+
+
+def test_full_queue_is_429_and_queue_timeout_is_503():
+    async def scenario():
+        lane = Lane("predict", max_concurrent=1, max_queue=1, queue_timeout=0.3, retry_after=7)
+        release = asyncio.Event()
+        async with _client(_app(lane, release)) as client:
+            holder = asyncio.create_task(client.get("/work"))
+            await _until(lambda: lane.active == 1)
+            waiter = asyncio.create_task(client.get("/work"))
+            await _until(lambda: lane.waiting == 1)
+
+            rejected = await client.get("/work")
+            health = await client.get("/health")  # no lane: served while the lane is full
+            timed_out = await waiter
+            release.set()
+            held = await holder
+        return rejected, health, timed_out, held, lane
+
+    rejected, health, timed_out, held, lane = asyncio.run(scenario())
+    assert rejected.status_code == 429 and rejected.headers["retry-after"] == "7"
+    assert rejected.json() == {"status": "overloaded", "lane": "predict", "message": "predict queue is full"}
+    assert health.status_code == 200
+    assert timed_out.status_code == 503 and timed_out.headers["retry-after"] == "7"
+    assert held.status_code == 200
+    assert lane.active == 0 and lane.waiting == 0
+
+
+def test_queued_request_runs_when_a_slot_frees():
+    async def scenario():
+        lane = Lane("predict", max_concurrent=1, max_queue=1, queue_timeout=5.0, retry_after=1)
+        release = asyncio.Event()
+        async with _client(_app(lane, release)) as client:
+            first = asyncio.create_task(client.get("/work"))
+            await _until(lambda: lane.active == 1)
+            second = asyncio.create_task(client.get("/work"))
+            await _until(lambda: lane.waiting == 1)
+            release.set()
+            return [(await first).status_code, (await second).status_code]
+
+    assert asyncio.run(scenario()) == [200, 200]
+
+
+def test_streaming_response_holds_its_slot_until_the_body_is_sent():
+    async def scenario():
+        lane = Lane("predict", max_concurrent=1, max_queue=0, queue_timeout=1.0, retry_after=2)
+        release = asyncio.Event()
+        async with _client(_app(lane, release)) as client:
+            streaming = asyncio.create_task(client.get("/stream"))
+            await _until(lambda: lane.active == 1)
+            busy = await client.get("/work")
+            release.set()
+            done = await streaming
+            after = await client.get("/work")
+        return busy, done, after
+
+    busy, done, after = asyncio.run(scenario())
+    assert busy.status_code == 429
+    assert done.content == b"ab"
+    assert after.status_code == 200
+
+
+def test_training_queue_rejects_when_full():
+    started, gate = threading.Event(), threading.Event()
+
+    def train(store_id):
+        started.set()
+        gate.wait(5)
+
+    queue = TrainingQueue(max_concurrent=1, max_queue=1, retry_after=30)
+    assert queue.submit(1, train) == "queued"
+    started.wait(5)
+    assert queue.submit(1, train) == "already_queued"  # running
+    assert queue.submit(2, train) == "queued"
+    assert queue.submit(2, train) == "already_queued"  # waiting
+    with pytest.raises(AdmissionRejected) as exc:
+        queue.submit(3, train)
+    assert exc.value.status_code == 503 and exc.value.retry_after == 30
+    assert exc.value.to_response().headers["retry-after"] == "30"
+    gate.set()
@@ -0,0 +1,113 @@
+"""
+Concurrent cold requests must unpickle the registry and every artifact
+exactly once, and a broken artifact must not be retried within the failure
+TTL. Artifacts are small stub objects; joblib.load is wrapped with a
+counter and a delay that widens the race window.
+"""
+
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+joblib = pytest.importorskip("joblib")
+
+import app.inference as inference  # noqa: E402
+from app.store_manager import StoreModelManager  # noqa: E402
+
+DISHES = ["Fried Rice", "Laksa", "Chicken Rice"]
+THREADS = 24
+
+
+def _write_store(store_dir, broken=()):
+    store_dir.mkdir(parents=True)
+    joblib.dump({d: {"model": "xgboost", "mae": 1.0} for d in DISHES}, store_dir / "champion_registry.pkl")
+    for dish in DISHES:
+        safe = inference.safe_filename(dish)
+        joblib.dump({"stub": "prophet", "dish": dish}, store_dir / f"prophet_{safe}.pkl")
+        tree = store_dir / f"xgboost_{safe}.pkl"
+        if dish in broken:
+            tree.write_bytes(b"not a pickle")
+        else:
+            joblib.dump({"stub": "tree", "dish": dish}, tree)
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    counts = Counter()
+    lock = threading.Lock()
+    real_load = inference.joblib.load
+
+    def counting_load(path, *a, **kw):
+        with lock:
+            counts[str(path)] += 1
+        time.sleep(0.02)
+        return real_load(path, *a, **kw)
+
+    monkeypatch.setattr(inference.joblib, "load", counting_load)
+    return counts
+
+
+def _concurrently(fn):
+    barrier = threading.Barrier(THREADS)
+    errors = []
+
+    def run(i):
+        barrier.wait()
+        try:
+            fn(i)
+        except Exception as e:  # collected and asserted on below
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def test_concurrent_cold_requests_load_each_file_once(tmp_path, loads):
+    _write_store(tmp_path / "store_1")
+    manager = StoreModelManager(base_model_dir=str(tmp_path))
+
+    def cold_request(i):
+        ms = manager.get_store(1)
+        dishes = ms.list_dishes()
+        for dish in dishes[i % len(dishes):] + dishes[:i % len(dishes)]:
+            assert ms.get_dish_model(dish).dish == dish
+
+    assert _concurrently(cold_request) == []
+    assert loads  # the counter saw the loads
+    assert all(n == 1 for n in loads.values()), dict(loads)
+    assert len(loads) == 1 + 2 * len(DISHES)
+
+
+def test_broken_artifact_is_not_retried_within_failure_ttl(tmp_path, loads, monkeypatch):
+    monkeypatch.setattr(inference, "ARTIFACT_FAILURE_TTL_SECONDS", 0.5)
+    _write_store(tmp_path / "store_1", broken={"Laksa"})
+    ms = inference.ModelStore(model_dir=str(tmp_path / "store_1"))
+    ms.load_registry()
+    tree_path = str(tmp_path / "store_1" / f"xgboost_{inference.safe_filename('Laksa')}.pkl")
+
+    errors = _concurrently(lambda i: ms.get_dish_model("Laksa"))
+    assert len(errors) == THREADS
+    assert loads[tree_path] == 1
+
+    # Within the TTL the cached failure is served without touching the file
+    with pytest.raises(Exception):
+        ms.get_dish_model("Laksa")
+    assert loads[tree_path] == 1
+
+    # After the TTL the (now fixed) artifact is loaded again
+    time.sleep(0.55)
+    joblib.dump({"stub": "tree", "dish": "Laksa"}, tree_path)
+    assert ms.get_dish_model("Laksa").tree_model["dish"] == "Laksa"
+    assert loads[tree_path] == 2
+
+    # Healthy dishes are unaffected
+    assert ms.get_dish_model("Laksa").dish == "Laksa"
+    assert ms.get_dish_model("Fried Rice").dish == "Fried Rice"
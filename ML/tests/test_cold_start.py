@@ -0,0 +1,88 @@
+"""
+Cold-start ensemble: members are weighted by inverse one-step MAE (equal
+weights on short histories) and intervals are quantiles of the ensemble's
+one-step errors.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+from app import cold_start  # noqa: E402
+
+START = pd.Timestamp("2024-04-01")  # a Monday, the day after the history ends
+WEEKLY = [10.0, 12.0, 14.0, 16.0, 18.0, 40.0, 30.0]  # Monday .. Sunday
+
+
+def _sales(values, end=START - pd.Timedelta(days=1)):
+    dates = pd.date_range(end=end, periods=len(values), freq="D")
+    return pd.DataFrame({"date": dates, "sales": values})
+
+
+def _weekly(days):
+    dates = pd.date_range(end=START - pd.Timedelta(days=1), periods=days, freq="D")
+    return [WEEKLY[d] for d in dates.dayofweek]
+
+
+def test_short_history_uses_equal_weights_and_a_spread_interval():
+    values = [5.0, 7.0, 6.0, 9.0, 8.0, 4.0, 6.0, 7.0, 5.0, 8.0]
+    out = cold_start.forecast_dish("Laksa", _sales(values), 7, START)
+
+    assert out["weights"] == {"seasonal_naive": 0.333, "weekday_mean": 0.333, "ses": 0.333}
+    spread = float(np.abs(np.array(values) - np.mean(values)).mean())
+    for row in out["predictions"]:
+        assert row["upper"] - row["yhat"] == pytest.approx(spread)
+        assert row["yhat"] - row["lower"] == pytest.approx(min(spread, row["yhat"]))
+
+
+def test_exact_weekly_pattern_is_carried_by_the_weekday_members():
+    out = cold_start.forecast_dish("Laksa", _sales(_weekly(10 * 7)), 14, START)
+
+    assert out["weights"]["ses"] < 0.001
+    assert out["weights"]["seasonal_naive"] == pytest.approx(0.5, abs=0.001)
+    for h, row in enumerate(out["predictions"]):
+        assert row["yhat"] == pytest.approx(WEEKLY[h % 7], rel=1e-4)
+        assert row["upper"] - row["lower"] == pytest.approx(0.0, abs=1e-3)  # no one-step error
+
+
+def test_weights_are_inverse_mae_and_intervals_error_quantiles():
+    rng = np.random.default_rng(0)
+    values = np.maximum(0.0, np.array(_weekly(12 * 7)) + rng.normal(0.0, 4.0, 12 * 7)).round()
+    sales = _sales(values)
+    out = cold_start.forecast_dish("Laksa", sales, 7, START)
+
+    series = cold_start._daily_series(sales).iloc[-cold_start.HISTORY_DAYS:]
+    errors = cold_start._one_step_errors(series.to_numpy(), series.index.dayofweek.to_numpy())
+    inv = 1.0 / np.abs(errors).mean(axis=0)
+    weights = inv / inv.sum()
+    assert list(out["weights"].values()) == pytest.approx(weights.round(3).tolist())
+
+    lo, hi = np.quantile(errors @ weights, cold_start.INTERVAL_LEVELS)
+    for row in out["predictions"]:
+        assert row["lower"] == pytest.approx(max(0.0, row["yhat"] + lo))
+        assert row["upper"] == pytest.approx(row["yhat"] + hi)
+        assert row["lower"] <= row["yhat"] <= row["upper"]
+
+
+def test_gaps_count_as_zero_sales_days():
+    sales = _sales([8.0] * 30)
+    sales = sales[sales["date"].dt.dayofweek != 2]  # no sales recorded on Wednesdays
+    series = cold_start._daily_series(sales)
+    assert len(series) == 30 and (series[series.index.dayofweek == 2] == 0.0).all()
+
+
+def test_forecast_store_covers_every_dish():
+    rows = []
+    for dish, scale in (("Laksa", 1.0), ("Satay", 2.0)):
+        rows.append(_sales([v * scale for v in _weekly(8 * 7)]).assign(dish=dish))
+    out = cold_start.forecast_store(pd.concat(rows), 7, START)
+
+    assert list(out) == ["Laksa", "Satay"]
+    assert out["Satay"]["predictions"][0]["yhat"] == pytest.approx(2 * out["Laksa"]["predictions"][0]["yhat"])
+    assert all(d["model"] == "cold_start" and d["start_date"] == "2024-04-01" for d in out.values())
+
+
+def test_empty_history_is_an_error():
+    with pytest.raises(ValueError):
+        cold_start.forecast_dish("Laksa", _sales([])[:0], 7, START)
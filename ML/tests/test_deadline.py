@@ -0,0 +1,98 @@
+"""
+Request deadlines: the smaller of header and body budget wins, the budget
+starts when the request arrived, and store predictions stop before a dish
+that no longer fits, reporting the rest as skipped.
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from starlette.requests import Request  # noqa: E402
+
+import app.deadline as deadline_mod  # noqa: E402
+from app.deadline import Deadline  # noqa: E402
+
+
+def _request(headers=None, received_at=None):
+    scope = {
+        "type": "http", "method": "POST", "path": "/store/7/predict", "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "state": {} if received_at is None else {"received_at": received_at},
+    }
+    return Request(scope)
+
+
+def test_no_budget_means_no_deadline():
+    d = Deadline.from_request(_request(), watch_disconnect=False)
+    assert d.expires_at is None and d.remaining() == float("inf") and not d.should_stop()
+
+
+@pytest.mark.parametrize("header, body, budget", [
+    ("2000", None, 2.0), (None, 1500, 1.5), ("2000", 500, 0.5), ("300", 5000, 0.3), ("soon", 800, 0.8),
+])
+def test_smaller_budget_wins(header, body, budget):
+    now = time.monotonic()
+    headers = {"X-Request-Timeout-Ms": header} if header else {}
+    d = Deadline.from_request(_request(headers, received_at=now), body, watch_disconnect=False)
+    assert d.expires_at == pytest.approx(now + budget)
+
+
+def test_budget_starts_when_the_request_arrived():
+    arrived = time.monotonic() - 1.0  # e.g. a second spent waiting for an admission slot
+    d = Deadline.from_request(_request(received_at=arrived), 1200, watch_disconnect=False)
+    assert d.remaining() == pytest.approx(0.2, abs=0.05)
+
+
+def test_stops_when_the_next_unit_cannot_fit(monkeypatch):
+    monkeypatch.setattr(deadline_mod, "SAFETY_MARGIN_SECONDS", 0.1)
+    roomy = Deadline(expires_at=time.monotonic() + 10.0)
+    tight = Deadline(expires_at=time.monotonic() + 0.35)
+    assert not tight.should_stop()  # no dish done yet: only the margin must fit
+
+    for d in (roomy, tight):
+        d.record(0.2)
+        d.record(0.4)
+    assert not roomy.should_stop()
+    assert tight.should_stop()  # 0.35 s left < 0.3 s per dish + 0.1 s margin
+    assert not tight.cancelled
+
+
+def test_disconnect_cancels():
+    gone = [False]
+    d = Deadline(None, is_disconnected=lambda: gone[0])
+    assert not d.should_stop()
+    gone[0] = True
+    assert d.should_stop() and d.cancelled
+
+
+def test_store_payload_is_partial_when_the_deadline_cuts_it(monkeypatch):
+    main = pytest.importorskip("app.main")
+    dishes = ["Laksa", "Satay", "Rojak", "Mee Goreng"]
+    ms = SimpleNamespace(list_dishes=lambda: list(dishes))
+    monkeypatch.setattr(main, "_resolve_store_location", lambda sid, req: (1.3, 103.8, "SG"))
+    monkeypatch.setattr(main, "_fetch_shared_weather", lambda *a: [])
+    monkeypatch.setattr(main, "_recent_sales_loader", lambda sid, ms: lambda dish: [1.0])
+
+    calls = []
+
+    def fake_predict(store, dish, **kwargs):
+        calls.append(dish)
+        if dish == "Satay":
+            d.cancelled = True  # e.g. the client went away after the second dish
+        return {"dish": dish, "predictions": []}
+
+    monkeypatch.setattr(main, "predict_dish", fake_predict)
+    d = Deadline(None)
+    payload = main._compute_store_payload(7, ms, main.StorePredictRequest(store_id=7), d)
+
+    assert calls == ["Laksa", "Satay"]
+    assert payload["status"] == "partial"
+    assert list(payload["predictions"]) == ["Laksa", "Satay"]
+    assert payload["skipped_dishes"] == ["Rojak", "Mee Goreng"]
+
+    payload = main._compute_store_payload(7, ms, main.StorePredictRequest(store_id=7), None)
+    assert payload["status"] == "ok" and "skipped_dishes" not in payload
@@ -0,0 +1,77 @@
+"""
+Direct multi-horizon training rows: the copy stacked for horizon h must
+only see sales known at its forecast origin, h days before the target.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+for _mod in ("holidays", "joblib", "optuna", "sqlalchemy", "sklearn"):
+    pytest.importorskip(_mod)
+
+from training_logic_v2 import (  # noqa: E402
+    PipelineConfig,
+    _add_lag_roll_features,
+    _direct_training_frame,
+    _direct_training_matrix,
+    _lag_feature_names,
+)
+
+N_DAYS = 90
+
+
+@pytest.fixture
+def config():
+    return PipelineConfig(forecast_mode="direct", direct_horizon=5)
+
+
+@pytest.fixture
+def frame(config):
+    # sales equal to the day index, so every lag value names the day it came from
+    df = pd.DataFrame({
+        "date": pd.date_range("2024-01-01", periods=N_DAYS, freq="D"),
+        "sales": np.arange(N_DAYS, dtype=float),
+    })
+    df = _add_lag_roll_features(df, config)
+    for col in config.hybrid_tree_features:
+        if col not in df:
+            df[col] = 0.0
+    df["resid"] = df["sales"] * 0.1
+    return df
+
+
+def test_lags_are_shifted_to_the_origin(config, frame):
+    stacked = _direct_training_frame(frame, config)
+    day = (stacked["date"] - frame["date"].min()).dt.days
+    h = stacked["horizon"]
+
+    assert sorted(h.unique()) == list(range(1, config.direct_horizon + 1))
+    for lag in config.lags:
+        # y_lag_k at horizon h is the sales k + h - 1 days before the target
+        assert (stacked[f"y_lag_{lag}"] == day - lag - (h - 1)).all()
+    for w in config.roll_windows:
+        # trailing mean over the w days up to and including the origin (day - h)
+        assert stacked[f"y_roll_mean_{w}"].to_numpy() == pytest.approx(((day - h) - (w - 1) / 2).to_numpy())
+
+
+def test_targets_and_non_lag_features_are_not_shifted(config, frame):
+    stacked = _direct_training_frame(frame, config)
+    day = (stacked["date"] - frame["date"].min()).dt.days
+    assert (stacked["sales"] == day).all()
+    assert stacked["resid"].to_numpy() == pytest.approx(0.1 * day.to_numpy())
+    assert set(_lag_feature_names(config)).isdisjoint({"sales", "resid", "prophet_yhat", "day_of_week"})
+
+
+def test_each_horizon_loses_only_its_shifted_warmup_rows(config, frame):
+    stacked = _direct_training_frame(frame, config)
+    warmup = max(max(config.lags), max(config.roll_windows))
+    counts = stacked.groupby("horizon").size()
+    for h, n in counts.items():
+        assert n == N_DAYS - warmup - (h - 1)
+
+
+def test_training_matrix_carries_the_horizon(config, frame):
+    X, y = _direct_training_matrix(frame, config)
+    assert list(X.columns) == config.hybrid_tree_features + ["horizon"]
+    assert len(X) == len(y) and not X.isna().any().any()
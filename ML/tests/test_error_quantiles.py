@@ -0,0 +1,79 @@
+"""
+CV error-quantile interval tables: with the default config (3 folds of 30
+test days) the per-weekday table must actually be populated, and
+interval_offsets must prefer its cell over the per-step row.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+for _mod in ("holidays", "joblib", "optuna", "sqlalchemy", "sklearn"):
+    pytest.importorskip(_mod)
+
+from app.inference import interval_offsets  # noqa: E402
+from training_logic_v2 import PipelineConfig, _error_quantile_table  # noqa: E402
+
+
+def _folds(config, seed=0):
+    """Default-shaped CV folds: consecutive test windows, errors growing with the step."""
+    rng = np.random.default_rng(seed)
+    folds, residuals = [], []
+    end = pd.Timestamp("2024-06-30")
+    for k in range(config.n_cv_folds, 0, -1):
+        start = end - pd.Timedelta(days=config.test_window_days * k)
+        dates = pd.date_range(start, periods=config.test_window_days, freq="D")
+        steps = np.arange(1, config.test_window_days + 1)
+        folds.append({"step_test": steps, "dow_test": dates.dayofweek.to_numpy()})
+        residuals.append(rng.normal(0.0, 1.0 + 0.1 * steps))
+    return folds, residuals
+
+
+def test_default_config_populates_weekday_cells():
+    config = PipelineConfig()
+    folds, residuals = _folds(config)
+    table = _error_quantile_table(folds, residuals, config)
+
+    assert table["levels"] == [0.1, 0.9]
+    assert len(table["by_step"]) == config.test_window_days
+    cells = [cell for row in table["by_dow_step"] for cell in row]
+    populated = [cell for cell in cells if cell is not None]
+    # Interior steps see each weekday 2-3 times per fold within +/- 7 steps
+    assert len(populated) > len(cells) // 2
+    for d in range(7):
+        assert table["by_dow_step"][d][14] is not None
+
+
+def test_weekday_cell_is_the_quantile_of_its_errors():
+    config = PipelineConfig()
+    folds, residuals = _folds(config, seed=1)
+    table = _error_quantile_table(folds, residuals, config)
+
+    steps = np.concatenate([f["step_test"] for f in folds])
+    dows = np.concatenate([f["dow_test"] for f in folds])
+    errors = np.concatenate(residuals)
+    d, s = 2, 15
+    mask = (dows == d) & (np.abs(steps - s) <= config.interval_dow_step_window)
+    assert mask.sum() >= config.min_interval_dow_samples
+    expected = [round(float(v), 4) for v in np.quantile(errors[mask], [0.1, 0.9])]
+    assert table["by_dow_step"][d][s - 1] == expected
+
+    lo, hi = interval_offsets({"error_quantiles": table}, step=s, dow=d)
+    assert (lo, hi) == (expected[0], expected[-1])
+
+
+def test_sparse_weekday_cell_falls_back_to_step_row():
+    config = PipelineConfig(min_interval_dow_samples=100)
+    folds, residuals = _folds(config)
+    table = _error_quantile_table(folds, residuals, config)
+
+    assert all(cell is None for row in table["by_dow_step"] for cell in row)
+    lo, hi = interval_offsets({"error_quantiles": table}, step=5, dow=0)
+    assert (lo, hi) == tuple(table["by_step"][4])
+
+
+def test_rejects_a_single_level():
+    config = PipelineConfig(interval_quantiles=[0.9])
+    folds, residuals = _folds(config)
+    with pytest.raises(ValueError):
+        _error_quantile_table(folds, residuals, config)
@@ -0,0 +1,96 @@
+"""
+Conditional requests: forecast ETags are decided from the inputs alone, so
+a matching If-None-Match gets a 304 without any model running, and any
+input change (sales, model version, start date, encoding) changes the tag.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import app.main as main  # noqa: E402
+from app.etag import make_etag, matches  # noqa: E402
+
+BODY = {
+    "dish": "Laksa", "recent_sales": [3.0, 4.0, 5.0], "horizon_days": 3, "start_date": "2024-04-01",
+    "latitude": 1.29, "longitude": 103.85, "country_code": "SG",
+    "weather_rows": [{"date": "2024-04-01", "temperature_2m_max": 31.0}],
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    def fake_predict(store, dish, recent_sales, horizon_days, **kwargs):
+        calls.append(dish)
+        return {"dish": dish, "model": "xgboost", "model_combo": "Prophet+XGBoost",
+                "horizon_days": horizon_days, "start_date": kwargs["start_date"],
+                "predictions": [{"date": kwargs["start_date"], "yhat": sum(recent_sales)}]}
+
+    ms = SimpleNamespace(registry={"Laksa": {}}, version="v1", list_dishes=lambda: ["Laksa"])
+    monkeypatch.setattr(main, "store", ms)
+    monkeypatch.setattr(main, "predict_dish", fake_predict)
+    c = TestClient(main.app)
+    c.calls, c.ms = calls, ms
+    return c
+
+
+def _request(if_none_match):
+    return Request({"type": "http", "headers": [(b"if-none-match", if_none_match.encode())]})
+
+
+def test_make_etag_is_stable_and_order_sensitive():
+    assert make_etag("a", {"x": 1, "y": 2}) == make_etag("a", {"y": 2, "x": 1})
+    assert make_etag("a", "b") != make_etag("b", "a")
+    assert make_etag("a").startswith('"') and make_etag("a").endswith('"')
+
+
+def test_if_none_match_uses_weak_comparison():
+    tag = make_etag("forecast")
+    assert matches(_request(tag), tag)
+    assert matches(_request(f'"other", W/{tag}'), tag)
+    assert matches(_request("*"), tag)
+    assert not matches(_request('"other"'), tag)
+
+
+def test_matching_etag_skips_the_model(client):
+    first = client.post("/predict", json=BODY)
+    assert first.status_code == 200 and client.calls == ["Laksa"]
+    tag = first.headers["etag"]
+
+    again = client.post("/predict", json=BODY, headers={"If-None-Match": tag})
+    assert again.status_code == 304 and again.headers["etag"] == tag and again.content == b""
+    assert client.calls == ["Laksa"]  # nothing ran for the 304
+
+
+@pytest.mark.parametrize("change", [
+    {"recent_sales": [3.0, 4.0, 6.0]},
+    {"start_date": "2024-04-02"},
+    {"weather_rows": [{"date": "2024-04-01", "temperature_2m_max": 25.0}]},
+    {"layout": "columnar"},
+])
+def test_changed_inputs_change_the_etag(client, change):
+    tag = client.post("/predict", json=BODY).headers["etag"]
+    changed = client.post("/predict", json={**BODY, **change}, headers={"If-None-Match": tag})
+    assert changed.status_code == 200 and changed.headers["etag"] != tag
+
+
+def test_new_model_version_changes_the_etag(client):
+    tag = client.post("/predict", json=BODY).headers["etag"]
+    client.ms.version = "v2"
+    retrained = client.post("/predict", json=BODY, headers={"If-None-Match": tag})
+    assert retrained.status_code == 200 and retrained.headers["etag"] != tag
+
+
+def test_dishes_listing_is_conditional(client):
+    tag = client.get("/dishes").headers["etag"]
+    assert client.get("/dishes", headers={"If-None-Match": tag}).status_code == 304
+    client.ms.version = "v2"
+    assert client.get("/dishes", headers={"If-None-Match": tag}).status_code == 200
@@ -0,0 +1,91 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.forecast_cache import ForecastCache
+
+
+def test_put_get_and_lru_eviction():
+    cache = ForecastCache(max_entries=2)
+    cache.put("a", {"status": "ok"})
+    cache.put("b", {"status": "ok"})
+    assert cache.get("a") is not None  # "a" is now most recent
+    cache.put("c", {"status": "ok"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert len(cache) == 2
+
+
+def test_age_uses_computed_at():
+    cache = ForecastCache()
+    cache.put("k", {"status": "ok"}, computed_at=time.time() - 100)
+    assert 99 <= cache.get("k").age() <= 102
+
+
+def test_invalidate_by_predicate():
+    cache = ForecastCache()
+    cache.put((1, "x"), {"status": "ok"})
+    cache.put((1, "y"), {"status": "ok"})
+    cache.put((2, "x"), {"status": "ok"})
+    assert cache.invalidate(lambda key: key[0] == 1) == 2
+    assert cache.get((2, "x")) is not None
+
+
+def test_policy_tightening_and_unknown_name():
+    cache = ForecastCache()
+    base = cache.policy("store_predict")
+    tight = cache.policy("store_predict", max_stale_seconds=60)
+    assert tight.max_stale == 60 and tight.soft_ttl <= 60 <= base.max_stale
+    with pytest.raises(ValueError):
+        cache.policy("dashbaord")
+
+
+def test_background_refresh_runs_once_per_key():
+    cache = ForecastCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return {"status": "ok", "v": 2}
+
+    assert cache.refresh_in_background("k", compute) is True
+    assert cache.refresh_in_background("k", compute) is False
+    release.set()
+    deadline = time.time() + 2
+    while cache.get("k") is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get("k").payload["v"] == 2
+    assert len(calls) == 1
+
+
+def test_failed_refresh_keeps_old_entry():
+    cache = ForecastCache()
+    cache.put("k", {"status": "ok", "v": 1})
+    done = threading.Event()
+
+    def compute():
+        done.set()
+        return {"status": "partial", "v": 2}
+
+    cache.refresh_in_background("k", compute)
+    done.wait(2)
+    time.sleep(0.05)
+    assert cache.get("k").payload["v"] == 1
+
+
+def test_store_forecast_key_changes_with_the_start_date(monkeypatch):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("fastapi")
+    import app.main as main
+
+    ms = SimpleNamespace(version="v1")
+    req = main.StorePredictRequest(store_id=3)
+    monkeypatch.setattr(main, "forecast_start_date", lambda _=None: pd.Timestamp("2024-05-02"))
+    today = main._forecast_cache_key(3, ms, req)
+    assert today == main._forecast_cache_key(3, ms, req)
+    monkeypatch.setattr(main, "forecast_start_date", lambda _=None: pd.Timestamp("2024-05-03"))
+    assert main._forecast_cache_key(3, ms, req) != today
@@ -0,0 +1,103 @@
+"""
+Sample-path quantiles: with no noise every path is the point forecast, the
+first day's spread is exactly the one-step residuals, and the spread grows
+over the horizon as noisy values feed back into the lags.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("joblib")
+pytest.importorskip("holidays")
+
+from app.inference import ModelStore, predict_dish  # noqa: E402
+from app.probabilistic import sample_dish_paths  # noqa: E402
+from pipeline_common import WEATHER_COLS  # noqa: E402
+from student_models import fit_student  # noqa: E402
+
+DISH = "Laksa"
+LAGS = ["y_lag_1", "y_lag_7", "y_lag_14", "y_roll_mean_7", "y_roll_std_7",
+        "y_roll_mean_14", "y_roll_std_14", "y_roll_mean_28", "y_roll_std_28"]
+LOCATION = {"latitude": 1.29, "longitude": 103.85, "country_code": "SG"}
+SALES = [float(30 + (i % 7)) for i in range(60)]
+HORIZON = 10
+
+
+def _student():
+    """A recursive student whose forecast leans on yesterday's sales."""
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({"date": pd.date_range("2023-01-01", periods=300, freq="D")})
+    for c in WEATHER_COLS:
+        frame[c] = rng.normal(20.0, 3.0, len(frame))
+    frame["is_public_holiday"] = 0.0
+    for c in LAGS:
+        frame[c] = rng.normal(30.0, 5.0, len(frame))
+    target = 10.0 + 0.7 * frame["y_lag_1"] + rng.normal(0, 0.5, len(frame))
+    return fit_student(frame, target.to_numpy(), ["is_public_holiday"] + WEATHER_COLS + LAGS, LAGS)
+
+
+def _store(tmp_path, **meta):
+    ms = ModelStore(model_dir=str(tmp_path))
+    ms.registry = {DISH: {"model": "xgboost", "mae": 2.0, "student": _student(), **meta}}
+    return ms
+
+
+def _rows():
+    start = pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+    return [{"date": d.strftime("%Y-%m-%d"), **{c: 20.0 for c in WEATHER_COLS}}
+            for d in pd.date_range(start, periods=HORIZON, freq="D")]
+
+
+def _sample(ms, **kwargs):
+    return sample_dish_paths(ms, DISH, SALES, HORIZON, weather_rows=_rows(), **{"seed": 1, **LOCATION, **kwargs})
+
+
+def _spread(row):
+    return row["quantiles"]["0.95"] - row["quantiles"]["0.05"]
+
+
+def test_without_noise_every_quantile_is_the_point_forecast(tmp_path):
+    ms = _store(tmp_path, cv_residuals_1step=[0.0])
+    out = _sample(ms, n_paths=20)
+    point = predict_dish(ms, DISH, SALES, HORIZON, weather_rows=_rows(), **LOCATION)
+    for row, expected in zip(out["predictions"], point["predictions"]):
+        assert row["mean"] == pytest.approx(expected["yhat"])
+        assert set(np.round(list(row["quantiles"].values()), 9)) == {round(row["mean"], 9)}
+
+
+def test_first_day_spread_is_the_one_step_residuals(tmp_path):
+    ms = _store(tmp_path, cv_residuals_1step=[-2.0, 2.0], cv_residuals=[-50.0, 50.0])
+    out = _sample(ms, n_paths=400, quantiles=(0.05, 0.5, 0.95))
+    day1 = out["predictions"][0]
+    point = predict_dish(ms, DISH, SALES, 1, weather_rows=_rows(), **LOCATION)["predictions"][0]["yhat"]
+
+    assert out["noise"] == "cv_residuals_1step"  # never the rolled-out errors
+    assert day1["quantiles"]["0.05"] == pytest.approx(point - 2.0)
+    assert day1["quantiles"]["0.95"] == pytest.approx(point + 2.0)
+    assert day1["mean"] == pytest.approx(point, abs=0.5)
+
+
+def test_uncertainty_compounds_over_the_horizon(tmp_path):
+    out = _sample(_store(tmp_path, cv_residuals_1step=[-2.0, -1.0, 0.0, 1.0, 2.0]), n_paths=2000)
+    spreads = [_spread(r) for r in out["predictions"]]
+    assert spreads[-1] > spreads[0]
+    for row in out["predictions"]:
+        values = list(row["quantiles"].values())
+        assert values == sorted(values) and values[0] >= 0.0
+
+
+def test_seeded_runs_are_reproducible(tmp_path):
+    ms = _store(tmp_path, cv_residuals_1step=[-3.0, 0.0, 3.0])
+    assert _sample(ms, n_paths=50) == _sample(ms, n_paths=50)
+    assert _sample(ms, n_paths=50) != _sample(ms, n_paths=50, seed=2)
+
+
+@pytest.mark.parametrize("meta, source", [
+    ({"cv_residuals": [-1.0, 1.0]}, "cv_residuals"),  # registries from before the one-step key
+    ({}, "laplace_mae"),
+])
+def test_noise_fallbacks(tmp_path, meta, source):
+    out = _sample(_store(tmp_path, **meta), n_paths=200)
+    assert out["noise"] == source
+    assert _spread(out["predictions"][0]) > 0
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from app.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, hedged_call
+
+
+def test_hedged_call_returns_result():
+    assert hedged_call(lambda: 42, timeout=1.0, hedge_after=0.5, max_attempts=2) == 42
+
+
+def test_slow_attempt_is_hedged_and_first_success_wins():
+    calls = []
+    lock = threading.Lock()
+    hedges = []
+
+    def fn():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        if first:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    result = hedged_call(fn, timeout=2.0, hedge_after=0.05, max_attempts=2, on_hedge=lambda: hedges.append(1))
+    assert result == "fast"
+    assert len(hedges) == 1
+
+
+def test_failed_attempt_is_retried_up_to_max_attempts():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        hedged_call(fn, timeout=1.0, hedge_after=0.5, max_attempts=3)
+    assert len(calls) == 3
+
+
+def test_hedged_call_times_out():
+    with pytest.raises(TimeoutError):
+        hedged_call(lambda: time.sleep(0.5), timeout=0.1, hedge_after=1.0, max_attempts=1)
+
+
+def _failing():
+    raise ConnectionError("down")
+
+
+def test_breaker_opens_after_threshold_and_short_circuits():
+    breaker = CircuitBreaker("test_open", timeout=1.0, failure_threshold=2, reset_timeout=60.0,
+                             hedge_after=1.0, max_attempts=1)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(_failing)
+    assert breaker.state == OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: calls.append(1))
+    assert calls == []
+
+
+def test_breaker_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker("test_probe", timeout=1.0, failure_threshold=1, reset_timeout=0.1,
+                             hedge_after=1.0, max_attempts=1)
+    with pytest.raises(ConnectionError):
+        breaker.call(_failing)
+    assert breaker.state == OPEN
+
+    time.sleep(0.15)
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(ConnectionError):
+        breaker.call(_failing)  # failed probe re-opens
+    assert breaker.state == OPEN
+
+    time.sleep(0.15)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("test_reset", timeout=1.0, failure_threshold=2, reset_timeout=60.0,
+                             hedge_after=1.0, max_attempts=1)
+    with pytest.raises(ConnectionError):
+        breaker.call(_failing)
+    breaker.call(lambda: None)
+    with pytest.raises(ConnectionError):
+        breaker.call(_failing)
+    assert breaker.state == CLOSED
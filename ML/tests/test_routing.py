@@ -0,0 +1,141 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.routing import Cluster, HashRing, StoreRoutingMiddleware, parse_nodes  # noqa: E402
+
+NODES = {"a": "http://127.0.0.1:8001", "b": "http://127.0.0.1:8002", "c": "http://127.0.0.1:8003"}
+
+
+def test_parse_nodes():
+    assert parse_nodes("a=http://h1:8000/, b=http://h2:8000,,http://h3:8000") == {
+        "a": "http://h1:8000",
+        "b": "http://h2:8000",
+        "http://h3:8000": "http://h3:8000",
+    }
+
+
+def test_owner_is_deterministic_and_order_independent():
+    ring = HashRing(NODES)
+    reordered = HashRing(dict(reversed(list(NODES.items()))))
+    assert all(ring.owner(s) == reordered.owner(s) for s in range(1, 500))
+
+
+def test_distribution_is_balanced():
+    counts = HashRing(NODES).distribution(list(range(1, 3001)))
+    assert sum(counts.values()) == 3000
+    assert all(600 <= n <= 1400 for n in counts.values())
+
+
+def test_adding_a_node_moves_only_its_share():
+    stores = range(1, 3001)
+    ring = HashRing(NODES)
+    grown = HashRing({**NODES, "d": "http://127.0.0.1:8004"})
+    moved = [s for s in stores if ring.owner(s) != grown.owner(s)]
+    assert all(grown.owner(s) == "d" for s in moved)  # stores only move to the new node
+    assert len(moved) < 0.4 * len(stores)
+
+
+def test_cluster_ownership():
+    ring = HashRing(NODES)
+    cluster = Cluster(ring, "a", "redirect")
+    assert all(cluster.owns(s) == (ring.owner(s) == "a") for s in range(1, 200))
+    assert Cluster(None, None, "redirect").owns(7)  # routing off: every store is local
+    with pytest.raises(ValueError):
+        Cluster(ring, "z", "redirect")
+    with pytest.raises(ValueError):
+        Cluster(ring, "a", "teleport")
+
+
+def test_redirect_mode_sends_foreign_stores_to_their_owner():
+    inner = FastAPI()
+
+    @inner.get("/store/{store_id}/status")
+    def status(store_id: int):
+        return {"store_id": store_id}
+
+    ring = HashRing(NODES)
+    client = TestClient(StoreRoutingMiddleware(inner, Cluster(ring, "a", "redirect")), follow_redirects=False)
+    local = next(s for s in range(1, 200) if ring.owner(s) == "a")
+    foreign = next(s for s in range(1, 200) if ring.owner(s) != "a")
+
+    r = client.get(f"/store/{local}/status")
+    assert r.status_code == 200 and r.headers["x-ml-node"] == "a"
+
+    r = client.get(f"/store/{foreign}/status")
+    assert r.status_code == 307
+    assert r.headers["location"].startswith(f"{NODES[ring.owner(foreign)]}/store/{foreign}/status?")
+    assert "_routed_from=a" in r.headers["location"]
+
+    # Already routed once: served where it lands, never bounced again
+    assert client.get(f"/store/{foreign}/status?_routed_from=b").status_code == 200
+
+
+def test_group_by_owner_keeps_request_order():
+    ring = HashRing(NODES)
+    groups = Cluster(ring, "a", "forward").group_by_owner(list(range(1, 60)))
+    assert sorted(s for sids in groups.values() for s in sids) == list(range(1, 60))
+    assert all(ring.owner(s) == owner for owner, sids in groups.items() for s in sids)
+    assert all(sids == sorted(sids) for sids in groups.values())
+    assert Cluster(None, None, "redirect").group_by_owner([3, 1]) == {None: [3, 1]}
+
+
+@pytest.fixture
+def bulk(monkeypatch):
+    """app.main on node "a" with node "c" down; records sub-requests and local work."""
+    main = pytest.importorskip("app.main")
+    cluster = Cluster(HashRing(NODES), "a", "forward")
+    calls = {"forwarded": [], "local": []}
+
+    def post_to_owner(owner, path, payload, timeout=300.0):
+        calls["forwarded"].append((owner, path, payload["store_ids"]))
+        if owner == "c":
+            return None
+        if path == "/materialize":
+            return {"status": "done", "stores": {str(s): "fresh" for s in payload["store_ids"]}}
+        return {"stores": {str(s): {"store_id": s, "status": "ok", "node": owner} for s in payload["store_ids"]}}
+
+    def local_results(req, store_ids):
+        calls["local"].extend(store_ids)
+        for sid in store_ids:
+            yield {"store_id": sid, "status": "ok", "node": "a"}
+
+    monkeypatch.setattr(cluster, "post_to_owner", post_to_owner)
+    monkeypatch.setattr(main, "CLUSTER", cluster)
+    monkeypatch.setattr(main, "_iter_local_store_results", local_results)
+    monkeypatch.setattr(main, "_materialize_store", lambda sid, force: calls["local"].append(sid) or "materialized")
+    return main, cluster, calls
+
+
+def test_bulk_predict_sends_each_node_its_stores(bulk):
+    main, cluster, calls = bulk
+    ids = list(range(1, 40))
+    results = {r["store_id"]: r for r in main._iter_bulk_store_results(main.BulkStorePredictRequest(store_ids=ids))}
+
+    assert sorted(results) == ids
+    groups = cluster.group_by_owner(ids)
+    assert sorted(calls["forwarded"]) == [("b", "/stores/predict", groups["b"]), ("c", "/stores/predict", groups["c"])]
+    assert all(results[s]["node"] == "b" for s in groups["b"])
+    # "a" serves its own stores and, since "c" is down, c's as well
+    assert sorted(calls["local"]) == sorted(groups["a"] + groups["c"])
+
+
+def test_routed_bulk_predict_is_served_where_it_lands(bulk):
+    main, _, calls = bulk
+    list(main._iter_bulk_store_results(main.BulkStorePredictRequest(store_ids=list(range(1, 40))), routed=True))
+    assert calls["forwarded"] == [] and sorted(calls["local"]) == list(range(1, 40))
+
+
+def test_materialize_forwards_explicit_store_ids(bulk):
+    main, cluster, calls = bulk
+    ids = list(range(1, 40))
+    summary = main.materialize_stores(ids)
+    groups = cluster.group_by_owner(ids)
+
+    assert summary["status"] == "done" and sorted(int(s) for s in summary["stores"]) == ids
+    assert all(summary["stores"][str(s)] == "fresh" for s in groups["b"])
+    assert sorted(calls["local"]) == sorted(groups["a"] + groups["c"])
+    assert ("b", "/materialize", groups["b"]) in calls["forwarded"]
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_load():
+    sf = SingleFlight()
+    calls = []
+    barrier = threading.Barrier(16)
+    results = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    def worker():
+        barrier.wait()
+        results.append(sf.do("key", loader))
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["value"] * 16
+
+
+def test_distinct_keys_load_independently():
+    sf = SingleFlight()
+    assert sf.do("a", lambda: 1) == 1
+    assert sf.do("b", lambda: 2) == 2
+
+
+def test_failure_is_remembered_for_ttl_then_retried():
+    sf = SingleFlight(failure_ttl=0.2)
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise OSError("corrupt artifact")
+
+    with pytest.raises(OSError):
+        sf.do("key", broken)
+    with pytest.raises(OSError):
+        sf.do("key", broken)
+    assert len(calls) == 1  # second call served the cached failure
+
+    time.sleep(0.25)
+    assert sf.do("key", lambda: "fixed") == "fixed"
+
+
+def test_forget_drops_cached_failure():
+    sf = SingleFlight(failure_ttl=60.0)
+    with pytest.raises(ValueError):
+        sf.do("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    sf.forget("key")
+    assert sf.do("key", lambda: "ok") == "ok"
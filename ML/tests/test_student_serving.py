@@ -0,0 +1,110 @@
+"""
+Dishes served by a distilled student must be served by it everywhere:
+/predict, the scenario baseline, backfill, sample paths and explanations
+all describe the same model. The store has no Prophet or tree artifact, so
+any fall-through to the hybrid path fails loudly.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("joblib")
+pytest.importorskip("holidays")
+
+from app.backfill import backfill_dish  # noqa: E402
+from app.explain import explain_dish  # noqa: E402
+from app.inference import ModelStore, predict_dish  # noqa: E402
+from app.probabilistic import sample_dish_paths  # noqa: E402
+from app.scenarios import BASELINE, forecast_store_scenarios  # noqa: E402
+from pipeline_common import WEATHER_COLS  # noqa: E402
+from student_models import fit_student  # noqa: E402
+
+DISH = "Laksa"
+LAGS = ["y_lag_1", "y_lag_7", "y_lag_14", "y_roll_mean_7", "y_roll_std_7",
+        "y_roll_mean_14", "y_roll_std_14", "y_roll_mean_28", "y_roll_std_28"]
+LOCATION = {"latitude": 1.29, "longitude": 103.85, "country_code": "SG"}
+
+
+def _weather(dates):
+    rng = np.random.default_rng(3)
+    return pd.DataFrame({"date": dates, **{c: rng.normal(20.0, 3.0, len(dates)) for c in WEATHER_COLS}})
+
+
+def _student():
+    rng = np.random.default_rng(0)
+    frame = _weather(pd.date_range("2023-01-01", periods=300, freq="D"))
+    frame["is_public_holiday"] = 0.0
+    for c in LAGS:
+        frame[c] = rng.normal(30.0, 5.0, len(frame))
+    target = 30.0 + 0.5 * frame["y_lag_7"] - 0.3 * frame[WEATHER_COLS[0]] + rng.normal(0, 1, len(frame))
+    return fit_student(frame, target.to_numpy(), ["is_public_holiday"] + WEATHER_COLS + LAGS, LAGS)
+
+
+@pytest.fixture
+def store(tmp_path):
+    ms = ModelStore(model_dir=str(tmp_path))
+    ms.registry = {DISH: {"model": "xgboost", "mae": 2.0, "student": _student(), "cv_residuals_1step": [-1.0, 1.0]}}
+    return ms
+
+
+def _rows(start, days):
+    weather = _weather(pd.date_range(start, periods=days, freq="D"))
+    return [{**r, "date": r["date"].strftime("%Y-%m-%d")} for r in weather.to_dict("records")]
+
+
+SALES = [float(30 + (i % 7)) for i in range(60)]
+
+
+def test_scenario_baseline_matches_predict(store):
+    start = pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+    rows = _rows(start, 7)
+    served = predict_dish(store, DISH, SALES, 7, weather_rows=rows, **LOCATION)
+    assert served["distilled"]
+
+    out = forecast_store_scenarios(
+        store, [DISH], lambda _: SALES, 7, [{"name": "rain", "offsets": {"precipitation_sum": 10}}],
+        weather_rows=rows, **LOCATION,
+    )
+    assert out["errors"] == {}
+    baseline = out["scenarios"][BASELINE][DISH]
+    assert baseline["distilled"] and baseline["model_combo"] == served["model_combo"]
+    assert [r["yhat"] for r in baseline["predictions"]] == pytest.approx(
+        [r["yhat"] for r in served["predictions"]]
+    )
+
+
+def test_backfill_matches_predict_from_the_origin(store):
+    origin = pd.Timestamp("2024-03-01")
+    sales_dates = pd.date_range(origin - pd.Timedelta(days=60), origin + pd.Timedelta(days=6), freq="D")
+    dish_sales = pd.DataFrame({"date": sales_dates, "sales": [float(30 + (i % 7)) for i in range(len(sales_dates))]})
+    weather = _weather(pd.date_range(origin, periods=7, freq="D"))
+
+    record = next(backfill_dish(
+        store, DISH, dish_sales, pd.DatetimeIndex([origin]), 7, weather, country_code="SG",
+    ))
+    assert record["distilled"]
+
+    history = dish_sales[dish_sales["date"] < origin]["sales"].tolist()
+    rows = [{**r, "date": r["date"].strftime("%Y-%m-%d")} for r in weather.to_dict("records")]
+    served = predict_dish(store, DISH, history, 7, start_date="2024-03-01", weather_rows=rows, **LOCATION)
+    assert [r["yhat"] for r in record["predictions"]] == pytest.approx(
+        [r["yhat"] for r in served["predictions"]]
+    )
+
+
+def test_sample_paths_use_the_student(store):
+    start = pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+    out = sample_dish_paths(store, DISH, SALES, 5, n_paths=50, seed=1, weather_rows=_rows(start, 5), **LOCATION)
+    assert out["distilled"] and out["noise"] == "cv_residuals_1step"
+    assert len(out["predictions"]) == 5
+
+
+def test_student_explanation_decomposes_the_forecast(store):
+    start = pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+    out = explain_dish(store, DISH, SALES, 7, weather_rows=_rows(start, 7), **LOCATION)
+    assert out["distilled"] and out["explains"] == "yhat"
+    for row in out["predictions"]:
+        total = out["base_value"] + sum(row["explanation"].values())
+        assert row["yhat"] == pytest.approx(max(total, 0.0), abs=1e-3)
+        assert set(row["explanation"]) <= {"Seasonality", "Holiday", "Weather", "Lags/Trend", "Other"}
@@ -0,0 +1,103 @@
+"""
+Training status without polling load: /store/{id}/status must not query the
+sales table on every poll while a store trains, and training callbacks only
+go to allowlisted http(s) hosts.
+"""
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+sqlalchemy = pytest.importorskip("sqlalchemy")
+pytest.importorskip("fastapi")
+
+import app.events as events  # noqa: E402
+import app.main as main  # noqa: E402
+from app.store_manager import StoreModelManager  # noqa: E402
+
+STORE = 7
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'sales.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE Recipes (Id TEXT, Name TEXT, StoreId INTEGER)")
+        conn.exec_driver_sql("CREATE TABLE SalesData (Date TEXT, RecipeId TEXT, StoreId INTEGER, Quantity INTEGER)")
+        conn.exec_driver_sql("INSERT INTO Recipes VALUES ('r1', 'Laksa', 7)")
+        for day in pd.date_range("2024-01-01", periods=40, freq="D"):
+            conn.exec_driver_sql(
+                "INSERT INTO SalesData VALUES (?, 'r1', 7, 5)", (day.strftime("%Y-%m-%d"),)
+            )
+
+    mgr = StoreModelManager(base_model_dir=str(tmp_path / "models"))
+    mgr._engine = engine
+    fetches = []
+    real_fetch = mgr.fetch_store_sales
+
+    def counting_fetch(store_id):
+        fetches.append(store_id)
+        return real_fetch(store_id)
+
+    monkeypatch.setattr(mgr, "fetch_store_sales", counting_fetch)
+    monkeypatch.setattr(main, "manager", mgr)
+    mgr.fetches = fetches
+    return mgr
+
+
+def test_status_polls_while_training_reuse_the_day_count(manager):
+    manager._training_in_progress[STORE] = True
+    first = main.store_status(STORE)
+    for _ in range(5):
+        assert main.store_status(STORE)["days_available"] == 40
+    assert first["is_training"] and first["days_available"] == 40
+    assert manager.fetches == [STORE]  # one read, then served from the cached count
+
+
+def test_status_rereads_after_the_ttl(manager):
+    manager._training_in_progress[STORE] = True
+    manager.sales_days_ttl = 0.0
+    main.store_status(STORE)
+    main.store_status(STORE)
+    assert manager.fetches == [STORE, STORE]
+
+
+def test_status_of_an_idle_store_reads_fresh_counts(manager):
+    main.store_status(STORE)
+    main.store_status(STORE)
+    assert manager.fetches == [STORE, STORE]
+
+
+@pytest.mark.parametrize("url", [
+    "http://backend.internal/hooks/training",
+    "https://BACKEND.internal:8443/hooks",
+])
+def test_allowed_callback_urls(monkeypatch, url):
+    monkeypatch.setattr(events, "CALLBACK_ALLOWED_HOSTS", {"backend.internal"})
+    events.check_callback_url(url)
+
+
+@pytest.mark.parametrize("url", [
+    "http://169.254.169.254/latest/meta-data",
+    "file:///etc/passwd",
+    "gopher://backend.internal/",
+    "backend.internal/hooks",
+])
+def test_rejected_callback_urls(monkeypatch, url):
+    monkeypatch.setattr(events, "CALLBACK_ALLOWED_HOSTS", {"backend.internal"})
+    with pytest.raises(ValueError):
+        events.check_callback_url(url)
+
+
+def test_callbacks_refused_without_an_allowlist(monkeypatch):
+    monkeypatch.setattr(events, "CALLBACK_ALLOWED_HOSTS", set())
+    with pytest.raises(ValueError):
+        events.check_callback_url("http://backend.internal/hooks")
+
+
+def test_train_endpoint_rejects_a_disallowed_callback(manager, monkeypatch):
+    monkeypatch.setattr(events, "CALLBACK_ALLOWED_HOSTS", {"backend.internal"})
+    req = main.StoreTrainRequest(callback_url="http://attacker.example/x")
+    with pytest.raises(main.HTTPException) as exc:
+        main.store_train(STORE, req)
+    assert exc.value.status_code == 400
+    assert manager.fetches == []
@@ -0,0 +1,93 @@
+"""
+write_forecasts replaces only the forecast rows of the recipes it writes:
+dishes that failed, were skipped or matched no recipe keep their rows, and
+so do other stores and dates outside the batch.
+"""
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from app.store_manager import StoreModelManager  # noqa: E402
+
+STORE = 7
+RECIPES = [("r-laksa", "Laksa", STORE), ("r-satay", "Satay", STORE), ("r-rojak", "Rojak", STORE),
+           ("r-other", "Laksa", 8)]
+
+
+def _batch(dishes, start="2024-04-01", days=7, yhat=5.4):
+    dates = pd.date_range(start, periods=days, freq="D").strftime("%Y-%m-%d")
+    return {d: {"dish": d, "predictions": [{"date": day, "yhat": yhat} for day in dates]} for d in dishes}
+
+
+@pytest.fixture
+def manager(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'forecasts.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE Recipes (Id TEXT, Name TEXT, StoreId INTEGER)")
+        conn.exec_driver_sql(
+            "CREATE TABLE ForecastData (Id CHAR(36) PRIMARY KEY, StoreId INTEGER, RecipeId CHAR(36), "
+            "ForecastDate DATETIME, PredictedQuantity INTEGER, CreatedAt DATETIME, UpdatedAt DATETIME)"
+        )
+        for recipe in RECIPES:
+            conn.exec_driver_sql("INSERT INTO Recipes VALUES (?, ?, ?)", recipe)
+    mgr = StoreModelManager(base_model_dir=str(tmp_path / "models"))
+    mgr._engine = engine
+    return mgr
+
+
+def _rows(manager):
+    return pd.read_sql(
+        "SELECT StoreId, RecipeId, ForecastDate, PredictedQuantity FROM ForecastData",
+        manager._engine, parse_dates=["ForecastDate"],
+    )
+
+
+def _quantities(manager, recipe_id):
+    rows = _rows(manager)
+    rows = rows[rows["RecipeId"] == recipe_id]
+    return dict(zip(rows["ForecastDate"].dt.strftime("%Y-%m-%d"), rows["PredictedQuantity"]))
+
+
+def test_rewrite_replaces_only_the_written_recipes(manager):
+    manager.write_forecasts(STORE, _batch(["Laksa", "Satay", "Rojak"], yhat=3.0))
+    manager.write_forecasts(8, _batch(["Laksa"], yhat=3.0))
+
+    # Satay failed and Rojak was skipped this time: both keep yesterday's rows
+    batch = {**_batch(["laksa"], yhat=5.6), "Satay": {"error": "model missing"}, "Unknown": _batch(["x"])["x"]}
+    summary = manager.write_forecasts(STORE, batch)
+
+    assert summary["rows_written"] == 7 and summary["rows_deleted"] == 7
+    assert summary["dishes_written"] == 1
+    assert summary["failed_dishes"] == ["Satay"] and summary["unmatched_dishes"] == ["Unknown"]
+    assert set(_quantities(manager, "r-laksa").values()) == {6}
+    assert set(_quantities(manager, "r-satay").values()) == {3}
+    assert set(_quantities(manager, "r-rojak").values()) == {3}
+    assert set(_quantities(manager, "r-other").values()) == {3}  # another store's Laksa
+    assert len(_rows(manager)) == 4 * 7
+
+
+def test_rewrite_keeps_dates_outside_the_batch(manager):
+    manager.write_forecasts(STORE, _batch(["Laksa"], start="2024-04-01", days=7, yhat=2.0))
+    summary = manager.write_forecasts(STORE, _batch(["Laksa"], start="2024-04-05", days=7, yhat=9.0))
+
+    assert summary["rows_deleted"] == 3  # the 5th, 6th and 7th
+    assert summary["date_from"] == "2024-04-05" and summary["date_to"] == "2024-04-11"
+    quantities = _quantities(manager, "r-laksa")
+    assert len(quantities) == 11
+    assert [quantities[d] for d in ("2024-04-01", "2024-04-04", "2024-04-05", "2024-04-11")] == [2, 2, 9, 9]
+
+
+def test_quantities_are_rounded_and_clipped(manager):
+    batch = {"Laksa": {"predictions": [{"date": "2024-04-01", "yhat": -1.2}, {"date": "2024-04-02", "yhat": 4.5001}]}}
+    manager.write_forecasts(STORE, batch)
+    assert _quantities(manager, "r-laksa") == {"2024-04-01": 0, "2024-04-02": 5}
+
+
+def test_nothing_to_write_touches_nothing(manager):
+    manager.write_forecasts(STORE, _batch(["Laksa"]))
+    summary = manager.write_forecasts(STORE, {"Laksa": {"error": "boom"}})
+    assert summary["rows_written"] == 0 and summary["rows_deleted"] == 0
+    assert summary["date_from"] is None
+    assert len(_rows(manager)) == 7
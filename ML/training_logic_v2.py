@@ -32,12 +32,23 @@ import holidays
 import joblib
 import logging
 import optuna
+import time
 import warnings
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Tuple
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from sqlalchemy import create_engine
 from sklearn.metrics import mean_absolute_error
-from geopy.geocoders import Nominatim
+
+# Shared with the inference service (kept free of heavy imports)
+from pipeline_common import (
+    FEATURE_GROUPS,
+    HOLIDAY_YEARS,
+    WEATHER_COLS,
+    get_location_details,
+    safe_filename,
+)
+from student_models import fit_student, lag_contribution, predict_student
 
 try:
     import openmeteo_requests
@@ -98,6 +109,33 @@ def _silence_logs() -> None:
 _silence_logs()
 
 
+# ---------------------------------------------------------------------------
+# Stage Timing Hook
+# ---------------------------------------------------------------------------
+# The inference service registers an observer to export per-stage training
+# timings; with no observer set (e.g. ProcessPoolExecutor workers) timing is a no-op.
+_stage_observer: Optional[Callable[[str, float], None]] = None
+
+
+def set_stage_observer(observer: Optional[Callable[[str, float], None]]) -> None:
+    """Register a callback receiving (stage_name, seconds) for training sub-stages."""
+    global _stage_observer
+    _stage_observer = observer
+
+
+@contextmanager
+def _timed_stage(stage: str):
+    observer = _stage_observer
+    if observer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observer(stage, time.perf_counter() - started)
+
+
 # ---------------------------------------------------------------------------
 # GPU Detection
 # ---------------------------------------------------------------------------
@@ -158,13 +196,39 @@ class PipelineConfig:
     min_train_days: int = 60
     min_ml_days: int = 90
     random_seed: int = 42
-    holiday_years: List[int] = field(default_factory=lambda: [2024, 2025, 2026])
+    holiday_years: List[int] = field(default_factory=lambda: list(HOLIDAY_YEARS))
     forecast_horizon: int = 14
     n_optuna_trials: int = 30
     max_workers: int = 4
     model_dir: str = "models"
     use_gpu: bool = True  # Auto-detect GPU; set False to force CPU
 
+    # "recursive": one-step residual model, fed its own predictions day by day.
+    # "direct": one residual model with the horizon as a feature and lags as
+    # known at the forecast origin, so a whole horizon is one batched predict.
+    forecast_mode: str = "recursive"
+    direct_horizon: int = 30  # longest horizon a direct model is trained for
+
+    # Optional distillation into a compact linear + Fourier student (student_models)
+    distill_student: bool = False
+    student_mae_tolerance: float = 0.05  # keep if held-out MAE <= champion's * (1 + tolerance)
+    student_augment_copies: int = 3      # jittered copies of the training rows
+    student_weather_jitter: float = 0.25  # noise, in weather-column standard deviations
+    student_lag_jitter: float = 0.1       # relative noise on lag / rolling features
+    student_ridge: float = 1.0
+    student_weekly_order: int = 3
+    student_yearly_order: int = 4
+
+    # Prediction intervals from CV error quantiles (stored in the registry)
+    interval_quantiles: List[float] = field(default_factory=lambda: [0.1, 0.9])
+    interval_step_window: int = 3      # pool errors of steps within +/- this many days
+    interval_by_dow: bool = True       # also build a per-day-of-week table
+    interval_dow_step_window: int = 7
+    min_interval_samples: int = 10     # fewer pooled errors -> fall back to a coarser table
+    # A +/- 7-step window holds each weekday only 2-3 times per fold (6-9 errors
+    # with 3 folds), so the per-weekday table needs its own, lower threshold
+    min_interval_dow_samples: int = 6
+
     # Fallback location for geocoding failures (9.2)
     default_fallback_address: str = "Shanghai, China"
     default_fallback_lat: float = 31.23
@@ -204,57 +268,19 @@ class PipelineConfig:
         "prophet_yhat",
     ])
 
-    # Feature groups for SHAP explanation
-    feature_groups: Dict[str, List[str]] = field(default_factory=lambda: {
-        "Seasonality": ["day_of_week", "month", "day", "dayofyear", "is_weekend"],
-        "Holiday": ["is_public_holiday"],
-        "Weather": ["temperature_2m_max", "temperature_2m_min",
-                    "relative_humidity_2m_mean", "precipitation_sum"],
-        "Lags/Trend": [
-            "y_lag_1", "y_lag_7", "y_lag_14",
-            "y_roll_mean_7", "y_roll_std_7",
-            "y_roll_mean_14", "y_roll_std_14",
-            "y_roll_mean_28", "y_roll_std_28",
-        ],
-        "ProphetTrend": ["prophet_yhat"],
-    })
+    # Feature groups for SHAP explanation (shared with the inference service)
+    feature_groups: Dict[str, List[str]] = field(
+        default_factory=lambda: {g: list(feats) for g, feats in FEATURE_GROUPS.items()}
+    )
 
 
 CFG = PipelineConfig()
 
-WEATHER_COLS = ['temperature_2m_max', 'temperature_2m_min',
-                'relative_humidity_2m_mean', 'precipitation_sum']
-
-
-def safe_filename(name):
-    """Sanitize dish name for use as a filename."""
-    return name.replace(' ', '_').replace('-', '_').replace('/', '_')
-
 
 # ---------------------------------------------------------------------------
 # Context Awareness (Location + Weather)
 # ---------------------------------------------------------------------------
-def get_location_details(address):
-    """
-    Convert an address or postal code to (latitude, longitude, country_code)
-    using the Nominatim geocoding service (OpenStreetMap).
-    """
-    try:
-        geolocator = Nominatim(user_agent="smartsus_chef_v3")
-        location = geolocator.geocode(address, addressdetails=True)
-        if location is None:
-            logger.warning("Could not geocode address: '%s'", address)
-            return None, None, None
-        lat = location.latitude
-        lon = location.longitude
-        country_code = location.raw.get('address', {}).get('country_code', '').upper()
-        logger.info("Geocoded '%s' -> Lat: %.4f, Lon: %.4f, Country: %s", address, lat, lon, country_code)
-        return lat, lon, country_code
-    except Exception as e:
-        logger.warning("Geocoding failed for '%s': %s", address, e)
-        return None, None, None
-
-
+# get_location_details lives in pipeline_common (re-exported above).
 def get_historical_weather(latitude, longitude, start_date, end_date):
     """
     Fetch historical daily weather data from the Open-Meteo Archive API.
@@ -554,6 +580,38 @@ def _prophet_predict(model: Any, df: pd.DataFrame) -> np.ndarray:
     return yhat["yhat"].astype(float).to_numpy()
 
 
+def residual_feature_names(config: PipelineConfig) -> List[str]:
+    """Tree-model input columns for the configured forecast mode."""
+    if config.forecast_mode == "direct":
+        return config.hybrid_tree_features + ["horizon"]
+    return list(config.hybrid_tree_features)
+
+
+def _lag_feature_names(config: PipelineConfig) -> List[str]:
+    return [c for c in config.hybrid_tree_features if c.startswith(("y_lag_", "y_roll_"))]
+
+
+def _direct_training_frame(frame: pd.DataFrame, config: PipelineConfig) -> pd.DataFrame:
+    """
+    Stack one copy of a daily residual frame per horizon h = 1..direct_horizon.
+    Lag features are shifted by h - 1 days so each row only sees sales known
+    at its forecast origin (h days before the target day).
+    """
+    lag_cols = _lag_feature_names(config)
+    parts = []
+    for h in range(1, config.direct_horizon + 1):
+        part = frame[["date", "sales"] + config.hybrid_tree_features + ["resid"]].copy()
+        part[lag_cols] = frame[lag_cols].shift(h - 1)
+        part["horizon"] = h
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True).dropna()
+
+
+def _direct_training_matrix(frame: pd.DataFrame, config: PipelineConfig) -> Tuple[pd.DataFrame, pd.Series]:
+    stacked = _direct_training_frame(frame, config)
+    return stacked[residual_feature_names(config)], stacked["resid"]
+
+
 def _build_residual_features(df: pd.DataFrame, prophet_yhat: np.ndarray) -> pd.DataFrame:
     """Add Prophet predictions and residuals to the dataframe."""
     out = df.copy()
@@ -598,6 +656,13 @@ def _prepare_cv_fold_cache(
 
     IMPORTANT: Sanitation (interpolation) is applied per-fold to prevent data leakage.
     This ensures that training data interpolation doesn't use future (test) information.
+
+    In direct mode the test rows use the lags known at the training cut-off
+    and their horizon step, i.e. a genuine multi-step forecast. In recursive
+    mode the test rows keep the lags of the actual sales (one-step-ahead,
+    used to score Optuna trials) and the fold keeps the training sales as
+    "history", from which _recursive_fold_forecast rolls the champion over
+    the test window on its own predictions, as inference does.
     """
     _silence_logs()
     feature_cols = config.hybrid_tree_features
@@ -612,33 +677,153 @@ def _prepare_cv_fold_cache(
         if len(train) < config.min_train_days or len(test) < 1:
             continue
 
-        pm = _fit_prophet(train, country_code, config)
+        with _timed_stage("train_fold_prophet"):
+            pm = _fit_prophet(train, country_code, config)
         p_train = _prophet_predict(pm, train)
         p_test = _prophet_predict(pm, test)
 
         train_r = _build_residual_features(train, p_train)
         test_r = _build_residual_features(test, p_test)
 
-        X_train = train_r[feature_cols].dropna()
-        X_test = test_r[feature_cols].dropna()
+        if config.forecast_mode == "direct":
+            X_train, y_train = _direct_training_matrix(train_r, config)
+            steps = (pd.to_datetime(test_r["date"]) - pd.to_datetime(train["date"]).max()).dt.days
+            origin_lags = compute_lag_features_from_history(train["sales"].astype(float).tolist(), config)
+            test_r = test_r.assign(horizon=steps.clip(upper=config.direct_horizon), **origin_lags)
+            X_test = test_r[residual_feature_names(config)].dropna()
+            history = None
+        else:
+            X_train = train_r[feature_cols].dropna()
+            y_train = train_r.loc[X_train.index, "resid"]
+            lag_cols = _lag_feature_names(config)
+            exog_cols = [c for c in feature_cols if c not in lag_cols]
+            X_test = test_r[feature_cols].dropna(subset=exog_cols)
+            history = train["sales"].astype(float).tolist()
         if X_train.empty or X_test.empty:
             continue
 
+        test_dates = pd.to_datetime(test_r.loc[X_test.index, "date"])
         fold_cache.append({
             "X_train": X_train,
-            "y_train": train_r.loc[X_train.index, "resid"],
+            "y_train": y_train,
             "X_test": X_test,
             "y_test": test_r.loc[X_test.index, "resid"],
             "prophet_test": test_r.loc[X_test.index, "prophet_yhat"].to_numpy(),
             "sales_test": test_r.loc[X_test.index, "sales"].to_numpy(),
+            # Horizon step (1 = first day after the training cut-off) and weekday per test row
+            "step_test": (test_dates - pd.to_datetime(train["date"]).max()).dt.days.to_numpy(),
+            "dow_test": test_dates.dt.dayofweek.to_numpy(),
+            "history": history,  # recursive mode: sales before the cut-off
+            # Kept for the last fold only (student distillation gate)
+            "prophet": pm,
+            "train_r": train_r,
+            "test_r": test_r,
         })
 
+    for fold in fold_cache[:-1]:
+        for key in ("prophet", "train_r", "test_r"):
+            fold.pop(key)
     return fold_cache
 
 
 # ---------------------------------------------------------------------------
 # Hybrid Model Evaluation and Optimization
 # ---------------------------------------------------------------------------
+def _fit_residual_model(
+    model_type: str,
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    params: Dict[str, Any],
+    config: PipelineConfig,
+) -> Any:
+    """Fit one tree model of the given type on Prophet residuals."""
+    tree_n_jobs = 1 if config.max_workers > 1 else -1
+    gpu = get_gpu_flags() if config.use_gpu else {}
+
+    if model_type == "xgboost":
+        if XGBRegressor is None:
+            raise ImportError("XGBoost is required but not installed.")
+        xgb_extra = {"tree_method": "hist", "device": "cuda"} if gpu.get("xgboost") else {}
+        model = XGBRegressor(
+            n_estimators=100,
+            random_state=config.random_seed,
+            n_jobs=tree_n_jobs,
+            **xgb_extra,
+            **params,
+        )
+        model.fit(X_train, y_train, verbose=False)
+    elif model_type == "catboost":
+        if CatBoostRegressor is None:
+            raise ImportError("CatBoost is required but not installed.")
+        cb_extra = {"task_type": "GPU"} if gpu.get("catboost") else {}
+        model = CatBoostRegressor(
+            iterations=100,
+            random_seed=config.random_seed,
+            verbose=False,
+            **cb_extra,
+            **params,
+        )
+        model.fit(X_train, y_train, verbose=False)
+    elif model_type == "lightgbm":
+        if lgb is None:
+            raise ImportError("LightGBM is required but not installed.")
+        lgb_extra = {"device": "gpu"} if gpu.get("lightgbm") else {}
+        model = lgb.LGBMRegressor(
+            n_estimators=100,
+            random_state=config.random_seed,
+            n_jobs=tree_n_jobs,
+            verbose=-1,
+            **lgb_extra,
+            **params,
+        )
+        model.fit(X_train, y_train)
+    else:
+        raise ValueError(f"Unknown model type: {model_type}")
+    return model
+
+
+def _cv_hybrid_forecasts(
+    model_type: str,
+    fold_cache: List[Dict[str, Any]],
+    trial_params: Dict[str, Any],
+    config: PipelineConfig,
+) -> List[np.ndarray]:
+    """
+    Hybrid (Prophet + tree residual) forecasts for each fold's test days,
+    one batched predict per fold. Recursive folds use the actual lags
+    (one-step-ahead forecasts); direct folds are genuine multi-step forecasts.
+    """
+    forecasts = []
+    for fold in fold_cache:
+        model = _fit_residual_model(model_type, fold["X_train"], fold["y_train"], trial_params, config)
+        forecasts.append(_one_step_fold_forecast(model, fold))
+    return forecasts
+
+
+def _one_step_fold_forecast(model: Any, fold: Dict[str, Any]) -> np.ndarray:
+    return np.maximum(fold["prophet_test"] + model.predict(fold["X_test"]), 0.0)
+
+
+def _recursive_fold_forecast(model: Any, fold: Dict[str, Any], config: PipelineConfig) -> np.ndarray:
+    """
+    Roll a one-step residual model over a fold's test window, recomputing
+    the lag / rolling features from its own predictions day by day (as
+    inference does), so each error belongs to its horizon step.
+    """
+    X = fold["X_test"].copy()
+    lag_cols = _lag_feature_names(config)
+    lag_idx = [X.columns.get_loc(c) for c in lag_cols]
+    history = list(fold["history"])
+    yhat = np.empty(len(X))
+    for i in range(len(X)):
+        lags = compute_lag_features_from_history(history, config)
+        X.iloc[i, lag_idx] = [lags[c] for c in lag_cols]
+        resid = float(model.predict(X.iloc[[i]])[0])
+        yhat[i] = max(fold["prophet_test"][i] + resid, 0.0)
+        history.append(yhat[i])
+    return yhat
+
+
 def _eval_hybrid_mae(
     model_type: str,
     fold_cache: List[Dict[str, Any]],
@@ -648,64 +833,96 @@ def _eval_hybrid_mae(
     """
     Given a model type and parameters, run CV and return average MAE.
     """
-    fold_maes = []
-    tree_n_jobs = 1 if config.max_workers > 1 else -1
-    gpu = get_gpu_flags() if config.use_gpu else {}
+    forecasts = _cv_hybrid_forecasts(model_type, fold_cache, trial_params, config)
+    fold_maes = [
+        mean_absolute_error(fold["sales_test"], yhat)
+        for fold, yhat in zip(fold_cache, forecasts)
+    ]
+    if not fold_maes:
+        return float("inf")
+    return float(np.mean(fold_maes))
 
-    for fold in fold_cache:
-        X_train = fold["X_train"]
-        y_train = fold["y_train"]
-        X_test = fold["X_test"]
-        prophet_test = fold["prophet_test"]
-        sales_test = fold["sales_test"]
 
-        if model_type == "xgboost":
-            if XGBRegressor is None:
-                raise ImportError("XGBoost is required but not installed.")
-            xgb_extra = {"tree_method": "hist", "device": "cuda"} if gpu.get("xgboost") else {}
-            model = XGBRegressor(
-                n_estimators=100,
-                random_state=config.random_seed,
-                n_jobs=tree_n_jobs,
-                **xgb_extra,
-                **trial_params,
-            )
-            model.fit(X_train, y_train, verbose=False)
-        elif model_type == "catboost":
-            if CatBoostRegressor is None:
-                raise ImportError("CatBoost is required but not installed.")
-            cb_extra = {"task_type": "GPU"} if gpu.get("catboost") else {}
-            model = CatBoostRegressor(
-                iterations=100,
-                random_seed=config.random_seed,
-                verbose=False,
-                **cb_extra,
-                **trial_params,
-            )
-            model.fit(X_train, y_train, verbose=False)
-        elif model_type == "lightgbm":
-            if lgb is None:
-                raise ImportError("LightGBM is required but not installed.")
-            lgb_extra = {"device": "gpu"} if gpu.get("lightgbm") else {}
-            model = lgb.LGBMRegressor(
-                n_estimators=100,
-                random_state=config.random_seed,
-                n_jobs=tree_n_jobs,
-                verbose=-1,
-                **lgb_extra,
-                **trial_params,
-            )
-            model.fit(X_train, y_train)
+def _cv_residuals(
+    model_type: str,
+    fold_cache: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    config: PipelineConfig,
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """
+    Out-of-sample errors (actual - hybrid forecast) of a model per CV fold,
+    in test-day order, as (one_step, rollout).
+
+    one_step errors come from the batched one-step forecasts and are the
+    per-step noise for sample paths, which compound it themselves.
+    rollout errors come from rolling the model over the whole test window
+    on its own predictions, so they grow with the horizon step; they feed
+    the interval tables and the student gate. Direct folds have no
+    rollout, so both lists are the direct errors.
+    """
+    one_step: List[np.ndarray] = []
+    rollout: List[np.ndarray] = []
+    for fold in fold_cache:
+        model = _fit_residual_model(model_type, fold["X_train"], fold["y_train"], params, config)
+        one_step.append(fold["sales_test"] - _one_step_fold_forecast(model, fold))
+        if fold.get("history") is None:
+            rollout.append(one_step[-1])
         else:
-            raise ValueError(f"Unknown model type: {model_type}")
+            rollout.append(fold["sales_test"] - _recursive_fold_forecast(model, fold, config))
+    return one_step, rollout
 
-        resid_pred = model.predict(X_test)
-        yhat = np.maximum(prophet_test + resid_pred, 0.0)
-        fold_maes.append(mean_absolute_error(sales_test, yhat))
 
-    if not fold_maes:
-        return float("inf")
-    return float(np.mean(fold_maes))
+def _error_quantile_table(
+    fold_cache: List[Dict[str, Any]],
+    fold_residuals: List[np.ndarray],
+    config: PipelineConfig,
+) -> Dict[str, Any]:
+    """
+    Empirical quantiles of CV errors (actual - forecast) per horizon step,
+    and optionally per (day of week, step), for constant-time intervals:
+    lower = yhat + q_lo, upper = yhat + q_hi.
+
+    Each fold contributes one error per step, so errors of neighbouring
+    steps are pooled; by_step cells with fewer than min_interval_samples
+    errors fall back to all errors, by_dow_step cells with fewer than
+    min_interval_dow_samples are left empty (interval_offsets then uses
+    by_step).
+    """
+    steps = np.concatenate([f["step_test"] for f in fold_cache])
+    dows = np.concatenate([f["dow_test"] for f in fold_cache])
+    errors = np.concatenate(fold_residuals)
+    levels = sorted(config.interval_quantiles)
+    if len(levels) < 2:
+        raise ValueError("interval_quantiles needs at least a lower and an upper level")
+
+    def quantiles(mask: np.ndarray, min_samples: int) -> Optional[List[float]]:
+        if mask.sum() < min_samples:
+            return None
+        return [round(float(v), 4) for v in np.quantile(errors[mask], levels)]
+
+    overall = quantiles(np.ones_like(errors, dtype=bool), config.min_interval_samples) or [
+        round(float(v), 4) for v in np.quantile(errors, levels)
+    ]
+    max_step = int(steps.max())
+    by_step = [
+        quantiles(np.abs(steps - s) <= config.interval_step_window, config.min_interval_samples) or overall
+        for s in range(1, max_step + 1)
+    ]
+
+    by_dow_step = None
+    if config.interval_by_dow:
+        by_dow_step = [
+            [
+                quantiles(
+                    (dows == d) & (np.abs(steps - s) <= config.interval_dow_step_window),
+                    config.min_interval_dow_samples,
+                )
+                for s in range(1, max_step + 1)
+            ]
+            for d in range(7)
+        ]
+
+    return {"levels": levels, "by_step": by_step, "by_dow_step": by_dow_step}
 
 
 def _optimize_hybrid(
@@ -741,7 +958,8 @@ def _optimize_hybrid(
         else:
             raise ValueError(f"Unknown model type: {model_type}")
 
-        return _eval_hybrid_mae(model_type, fold_cache, params, config)
+        with _timed_stage("train_optuna_trial"):
+            return _eval_hybrid_mae(model_type, fold_cache, params, config)
 
     study = optuna.create_study(
         direction="minimize",
@@ -751,6 +969,121 @@ def _optimize_hybrid(
     return float(study.best_value), study.best_params
 
 
+# ---------------------------------------------------------------------------
+# Distillation into a compact student
+# ---------------------------------------------------------------------------
+def _fit_distilled_student(
+    prophet_model: Any,
+    tree_model: Any,
+    train_r: pd.DataFrame,
+    config: PipelineConfig,
+) -> Optional[Dict[str, Any]]:
+    """
+    Fit a student_models student to the hybrid's predictions on the training
+    rows plus student_augment_copies jittered copies (weather and lags
+    perturbed, teacher re-evaluated), so it learns the teacher's response
+    rather than just its fitted path. None when there are no training rows.
+    """
+    if config.forecast_mode == "direct":
+        rows = _direct_training_frame(train_r, config)
+    else:
+        rows = train_r[["date", "sales"] + config.hybrid_tree_features].dropna()
+    if rows.empty:
+        return None
+
+    features = residual_feature_names(config)
+    lag_cols = _lag_feature_names(config)
+    inputs = ["is_public_holiday"] + WEATHER_COLS + lag_cols + (
+        ["horizon"] if config.forecast_mode == "direct" else []
+    )
+
+    def teacher(frame: pd.DataFrame) -> np.ndarray:
+        prophet_yhat = _prophet_predict(prophet_model, frame[["date"] + WEATHER_COLS])
+        X = frame[features].assign(prophet_yhat=prophet_yhat)
+        return np.maximum(prophet_yhat + tree_model.predict(X), 0.0)
+
+    rng = np.random.default_rng(config.random_seed)
+    copies = [rows]
+    weather_std = rows[WEATHER_COLS].std().fillna(0.0)
+    for _ in range(config.student_augment_copies):
+        aug = rows.copy()
+        for col in WEATHER_COLS:
+            aug[col] = aug[col] + rng.normal(0.0, config.student_weather_jitter * weather_std[col], len(aug))
+        jitter = 1.0 + rng.normal(0.0, config.student_lag_jitter, (len(aug), len(lag_cols)))
+        aug[lag_cols] = np.maximum(aug[lag_cols].to_numpy() * jitter, 0.0)
+        copies.append(aug)
+    distill = pd.concat(copies, ignore_index=True)
+
+    return fit_student(
+        distill, teacher(distill), inputs, lag_cols,
+        weekly_order=config.student_weekly_order,
+        yearly_order=config.student_yearly_order,
+        ridge=config.student_ridge,
+    )
+
+
+def _student_fold_forecast(student: Dict[str, Any], fold: Dict[str, Any], config: PipelineConfig) -> np.ndarray:
+    """
+    The student's forecast for a CV fold's test rows, served the way
+    inference serves it: recursively on its own predictions, or (direct
+    mode) from the origin's lags and the horizon step.
+    """
+    frame = fold["test_r"].loc[fold["X_test"].index]
+    base, lag_part = predict_student(student, frame)
+    if fold.get("history") is None:
+        return np.maximum(base + lag_part, 0.0)
+
+    history = list(fold["history"])
+    yhat = np.empty(len(frame))
+    for i in range(len(frame)):
+        lags = compute_lag_features_from_history(history, config)
+        yhat[i] = max(base[i] + lag_contribution(student, lags), 0.0)
+        history.append(yhat[i])
+    return yhat
+
+
+def distill_student(
+    prophet_model: Any,
+    tree_model: Any,
+    train_r: pd.DataFrame,
+    holdout_fold: Dict[str, Any],
+    holdout_tree_model: Any,
+    champion_fold_mae: float,
+    config: PipelineConfig,
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Distill the production hybrid into a student, gated on held-out data.
+
+    The gate distills a probe student from the hybrid fitted on the last CV
+    fold's training window (holdout_fold's Prophet model and
+    holdout_tree_model) and scores it on that fold's test window, rolled
+    out the way it is served. The student is kept only if that MAE is
+    within student_mae_tolerance of the champion's MAE on the same fold
+    (champion_fold_mae, also a recursive rollout). The kept student is then
+    distilled from the full-data hybrid.
+    Returns (student or None, evaluation stats).
+    """
+    probe = _fit_distilled_student(
+        holdout_fold["prophet"], holdout_tree_model, holdout_fold["train_r"], config
+    )
+    if probe is None:
+        return None, {"kept": False, "reason": "no training rows"}
+
+    student_mae = float(mean_absolute_error(
+        holdout_fold["sales_test"], _student_fold_forecast(probe, holdout_fold, config)
+    ))
+    kept = student_mae <= champion_fold_mae * (1.0 + config.student_mae_tolerance)
+    stats = {
+        "kept": kept,
+        "student_mae": round(student_mae, 4),
+        "teacher_mae": round(champion_fold_mae, 4),
+    }
+    if not kept:
+        return None, stats
+    student = _fit_distilled_student(prophet_model, tree_model, train_r, config)
+    return student, {**stats, "kept": student is not None}
+
+
 # ---------------------------------------------------------------------------
 # Model Persistence
 # ---------------------------------------------------------------------------
@@ -832,55 +1165,46 @@ def process_dish(dish_name: str, shared_df: pd.DataFrame, country_code: str, con
     # Select champion (lowest MAE)
     champion = min(mae_map, key=mae_map.get)
 
+    # Out-of-sample errors of the tuned champion: one-step (sample-path noise)
+    # and rolled out over the test window (intervals, student gate)
+    one_step_residuals, fold_residuals = _cv_residuals(champion, fold_cache, params_map[champion], config)
+
     # Retrain on full data (sanitize the full dataset for production model)
     dish_feat_sanitized = sanitize_sparse_data(dish_feat.copy(), country_code)
 
     # 1. Fit Prophet on full sanitized data
+    final_fit_started = time.perf_counter()
     pm = _fit_prophet(dish_feat_sanitized, country_code, config)
     p_full = _prophet_predict(pm, dish_feat_sanitized)
     train_r = _build_residual_features(dish_feat_sanitized, p_full)
 
-    X_full = train_r[config.hybrid_tree_features].dropna()
-    y_full = train_r.loc[X_full.index, "resid"]
+    if config.forecast_mode == "direct":
+        X_full, y_full = _direct_training_matrix(train_r, config)
+    else:
+        X_full = train_r[config.hybrid_tree_features].dropna()
+        y_full = train_r.loc[X_full.index, "resid"]
 
     if len(X_full) == 0:
         raise RuntimeError(f"{dish_name}: No valid training data after feature/residual processing.")
 
     # 2. Train champion tree model on residuals
-    tree_n_jobs = 1 if config.max_workers > 1 else -1
-    gpu = get_gpu_flags() if config.use_gpu else {}
-
-    if champion == "xgboost":
-        xgb_extra = {"tree_method": "hist", "device": "cuda"} if gpu.get("xgboost") else {}
-        model = XGBRegressor(
-            n_estimators=100,
-            random_state=config.random_seed,
-            n_jobs=tree_n_jobs,
-            **xgb_extra,
-            **params_map[champion],
-        )
-        model.fit(X_full, y_full, verbose=False)
-    elif champion == "catboost":
-        cb_extra = {"task_type": "GPU"} if gpu.get("catboost") else {}
-        model = CatBoostRegressor(
-            iterations=100,
-            random_seed=config.random_seed,
-            verbose=False,
-            **cb_extra,
-            **params_map[champion],
-        )
-        model.fit(X_full, y_full, verbose=False)
-    else:  # lightgbm
-        lgb_extra = {"device": "gpu"} if gpu.get("lightgbm") else {}
-        model = lgb.LGBMRegressor(
-            n_estimators=100,
-            random_state=config.random_seed,
-            n_jobs=tree_n_jobs,
-            verbose=-1,
-            **lgb_extra,
-            **params_map[champion],
-        )
-        model.fit(X_full, y_full)
+    model = _fit_residual_model(champion, X_full, y_full, params_map[champion], config)
+
+    if _stage_observer is not None:
+        _stage_observer("train_final_fit", time.perf_counter() - final_fit_started)
+
+    # 3. Optionally distill a compact student that serving can use instead
+    student, student_eval = None, None
+    if config.distill_student:
+        with _timed_stage("train_distill"):
+            holdout = fold_cache[-1]
+            holdout_model = _fit_residual_model(
+                champion, holdout["X_train"], holdout["y_train"], params_map[champion], config
+            )
+            student, student_eval = distill_student(
+                pm, model, train_r, holdout, holdout_model,
+                float(np.mean(np.abs(fold_residuals[-1]))), config,
+            )
 
     # Save both models
     _save_hybrid_models(dish_name, pm, model, champion, config)
@@ -896,6 +1220,15 @@ def process_dish(dish_name: str, shared_df: pd.DataFrame, country_code: str, con
         'best_params': params_map,
         'champion_mae': mae_map[champion],
         'model_type': 'hybrid',  # Indicates Prophet + Tree stacking
+        'forecast_mode': config.forecast_mode,
+        'direct_horizon': config.direct_horizon if config.forecast_mode == "direct" else None,
+        'cv_residuals': [round(float(e), 4) for errs in fold_residuals for e in errs],
+        'cv_residuals_1step': [round(float(e), 4) for errs in one_step_residuals for e in errs],
+        'error_quantiles': _error_quantile_table(fold_cache, fold_residuals, config),
+        'student': student,
+        'student_eval': student_eval,
+        # Last day of sales the production models were fitted on
+        'train_end': pd.to_datetime(dish_feat_sanitized['date']).max().strftime('%Y-%m-%d'),
     }
 
 
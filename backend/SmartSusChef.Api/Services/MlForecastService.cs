@@ -66,6 +66,13 @@ public class MlForecastService : IForecastService
                     _logger.LogInformation("Store {StoreId}: ML models are being trained. Returning cached or mock data.", storeId);
                     break;
 
+                case "provisional":
+                    // Cold-start numbers while models are unavailable; not saved as forecasts
+                    _logger.LogInformation(
+                        "Store {StoreId}: ML returned a provisional forecast ({Message}). Returning cached data.",
+                        storeId, mlResponse.Message);
+                    break;
+
                 case "insufficient_data":
                     _logger.LogInformation(
                         "Store {StoreId}: Insufficient data ({Days} days). Need 100+ days.",